@@ -0,0 +1,110 @@
+"""Frames per second and time between rounds of the broadcast sinks.
+
+Both sinks drive a stand-in send_wifi.py that puts a round's frames
+"on air" by sleeping --frame-time per frame, and logs when the first
+and last frame of each round went out. Its radio library takes
+--import-time seconds to import, as scapy does on a Pi. SubprocessSink
+starts a new interpreter and imports it again for every round;
+WorkerSink keeps one worker with it loaded.
+
+    python bench/broadcast_rounds.py --rounds 20 --import-time 1.5
+"""
+import argparse
+import asyncio
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import broadcaster  # noqa: E402
+
+DATA_PACKETS = 12
+RADIO = '''
+import time
+time.sleep({import_time})
+'''
+SEND_WIFI = '''
+import math
+import os
+import sys
+import time
+
+# Installed next to the script rather than in site-packages
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import slow_radio
+
+loss = float(sys.argv[2])
+frames = int(math.ceil({data_packets} / (1 - loss)))
+first = time.time()
+for _ in range(frames):
+    time.sleep({frame_time})
+with open({log!r}, 'a') as f:
+    f.write('{{}} {{}} {{}}\\n'.format(first, time.time(), frames))
+'''
+
+
+def write_stand_in(folder, args, log):
+    with open(os.path.join(folder, 'slow_radio.py'), 'w') as f:
+        f.write(RADIO.format(import_time=args.import_time))
+    script = os.path.join(folder, 'send_wifi.py')
+    with open(script, 'w') as f:
+        f.write(SEND_WIFI.format(data_packets=DATA_PACKETS,
+                                 frame_time=args.frame_time, log=log))
+    return script
+
+
+async def broadcast(sink, args):
+    start = time.time()
+    for index in range(args.rounds):
+        await sink.send('EHIE-Lab', 'secret123', index % 2, args.loss)
+    await sink.close()
+    return start
+
+
+def report(name, start, log):
+    with open(log) as f:
+        rounds = [tuple(float(value) for value in line.split())
+                  for line in f]
+    frames = sum(count for _, _, count in rounds)
+    gaps = [first - last
+            for (_, last, _), (first, _, _) in zip(rounds, rounds[1:])]
+    print('{:10} {:6.1f} frames/s  between rounds: median {:7.1f} ms  '
+          'max {:7.1f} ms  first frame after {:6.2f}s'.format(
+              name, frames / (rounds[-1][1] - start),
+              statistics.median(gaps) * 1000, max(gaps) * 1000,
+              rounds[0][0] - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--loss', type=float, default=.2,
+                        help="possible loss sent with every round")
+    parser.add_argument('--frame-time', type=float, default=.005,
+                        help="seconds each frame takes on air")
+    parser.add_argument('--import-time', type=float, default=.5,
+                        help="seconds send_wifi.py takes to import its "
+                             "radio library")
+    args = parser.parse_args()
+    if args.rounds < 2:
+        parser.error('--rounds must be at least 2')
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as folder:
+        for name, sink_class in [('subprocess', broadcaster.SubprocessSink),
+                                 ('worker', broadcaster.WorkerSink)]:
+            log = os.path.join(folder, name + '.log')
+            script = write_stand_in(folder, args, log)
+            sink = sink_class(script, python=sys.executable)
+            start = loop.run_until_complete(broadcast(sink, args))
+            report(name, start, log)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Connect latency of the ifupdown and wpa_supplicant backends.
+
+By default both backends run against stand-ins that take the same time to
+associate and to get a lease: a fake wpa_supplicant control socket, and
+ifdown/ifup scripts that sleep. What differs is each backend's own cost,
+tearing the interface down and spawning processes against control socket
+round trips.
+
+    python bench/connect_latency.py --repeat 20 --associate-time .5
+
+With --stale-dhcp no lease follows the switch, as with dhclient started by
+ifupdown, and wpa_supplicant falls back to ifupdown after
+ADDRESS_WAIT_TIME.
+
+With --interface, the real backends reconnect that interface using its
+configuration in /etc/network/interfaces. This needs root and a running
+wpa_supplicant with a control socket.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import backends  # noqa: E402
+import interfaces  # noqa: E402
+import linkstate  # noqa: E402
+
+from netlink import address_message  # noqa: E402
+from wpa_server import FakeWpaSupplicant  # noqa: E402
+
+INTERFACE = 'wlan0'
+CONFIG = '''iface wlan0 inet dhcp
+    wpa-ssid "EHIE-Lab"
+    wpa-psk "secret123"
+'''
+SCRIPT = '''#!{python}
+import sys, time
+time.sleep({delay})
+{output}
+'''
+
+
+def write_script(folder, name, delay, output=''):
+    filename = os.path.join(folder, name)
+    with open(filename, 'w') as f:
+        f.write(SCRIPT.format(python=sys.executable, delay=delay,
+                              output=output))
+    os.chmod(filename, 0o755)
+    return filename
+
+
+def fake_setup(folder, args):
+    """Point both backends at stand-ins for the radio and DHCP."""
+    interface_file = os.path.join(folder, 'interfaces')
+    with open(interface_file, 'w') as f:
+        f.write(CONFIG)
+    interfaces.store = interfaces.InterfaceStore(interface_file)
+
+    monitor = linkstate.LinkMonitor()
+    monitor.active = True
+    monitor.names[3] = INTERFACE
+    linkstate.monitor = monitor
+
+    backends.IFDOWN = write_script(folder, 'ifdown', args.ifdown_time)
+    backends.IFUP = write_script(
+        folder, 'ifup', args.associate_time + args.dhcp_time,
+        "sys.stderr.write('bound to 10.1.2.3 -- renewal in 1800 seconds.\\n')")
+
+    def lease(ssid):
+        if args.stale_dhcp:
+            return
+        asyncio.get_event_loop().call_later(
+            args.dhcp_time, monitor.feed, address_message(3, '10.1.2.3'))
+
+    ctrl_dir = os.path.join(folder, 'ctrl')
+    os.mkdir(ctrl_dir)
+    server = FakeWpaSupplicant(ctrl_dir, networks={'EHIE-Lab': 'secret123'},
+                               associate_time=args.associate_time,
+                               on_connected=lease)
+    server.start()
+    return ctrl_dir, server
+
+
+async def measure(backend, interface, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        address = await backend.connect(interface)
+        times.append(time.perf_counter() - start)
+        if address is None:
+            raise SystemExit('{} failed to connect'.format(backend.name))
+    return times
+
+
+def report(name, times):
+    times = sorted(times)
+    print('{:15} median {:7.1f} ms  min {:7.1f} ms  max {:7.1f} ms'.format(
+        name, statistics.median(times) * 1000, times[0] * 1000,
+        times[-1] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--associate-time', type=float, default=.2)
+    parser.add_argument('--dhcp-time', type=float, default=.3)
+    parser.add_argument('--ifdown-time', type=float, default=.1)
+    parser.add_argument('--stale-dhcp', action='store_true',
+                        help="the DHCP client does not ask for a new lease "
+                             "after switching networks, as with dhclient "
+                             "started by ifupdown")
+    parser.add_argument('--interface',
+                        help="reconnect this real interface instead")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as folder:
+        server = None
+        interface = args.interface
+        if interface is None:
+            interface = INTERFACE
+            ctrl_dir, server = fake_setup(folder, args)
+        else:
+            ctrl_dir = backends.CTRL_DIR
+
+        try:
+            for backend in (backends.IfupdownBackend(),
+                            backends.WpaSupplicantBackend(ctrl_dir)):
+                if not backend.available(interface):
+                    print('{:15} not available'.format(backend.name))
+                    continue
+                report(backend.name, loop.run_until_complete(
+                    measure(backend, interface, args.repeat)))
+        finally:
+            if server is not None:
+                server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Channel hop latency with ioctls and with iwconfig.
+
+The kernel's side is left out: the ioctl is answered by a stand-in for
+fcntl.ioctl, and iwconfig is replaced by true(1). What is left is each
+radio's own cost, packing a request over the long-lived socket against
+forking a process for every hop, as a sweep pays it on each channel.
+
+    python bench/hop_latency.py --hops 500
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import radio  # noqa: E402
+
+INTERFACE = 'wlan0'
+CHANNELS = list(range(1, 12))
+
+
+def fake_ioctl(fd, request, arg):
+    return arg
+
+
+async def hop(count):
+    times = []
+    for index in range(count):
+        start = time.perf_counter()
+        await radio.set_channel(INTERFACE, CHANNELS[index % len(CHANNELS)])
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hops', type=int, default=200)
+    args = parser.parse_args()
+
+    radio.fcntl.ioctl = fake_ioctl
+    radio.IWCONFIG = shutil.which('true')
+
+    loop = asyncio.get_event_loop()
+    for stand_in in [radio.ioctl_radio, radio.iwconfig_radio]:
+        radio._radios[INTERFACE] = stand_in
+        times = loop.run_until_complete(hop(args.hops))
+        times.sort()
+        print('{:9} median {:8.3f} ms  p99 {:8.3f} ms  {:7.0f} hops/s'
+              .format(stand_in.name, statistics.median(times) * 1000,
+                      times[int(len(times) * .99)] * 1000,
+                      len(times) / sum(times)))
+
+
+if __name__ == '__main__':
+    main()
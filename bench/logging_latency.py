@@ -0,0 +1,138 @@
+"""Event-loop latency while the sensor logs.
+
+A ticker coroutine wakes every millisecond while another logs --lines
+debug lines of command output, --rate a second, and how late the ticker
+was is reported. Direct is logging as it was before logs.setup(), a
+file handler and a stream handler called from the loop; queue is
+logs.setup(), with the rate limit and truncation filters in front of a
+queue that a thread writes out, so it also writes fewer lines; the
+last run leaves the rate limit out to show the queue on its own.
+--write-delay stands in for a slow SD card by sleeping in every write.
+
+    python bench/logging_latency.py --lines 2000 --write-delay .002
+"""
+import argparse
+import asyncio
+import atexit
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import logs  # noqa: E402
+
+TICK = .001
+_LOGGER = logging.getLogger('runner')
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, filename, delay):
+        super().__init__(filename)
+        self.write_delay = delay
+
+    def emit(self, record):
+        super().emit(record)
+        time.sleep(self.write_delay)
+
+
+def setup_direct(filename, args, devnull):
+    formatter = logging.Formatter(logs.FORMAT)
+    outputs = [SlowFileHandler(filename, args.write_delay),
+               logging.StreamHandler(devnull)]
+    for output in outputs:
+        output.setFormatter(formatter)
+        logging.getLogger().addHandler(output)
+
+
+def setup_queue(filename, args, devnull):
+    logs.setup(filename)
+    # Slow the file handler down the same way
+    handler = logs._listener.handlers[0]
+    handler.__class__ = SlowFileHandler
+    handler.write_delay = args.write_delay
+
+
+def setup_unlimited(filename, args, devnull):
+    setup_queue(filename, args, devnull)
+    for handler in logging.getLogger().handlers:
+        for log_filter in list(handler.filters):
+            if isinstance(log_filter, logs.RateLimitFilter):
+                handler.removeFilter(log_filter)
+
+
+def teardown():
+    if logs._listener is not None:
+        logs._listener.stop()
+        atexit.unregister(logs._listener.stop)
+        logs._listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+async def measure(args):
+    loop = asyncio.get_event_loop()
+    late = []
+    running = True
+
+    async def ticker():
+        while running:
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            late.append(loop.time() - expected)
+
+    task = asyncio.ensure_future(ticker())
+    for index in range(args.lines):
+        _LOGGER.debug('stdout: %s', 'Cell {:02d} - Address: 00:11:22:33:44'
+                      .format(index % 100))
+        if index % 10 == 9:
+            await asyncio.sleep(10 / args.rate)
+    running = False
+    await task
+    late.sort()
+    return statistics.median(late), late[int(len(late) * .99)], late[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=2000,
+                        help="lines logged a second")
+    parser.add_argument('--write-delay', type=float, default=.001,
+                        help="seconds every write to the log file takes")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    logging.getLogger().setLevel(logging.DEBUG)
+    with tempfile.TemporaryDirectory() as folder, \
+            open(os.devnull, 'w') as devnull:
+        for name, setup in [('direct', setup_direct),
+                            ('queue', setup_queue),
+                            ('queue without rate limit', setup_unlimited)]:
+            filename = os.path.join(folder, name + '.log')
+            stderr, sys.stderr = sys.stderr, devnull
+            try:
+                setup(filename, args, devnull)
+            finally:
+                sys.stderr = stderr
+            try:
+                median, p99, worst = loop.run_until_complete(measure(args))
+            finally:
+                teardown()
+            with open(filename) as f:
+                written = sum(1 for _ in f)
+            print('{:25} ticker late: median {:6.2f} ms  p99 {:6.2f} ms  '
+                  'max {:6.2f} ms  {:6} lines written'.format(
+                      name, median * 1000, p99 * 1000, worst * 1000,
+                      written))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Event-loop stall while a sensor pings the gateway.
+
+A ticker coroutine wakes every millisecond and records how late it was
+while the sensor pings a stand-in gateway that takes --delay seconds to
+answer. The gateway runs in its own thread, as it would on another
+machine. The blocking ping is what sensor_client did before, a
+synchronous HTTP POST from inside a coroutine; the async one is
+gateway_client.GatewayClient.
+
+    python bench/ping_stall.py --delay .2 --repeat 10
+"""
+import argparse
+import asyncio
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+TICK = .001
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'OK')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/ping'.format(server.server_port)
+
+
+async def blocking_ping(url):
+    data = urllib.parse.urlencode({'sensor': 'sensor-1',
+                                   'ssid': 'EHIE-Lab'}).encode()
+    with urllib.request.urlopen(url, data=data, timeout=10) as response:
+        return response.status == 200
+
+
+async def measure(ping, repeat):
+    """Return the longest the ticker was late and the mean ping time."""
+    loop = asyncio.get_event_loop()
+    worst = 0
+    running = True
+
+    async def ticker():
+        nonlocal worst
+        while running:
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            worst = max(worst, loop.time() - expected)
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(TICK * 10)
+    total = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if not await ping():
+            raise SystemExit('Ping failed')
+        total += time.perf_counter() - start
+        # Let the ticker run between pings, so a stall is one ping's
+        await asyncio.sleep(TICK * 10)
+    running = False
+    await task
+    return worst, total / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--delay', type=float, default=.2,
+                        help="seconds the gateway takes to answer")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        import gateway_client
+    except ImportError as e:
+        raise SystemExit('Needs aiohttp: {}'.format(e))
+
+    server, url = serve(args.delay)
+    client = gateway_client.GatewayClient(url)
+    loop = asyncio.get_event_loop()
+    try:
+        for name, ping in [
+                ('blocking', lambda: blocking_ping(url)),
+                ('async', lambda: client.ping('sensor-1', 'EHIE-Lab'))]:
+            worst, elapsed = loop.run_until_complete(
+                measure(ping, args.repeat))
+            print('{:10} ping {:7.1f} ms  longest loop stall {:7.1f} ms'
+                  .format(name, elapsed * 1000, worst * 1000))
+    finally:
+        client.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
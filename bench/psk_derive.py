@@ -0,0 +1,104 @@
+"""WPA PSK derivation time and event-loop stall.
+
+Times _derive_psk with hashlib.pbkdf2_hmac and with the pure-Python
+pbkdf2 package it falls back to. Then, for each of them, a ticker
+coroutine wakes every millisecond while PSKs are derived, and the
+longest it was late is reported. Inline is what wifi.replace did before,
+deriving on the loop; derive_psk runs it in the executor, and cached
+repeats passphrases derive_psk has seen.
+
+    python bench/psk_derive.py --repeat 20
+"""
+import argparse
+import asyncio
+from collections import OrderedDict
+import hashlib
+import os
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import wifi  # noqa: E402
+
+TICK = .001
+SSID = 'EHIE-Lab'
+
+
+def time_derive(derive, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        derive(SSID, 'secret-{}'.format(i))
+    return (time.perf_counter() - start) / repeat
+
+
+def with_pbkdf2(ssid, passphrase):
+    return wifi.PBKDF2(passphrase, ssid, 4096).hexread(32)
+
+
+def with_hashlib(ssid, passphrase):
+    return hashlib.pbkdf2_hmac('sha1', passphrase.encode(), ssid.encode(),
+                               4096, 32).hex()
+
+
+async def inline(passphrase):
+    return wifi._derive_psk(SSID, passphrase)
+
+
+async def derive(passphrase):
+    return await wifi.derive_psk(SSID, passphrase)
+
+
+async def measure(derive, passphrases):
+    """Return the longest the ticker was late."""
+    loop = asyncio.get_event_loop()
+    worst = 0
+    running = True
+
+    async def ticker():
+        nonlocal worst
+        while running:
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            worst = max(worst, loop.time() - expected)
+
+    task = asyncio.ensure_future(ticker())
+    await asyncio.sleep(TICK * 10)
+    for passphrase in passphrases:
+        await derive(passphrase)
+        await asyncio.sleep(TICK * 10)
+    running = False
+    await task
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    derivations = [('hashlib', with_hashlib)]
+    if wifi.PBKDF2 is not None:
+        derivations.append(('pbkdf2', with_pbkdf2))
+    else:
+        print('pbkdf2 is not installed, only timing hashlib')
+    for name, function in derivations:
+        print('{:10} {:8.2f} ms per PSK'.format(
+            name, time_derive(function, args.repeat) * 1000))
+
+    loop = asyncio.get_event_loop()
+    passphrases = ['secret-{}'.format(i) for i in range(args.repeat)]
+    for name, function in derivations:
+        wifi._derive_psk = function
+        for mode, coroutine in [('inline', inline), ('derive_psk', derive),
+                                ('cached', derive)]:
+            if mode != 'cached':
+                wifi._psk_cache = OrderedDict()
+            worst = loop.run_until_complete(measure(coroutine, passphrases))
+            print('{:10} {:10} longest loop stall {:7.2f} ms'.format(
+                name, mode, worst * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Time to credentials and output throughput of the credential receiver.
+
+The recordings in tests/fixtures/receiver are replayed in place of
+receive_wifi.py, at their recorded pace divided by --speed, and the time
+until Receiver hands out credentials is measured. The throughput run
+writes a flood of progress lines before the credentials, all at once.
+
+    python bench/receive_replay.py --speed 1 --lines 100000
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import receiver  # noqa: E402
+import runner  # noqa: E402
+
+from receiver_replay import ReplayExecutor, load  # noqa: E402
+
+
+async def time_to_credentials(events, speed):
+    runner.executor = ReplayExecutor([events], speed)
+    start = time.perf_counter()
+    async with receiver.Receiver('wlan0') as listener:
+        credentials = await listener.get(60)
+    return credentials, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--speed', type=float, default=1)
+    parser.add_argument('--lines', type=int, default=100000)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    pattern = os.path.join(ROOT, 'tests', 'fixtures', 'receiver', '*.rec')
+    for filename in sorted(glob.glob(pattern)):
+        events = load(filename)
+        if not any(kind == 'out' for _, kind, _ in events):
+            continue
+        recorded = min(at for at, kind, _ in events if kind == 'out')
+        credentials, elapsed = loop.run_until_complete(
+            time_to_credentials(events, args.speed))
+        print('{:20} {} after {:.3f}s (recorded {:.3f}s)'.format(
+            os.path.basename(filename), credentials.ssid, elapsed,
+            recorded / args.speed))
+
+    events = [(0, 'err', 'round {}: 9/12 packets, 2/3 blocks'.format(i)
+               .encode()) for i in range(args.lines)]
+    events.append((0, 'out', b'EHIE-Lab:secret123'))
+    _, elapsed = loop.run_until_complete(time_to_credentials(events, None))
+    print('throughput: {} lines in {:.3f}s, {:.0f} lines/s'.format(
+        len(events), elapsed, len(events) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Time from saved credentials to an operational sensor, in process and
+with the old service restart.
+
+Both paths start once new credentials are saved and connected, and ping a
+stand-in gateway on localhost first, as sensor_client does. In process,
+the change is done when reconfigure.network_changed() has run its
+listeners: the gateway client drops its session and the web page gets
+the new status. With RESTART_ON_NETWORK_CHANGE, `systemctl restart` is
+replaced by a script that starts the sensor the way __main__ does, up to
+its web server accepting connections. The link monitor's first netlink
+dump and the first scan are not part of it, so the restart numbers are a
+lower bound.
+
+    python bench/reconfigure_time.py --repeat 20
+
+Needs aiohttp and python-socketio, as the sensor does.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+INTERFACE = 'wlan0'
+SSID = 'EHIE-Lab'
+CONFIG = '''iface wlan0 inet dhcp
+    wpa-ssid "EHIE-Lab"
+    wpa-psk "secret123"
+'''
+# Stands in for `systemctl restart sensor.service`, which returns once the
+# new process has started
+RESTART = '''#!{python}
+import asyncio, sys
+sys.path.insert(0, {package!r})
+
+import wifi
+import sensor_client
+from aiohttp import web
+from sensor_server import app
+
+app.interface = {interface!r}
+loop = asyncio.get_event_loop()
+server = loop.run_until_complete(loop.create_server(
+    app.make_handler(), '127.0.0.1', 0))
+server.close()
+'''
+
+
+async def gateway(pings):
+    from aiohttp import web
+
+    async def ping(request):
+        pings.append(time.monotonic())
+        return web.Response(text='OK')
+
+    app = web.Application()
+    app.router.add_post('/ping', ping)
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(app.make_handler(), '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def change(ssid):
+    import gateway_client
+    import reconfigure
+
+    saved_at = time.monotonic()
+    await gateway_client.client.ping('sensor-1', ssid, deadline=5)
+    pinged_at = time.monotonic()
+    await reconfigure.network_changed(INTERFACE, ssid, saved_at=saved_at)
+    return pinged_at - saved_at, time.monotonic() - saved_at
+
+
+def setup(folder, port):
+    import gateway_client
+    import interfaces
+    import linkstate
+    import utils
+
+    from netlink import address_message
+
+    interface_file = os.path.join(folder, 'interfaces')
+    with open(interface_file, 'w') as f:
+        f.write(CONFIG)
+    interfaces.store = interfaces.InterfaceStore(interface_file)
+
+    monitor = linkstate.LinkMonitor()
+    monitor.active = True
+    monitor.names[3] = INTERFACE
+    monitor.feed(address_message(3, '10.1.2.3'))
+    linkstate.monitor = monitor
+
+    gateway_client.client = gateway_client.GatewayClient(
+        'http://127.0.0.1:{}/ping'.format(port))
+
+    restart = os.path.join(folder, 'systemctl')
+    with open(restart, 'w') as f:
+        f.write(RESTART.format(python=sys.executable,
+                               package=os.path.join(ROOT, 'wifi_connect'),
+                               interface=INTERFACE))
+    os.chmod(restart, 0o755)
+    # Once outside the timing, so a broken setup fails loudly and the
+    # modules are in the page cache, as on a sensor that has been running
+    subprocess.check_call([restart, 'restart', 'sensor.service'])
+    utils.SYSTEMCTL = restart
+
+
+def report(name, times):
+    times = sorted(times)
+    print('{:12} median {:8.1f} ms  min {:8.1f} ms  max {:8.1f} ms'.format(
+        name, statistics.median(times) * 1000, times[0] * 1000,
+        times[-1] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        import aiohttp  # noqa: F401
+        import socketio  # noqa: F401
+    except ImportError as e:
+        raise SystemExit('Needs aiohttp and python-socketio: {}'.format(e))
+
+    # The sensor's listeners register themselves when imported
+    import gateway_client
+    import reconfigure
+    import sensor_client
+    import sensor_server
+
+    loop = asyncio.get_event_loop()
+    pings = []
+    server, port = loop.run_until_complete(gateway(pings))
+    with tempfile.TemporaryDirectory() as folder:
+        setup(folder, port)
+        sensor_server.app.interface = INTERFACE
+        sensor_client.connection = sensor_client.Connection(INTERFACE)
+        reconfigure.add_listener(sensor_client.connection.on_link_event)
+
+        for restart in (False, True):
+            reconfigure.RESTART_ON_NETWORK_CHANGE = restart
+            ping_times, times = zip(*[
+                loop.run_until_complete(change(SSID))
+                for _ in range(args.repeat)])
+            name = 'restart' if restart else 'in process'
+            report(name, times)
+            report('  ping', ping_times)
+
+    gateway_client.client.close()
+    server.close()
+    print('gateway heard {} pings'.format(len(pings)))
+
+
+if __name__ == '__main__':
+    main()
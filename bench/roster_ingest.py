@@ -0,0 +1,142 @@
+"""Ingest and query throughput of the gateway roster.
+
+--sensors expected sensors are imported from CSV, then --pings pings are
+recorded the way /ping records them, in bursts, while a ticker measures
+how late the event loop runs. Each query the gateway's roster pages make
+is then timed against the full database, along with opening it again as
+the gateway does on start.
+
+    python bench/roster_ingest.py --pings 100000 --sensors 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import roster  # noqa: E402
+import sessions  # noqa: E402
+
+TICK = .001
+BURST = 100
+SITES = ['north', 'south', 'east', 'west']
+
+
+def roster_csv(hostnames):
+    lines = ['hostname,mac,site']
+    for index, hostname in enumerate(hostnames):
+        lines.append('{},b8:27:eb:{:02x}:{:02x}:{:02x},{}'.format(
+            hostname, index >> 16 & 255, index >> 8 & 255, index & 255,
+            SITES[index % len(SITES)]))
+    return '\n'.join(lines) + '\n'
+
+
+async def ingest(store, hostnames, args, rng):
+    """Record the pings and return the seconds taken and the longest the
+    loop was late."""
+    loop = asyncio.get_event_loop()
+    worst = 0
+    running = True
+
+    async def ticker():
+        nonlocal worst
+        while running:
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            worst = max(worst, loop.time() - expected)
+
+    session = sessions.BroadcastSession('EHIE-Lab', 'secret123',
+                                        len(hostnames))
+    task = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    for index in range(args.pings):
+        # A few pings come from sensors that are not on the roster
+        hostname = (rng.choice(hostnames) if rng.random() > .01
+                    else 'stray-{}'.format(index))
+        store.record_provisioning(session, hostname, rng.uniform(2, 30),
+                                  rng.randint(-90, -30), rng.randint(1, 11))
+        if index % BURST == BURST - 1:
+            await asyncio.sleep(0)
+    await store.flush()
+    # Batches queued before the last one are written before it returns
+    # from the database thread
+    await store._call(lambda: None)
+    elapsed = time.perf_counter() - start
+    running = False
+    await task
+    return elapsed, worst
+
+
+async def timed(query, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await query()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+async def run(filename, args):
+    rng = random.Random(args.seed)
+    hostnames = ['sensor-{:06d}'.format(i) for i in range(args.sensors)]
+    store = roster.Roster(filename)
+    await store.open()
+
+    start = time.perf_counter()
+    await store.import_csv(roster_csv(hostnames))
+    print('import {} sensors: {:.3f}s'.format(
+        args.sensors, time.perf_counter() - start))
+
+    elapsed, worst = await ingest(store, hostnames, args, rng)
+    print('ingest {} pings: {:.3f}s, {:.0f} pings/s, longest loop stall '
+          '{:.1f} ms'.format(args.pings, elapsed, args.pings / elapsed,
+                             worst * 1000))
+
+    middle = hostnames[len(hostnames) // 2]
+    newest = await store.history(limit=1)
+    deep = newest[0]['id'] // 2
+    session_id = newest[0]['session_id']
+
+    async def reopen():
+        await roster.Roster(filename).open()
+
+    queries = [
+        ('sensors, first page', lambda: store.sensors()),
+        ('sensors of a site', lambda: store.sensors(site='north',
+                                                    after=middle)),
+        ('history, newest page', lambda: store.history()),
+        ('history of a sensor', lambda: store.history(hostname=middle)),
+        ('history of a session', lambda: store.history(
+            session_id=session_id, before=deep)),
+        ('history, deep page', lambda: store.history(before=deep)),
+        ('open', reopen),
+    ]
+    for name, query in queries:
+        print('{:22} {:8.2f} ms'.format(
+            name, await timed(query, args.repeat) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pings', type=int, default=100000)
+    parser.add_argument('--sensors', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20,
+                        help="times each query is run")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as folder:
+        loop.run_until_complete(run(os.path.join(folder, 'roster.db'),
+                                    args))
+
+
+if __name__ == '__main__':
+    main()
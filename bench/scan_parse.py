@@ -0,0 +1,93 @@
+"""Throughput of the iwlist scan parser.
+
+Cells from the fixture dumps are repeated into one dense scan, as seen in
+apartment buildings, and parsed line by line the way wifi.scan does.
+
+    python bench/scan_parse.py --cells 500 --repeat 20
+"""
+import argparse
+import asyncio
+import glob
+import os
+import re
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import runner  # noqa: E402
+import wifi  # noqa: E402
+
+cell_re = re.compile(r'^\s*Cell \d+ - ', flags=re.MULTILINE)
+
+
+def load_cells():
+    cells = []
+    pattern = os.path.join(ROOT, 'tests', 'fixtures', 'iwlist', '*.txt')
+    for filename in sorted(glob.glob(pattern)):
+        with open(filename, encoding='utf-8') as f:
+            text = f.read()
+        starts = [m.start() for m in cell_re.finditer(text)]
+        for start, end in zip(starts, starts[1:] + [len(text)]):
+            cells.append(text[start:end].rstrip('\n').split('\n', 1)[1])
+    return cells
+
+
+def dense_scan(count):
+    cells = load_cells()
+    lines = ['wlan0     Scan completed :']
+    for i in range(count):
+        lines.append('          Cell {:02d} - Address: '
+                     '02:00:00:00:{:02X}:{:02X}'.format(i + 1, i // 256,
+                                                        i % 256))
+        lines.append(cells[i % len(cells)])
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def parse(data):
+    parser = wifi.ScanParser()
+    count = 0
+    for line in data.decode().splitlines(True):
+        if parser.feed(line) is not None:
+            count += 1
+    if parser.close() is not None:
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cells', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    data = dense_scan(args.cells)
+    lines = data.count(b'\n')
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        networks = parse(data)
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    print('parser: {} cells ({} lines, {} KB) in {:.2f} ms, '
+          '{:.1f} us/cell, {:.0f} lines/s'.format(
+              networks, lines, len(data) // 1024, elapsed * 1000,
+              elapsed / networks * 1e6, lines / elapsed))
+
+    # The same dump through wifi.scan, with iwlist replaced by a fake
+    runner.executor = runner.FakeExecutor(
+        {'iwlist': runner.Result(0, data, b'', False, 0)})
+    loop = asyncio.get_event_loop()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        networks = loop.run_until_complete(wifi.scan('wlan0', force=True))
+    elapsed = (time.perf_counter() - start) / args.repeat
+
+    print('wifi.scan: {} networks in {:.2f} ms, {:.1f} us/cell'.format(
+        len(networks), elapsed * 1000, elapsed / len(networks) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,835 @@
+"""End-to-end provisioning simulation on virtual time.
+
+One gateway broadcasts credentials to N simulated sensors, all in one
+process. The gateway side is the real SessionScheduler, BroadcastSession
+and AdaptiveLoss, putting rounds on a simulated radio channel. Each
+sensor runs the real sensor_client loop with its own copy of the sensor
+modules, as if it were a separate device. Its iwlist, iwconfig,
+receive_wifi, ifdown and ifup are fakes. Scans and dhclient output come
+from the fixtures in tests/fixtures, and ifup only gets a lease with the
+credentials the gateway broadcast.
+
+The event loop's clock jumps straight to the next timer, so an hour of
+provisioning takes seconds and the same --seed gives the same numbers.
+
+    python bench/simulate.py --sensors 50 --loss .3 --occupancy .4
+    python bench/simulate.py --settings tuned.json --json
+
+--settings takes the same file as the apps, to try timing constants such
+as RECEIVE_WAIT_TIME or BROADCAST_WAIT_TIME.
+
+--policy picks how the gateway sets the FEC redundancy: adaptive
+(fec.AdaptiveLoss, the default) or fixed (fec.FixedLoss at
+--fixed-loss). Given both, each is run with the same seed and the time
+until all sensors are in is reported per policy.
+
+    python bench/simulate.py --loss .4 --policy fixed adaptive
+
+With --flaps or --trace, the sensors start out connected instead and the
+access point goes away and comes back. Each outage takes the link and
+the lease from the sensors on it, and it is reported how long they stay
+offline and how long they take to reconnect once the access point is
+back. A trace has one event per line, seconds from the start and down or
+up, as in tests/fixtures/flaps.
+
+    python bench/simulate.py --flaps 10 --outage 60
+    python bench/simulate.py --trace tests/fixtures/flaps/office.txt
+
+--backup names a second network from the scan fixture that the sensors
+also know, with the same password, and that stays up. Sensors then roam
+to it when the access point goes away, instead of waiting for it.
+
+    python bench/simulate.py --flaps 10 --backup 'Neighbour WPA'
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import selectors
+import sys
+import tempfile
+import time
+import types
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+PACKAGE = os.path.join(ROOT, 'wifi_connect')
+sys.path.insert(0, PACKAGE)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+# Nothing from wifi_connect is imported at the top: modules read their
+# settings on import, and objects created on import bind to the event
+# loop, so both have to be in place first
+
+INTERFACE = 'wlan0'
+INTERFACE_INDEX = 3
+
+# Virtual seconds taken by the fake tools and the radio
+SCAN_TIME = 2.5
+IWCONFIG_TIME = .02
+IFDOWN_TIME = .5
+ASSOCIATE_TIME = 1.5
+DHCP_TIME = 1.5
+DHCP_TIMEOUT = 10
+PACKET_TIME = .05
+PING_LATENCY = .02
+# Frames needed to decode one set of credentials
+DATA_PACKETS = 12
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """Selector that moves the loop's clock instead of waiting."""
+
+    loop = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+
+        if timeout is None:
+            raise RuntimeError('Simulation stalled, nothing is scheduled')
+
+        self.loop.advance(timeout)
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop on virtual time.
+
+    Jobs for run_in_executor() run inline, threads would finish at a
+    different virtual time on every run.
+    """
+
+    def __init__(self):
+        selector = VirtualSelector()
+        selector.loop = self
+        self._now = 0.0
+        super().__init__(selector)
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds):
+        self._now += seconds
+
+    def run_in_executor(self, executor, func, *args):
+        future = self.create_future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class VirtualClock():
+    """Stands in for the time module in the simulated modules."""
+
+    EPOCH = 1500000000
+
+    def __init__(self, loop):
+        self._loop = loop
+
+    def monotonic(self):
+        return self._loop.time()
+
+    perf_counter = monotonic
+
+    def time(self):
+        return self.EPOCH + self._loop.time()
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def use_clock(modules, clock):
+    for module in modules:
+        if getattr(module, 'time', None) is time:
+            module.time = clock
+
+
+def package_modules():
+    return [name[:-3] for name in os.listdir(PACKAGE)
+            if name.endswith('.py') and not name.startswith('__')]
+
+
+def load_sensor_modules():
+    """Import sensor_client and everything it imports afresh, so each
+    simulated sensor has its own stores, executor and link monitor."""
+    names = package_modules()
+    saved = {name: sys.modules.pop(name) for name in names
+             if name in sys.modules}
+    try:
+        importlib.import_module('sensor_client')
+        return {name: sys.modules[name] for name in names
+                if name in sys.modules}
+    finally:
+        for name in names:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+
+def read_fixture(*parts):
+    with open(os.path.join(ROOT, 'tests', 'fixtures', *parts), 'rb') as f:
+        return f.read()
+
+
+def output(at, stream, data):
+    """Events writing data to stream at once, at seconds in."""
+    return [(at, stream, line) for line in data.splitlines()]
+
+
+def without_networks(scan, ssids):
+    """iwlist output with the cells of networks called ssids left out."""
+    if not ssids:
+        return scan
+
+    names = [b'ESSID:"' + ssid.encode() + b'"' for ssid in ssids]
+    kept = []
+    cell = []
+    for line in scan.splitlines(keepends=True) + [b' - Address: ']:
+        if b' - Address: ' in line:
+            if not any(name in l for name in names for l in cell):
+                kept.extend(cell)
+            cell = [line]
+        elif cell:
+            cell.append(line)
+        else:
+            kept.append(line)
+    return b''.join(kept)
+
+
+def read_trace(filename):
+    """(seconds, 'down' or 'up') events from a link-flap trace."""
+    events = []
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if line:
+                at, event = line.split()
+                events.append((float(at), event))
+    return events
+
+
+def make_trace(args, rng):
+    """--flaps outages, --flap-interval apart and --outage long on average,
+    after the sensors have booted."""
+    events = []
+    at = args.boot_spread
+    for _ in range(args.flaps):
+        at += args.flap_interval
+        events.append((at, 'down'))
+        at += rng.uniform(0, 2 * args.outage)
+        events.append((at, 'up'))
+    return events
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of values, None if there are none."""
+    if not values:
+        return None
+
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class Air():
+    """The radio channel the gateway broadcasts on.
+
+    A round carries DATA_PACKETS frames plus enough redundancy to survive
+    the loss rate the gateway expects. Every frame waits for the channel
+    to be free, so occupancy stretches the round, and is heard by each
+    sensor that is listening on the channel unless it is lost on the way.
+    """
+
+    def __init__(self, channel, occupancy, rng):
+        self.channel = channel
+        self.occupancy = occupancy
+        self.rng = rng
+        self.sensors = []
+        self.airtime = 0
+        self.frames = 0
+
+    async def send(self, ssid, password, send_flag, possible_loss):
+        count = math.ceil(DATA_PACKETS / (1 - possible_loss))
+        frame_time = PACKET_TIME / (1 - self.occupancy)
+        for index in range(count):
+            await asyncio.sleep(frame_time)
+            self.airtime += frame_time
+            self.frames += 1
+            for sensor in self.sensors:
+                if sensor.listening(self.channel) and \
+                        self.rng.random() >= sensor.loss:
+                    sensor.hear((send_flag, index), ssid, password)
+
+    async def close(self):
+        pass
+
+
+class AccessPoints():
+    """Networks in range of the sensors, by SSID with their PSK, and the
+    ones that are down."""
+
+    def __init__(self, networks):
+        self.networks = dict(networks)
+        self.down = set()
+
+    def lease(self, ssid, psk):
+        return ssid not in self.down and self.networks.get(ssid) == psk
+
+    def visible(self, scan):
+        return without_networks(scan, self.down)
+
+
+class Gateway():
+    """Gateway side of /ping, called by the sensors directly.
+
+    The aiohttp app cannot run on virtual time, so this does what
+    gateway_server.sensor_ping does with a ping, without the HTTP layer.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.provisioned = collections.OrderedDict()
+        self.pings = 0
+
+    async def ping(self, sensor, ssid, deadline=None, **health):
+        await asyncio.sleep(PING_LATENCY)
+        self.pings += 1
+        session = self.scheduler.route(ssid=ssid)
+        if session is not None and self.scheduler.add_sensor(session,
+                                                             sensor):
+            self.provisioned[sensor] = asyncio.get_event_loop().time()
+        return True
+
+
+class Sensor():
+    """One simulated sensor: its modules, radio state and fake tools."""
+
+    def __init__(self, hostname, loss, folder, fixtures, access_points):
+        self.hostname = hostname
+        self.loss = loss
+        self.fixtures = fixtures
+        self.access_points = access_points
+        self.mode = 'managed'
+        self.channel = None
+        self.receiver = None
+        self.frames = set()
+        self.joined = None
+        self.addresses_added = []
+        self.task = None
+
+        self.modules = load_sensor_modules()
+        self.client = self.modules['sensor_client']
+        self.client.hostname = hostname
+        # Each sensor is a device of its own, with its own process limit
+        self.executor = self._executor_class()()
+        self.executor.commands = collections.Counter()
+        self.modules['runner'].executor = self.executor
+        self.modules['radio']._radios[INTERFACE] = \
+            self.modules['radio'].iwconfig_radio
+        self.modules['wifi'].backend_name = 'ifupdown'
+
+        monitor = self.modules['linkstate'].LinkMonitor()
+        monitor.active = True
+        monitor.names[INTERFACE_INDEX] = INTERFACE
+        monitor.add_listener(self._link_event)
+        self.modules['linkstate'].monitor = monitor
+        self.monitor = monitor
+
+        interface_file = os.path.join(folder, 'interfaces')
+        os.makedirs(interface_file + '.d')
+        with open(interface_file, 'w') as f:
+            f.write('source {}.d/*.cfg\n'.format(interface_file))
+        self.modules['interfaces'].store = \
+            self.modules['interfaces'].InterfaceStore(interface_file)
+        self.modules['credentials'].store = \
+            self.modules['credentials'].CredentialStore(
+                os.path.join(folder, 'credentials.json'))
+
+    def _executor_class(self):
+        sensor = self
+        runner = self.modules['runner']
+
+        class SensorExecutor(runner.FakeExecutor):
+            async def _create(self, name, args, stdin):
+                self.calls.append(args)
+                self.commands[name] += 1
+                return sensor.run(name, args)
+
+        return SensorExecutor
+
+    def _link_event(self, interface, event):
+        if event == 'address-added':
+            self.addresses_added.append(asyncio.get_event_loop().time())
+
+    async def provision(self, ssid, password, backup=None):
+        """Start out configured for and connected to ssid, knowing backup
+        as well."""
+        from netlink import address_message
+
+        wifi = self.modules['wifi']
+        # Networks added later rank higher
+        if backup is not None:
+            await wifi.replace(INTERFACE, wifi.Network(backup, 'wpa2'),
+                               password)
+        await wifi.replace(INTERFACE, wifi.Network(ssid, 'wpa2'), password)
+        self.joined = ssid
+        self.monitor.feed(address_message(INTERFACE_INDEX, '10.1.2.3'))
+
+    def network_down(self, ssid):
+        """The access point of ssid went away, with the lease from it."""
+        from netlink import address_message, link_message
+
+        if self.joined != ssid:
+            return
+
+        self.joined = None
+        self.monitor.feed(link_message(INTERFACE_INDEX, INTERFACE, up=False))
+        for address in list(self.monitor.addresses.get(INTERFACE, [])):
+            self.monitor.feed(address_message(INTERFACE_INDEX, address,
+                                              new=False))
+
+    def network_up(self, ssid):
+        """wpa_supplicant associates again by itself, without a lease."""
+        from netlink import link_message
+
+        if self.joined is None and self.mode == 'managed':
+            self.monitor.feed(link_message(INTERFACE_INDEX, INTERFACE))
+
+    def listening(self, channel):
+        return (self.receiver is not None and
+                self.receiver.returncode is None and
+                self.mode == 'monitor' and self.channel == channel)
+
+    def hear(self, frame, ssid, password):
+        self.frames.add(frame)
+        if len(self.frames) == DATA_PACKETS:
+            self.receiver.stdout.feed_data(
+                '{}:{}\n'.format(ssid, password).encode())
+
+    def run(self, name, args):
+        """Start the fake for one command."""
+        from receiver_replay import ReplayProcess
+
+        if name == 'iwlist':
+            scan = self.access_points.visible(self.fixtures['iwlist'])
+            return ReplayProcess(output(SCAN_TIME, 'out', scan) +
+                                 [(SCAN_TIME, 'exit', b'0')])
+
+        if name == 'iwconfig':
+            if args[2] == 'mode':
+                self.mode = args[3].lower()
+            elif args[2] == 'channel':
+                self.channel = int(args[3])
+            return ReplayProcess([(IWCONFIG_TIME, 'exit', b'0')])
+
+        if name == 'receive_wifi':
+            # What a receiver decoded is lost when it exits
+            self.frames = set()
+            self.receiver = ReplayProcess([])
+            return self.receiver
+
+        if name == 'ifdown':
+            self.joined = None
+            self.monitor.addresses.pop(INTERFACE, None)
+            return ReplayProcess([(IFDOWN_TIME, 'exit', b'0')])
+
+        if name == 'ifup':
+            return self._ifup()
+
+        return ReplayProcess([(0, 'exit', b'0')])
+
+    def _ifup(self):
+        """dhclient gets a lease only from a network that is up, with the
+        right PSK."""
+        from netlink import address_message
+        from receiver_replay import ReplayProcess
+
+        options = self.modules['interfaces'].store.options(INTERFACE)
+        unquote = self.modules['interfaces'].unquote
+        ssid = unquote(options.get('wpa-ssid', ''))
+        if not self.access_points.lease(ssid,
+                                        unquote(options.get('wpa-psk', ''))):
+            return ReplayProcess(
+                output(DHCP_TIMEOUT, 'err', self.fixtures['no_offers']) +
+                [(DHCP_TIMEOUT, 'exit', b'1')])
+
+        done = ASSOCIATE_TIME + DHCP_TIME
+        stderr = self.fixtures['bound']
+        address = self.modules['backends'].bound_ip_re.search(
+            stderr.decode()).group('ip_address')
+        # The address shows up on the interface as dhclient reports it
+        asyncio.get_event_loop().call_later(
+            done - .001, self._joined, ssid,
+            address_message(INTERFACE_INDEX, address))
+        return ReplayProcess(output(done, 'err', stderr) +
+                             [(done, 'exit', b'0')])
+
+    def _joined(self, ssid, message):
+        # The access point may have gone while dhclient was asking
+        if ssid in self.access_points.down:
+            return
+        self.joined = ssid
+        self.monitor.feed(message)
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.client.start(INTERFACE))
+
+    async def stop(self):
+        self.client.stop()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.wait([self.task])
+
+
+class Simulation():
+    """The virtual-time loop, the gateway and the sensors of one run."""
+
+    def __init__(self, args):
+        self.args = args
+        self.loop = VirtualTimeLoop()
+        asyncio.set_event_loop(self.loop)
+        self.rng = random.Random(args.seed)
+        # sensor_client draws its backoff from the shared generator
+        random.seed(args.seed)
+        self.clock = VirtualClock(self.loop)
+
+        import sessions
+        import wifi
+
+        use_clock([sys.modules[name] for name in package_modules()
+                   if name in sys.modules], self.clock)
+
+        self.fixtures = {'iwlist': read_fixture('iwlist', args.scan),
+                         'bound': read_fixture('ifup', 'bound.txt'),
+                         'no_offers': read_fixture('ifup', 'no_offers.txt')}
+        self.access_points = AccessPoints(
+            (ssid, wifi._derive_psk(ssid, args.password))
+            for ssid in [args.ssid, args.backup]
+            if ssid is not None)
+
+        self.air = Air(args.channel, args.occupancy, self.rng)
+        self.scheduler = sessions.SessionScheduler(self.air)
+        self.gateway = Gateway(self.scheduler)
+        sys.modules['gateway_client'] = types.SimpleNamespace(
+            client=self.gateway)
+
+        self.sensors = []
+        self.boot_times = {}
+
+    def add_sensors(self, folder):
+        for i in range(self.args.sensors):
+            hostname = 'sensor-{:03d}'.format(i)
+            loss = min(.95, self.rng.uniform(0, 2 * self.args.loss))
+            sensor = Sensor(hostname, loss, os.path.join(folder, hostname),
+                            self.fixtures, self.access_points)
+            use_clock(sensor.modules.values(), self.clock)
+            self.sensors.append(sensor)
+            self.boot_times[hostname] = self.rng.uniform(
+                0, self.args.boot_spread)
+        self.air.sensors = self.sensors
+
+    def boot(self):
+        for sensor in self.sensors:
+            self.loop.call_later(self.boot_times[sensor.hostname],
+                                 sensor.start)
+
+    async def stop(self):
+        await asyncio.gather(*[s.stop() for s in self.sensors])
+        if self.scheduler._task is not None:
+            await self.scheduler._task
+
+    def run(self, coroutine):
+        """Run coroutine in a folder for the sensors' files. Returns its
+        result and the wall-clock seconds it took."""
+        with tempfile.TemporaryDirectory() as folder:
+            self.add_sensors(folder)
+            started = time.perf_counter()
+            result = self.loop.run_until_complete(coroutine)
+            wall = time.perf_counter() - started
+        self.loop.close()
+        return result, wall
+
+    def subprocesses(self):
+        calls = collections.Counter()
+        for sensor in self.sensors:
+            calls.update(sensor.executor.commands)
+
+        return [('subprocesses', collections.OrderedDict(sorted(
+                    calls.items()))),
+                ('subprocesses_per_sensor',
+                 round(sum(calls.values()) / self.args.sensors, 2))]
+
+
+def summary(values):
+    return collections.OrderedDict(
+        (name, None if value is None else round(value, 3))
+        for name, value in (
+            ('mean', sum(values) / len(values) if values else None),
+            ('p50', percentile(values, 50)),
+            ('p90', percentile(values, 90)),
+            ('p99', percentile(values, 99)),
+            ('max', percentile(values, 100))))
+
+
+def loss_policy(args, policy):
+    import fec
+
+    if policy == 'fixed':
+        return fec.FixedLoss(args.fixed_loss)
+    return fec.AdaptiveLoss()
+
+
+def simulate(args, policy='adaptive'):
+    """Provision every sensor through a broadcast."""
+    import sessions
+
+    sim = Simulation(args)
+    loop = sim.loop
+    finished = loop.create_future()
+
+    async def on_finished(session):
+        if not finished.done():
+            finished.set_result(session)
+
+    sim.scheduler.on_finished = on_finished
+    session = sessions.BroadcastSession(args.ssid, args.password,
+                                        args.sensors,
+                                        loss=loss_policy(args, policy))
+
+    async def run():
+        sim.scheduler.add(session)
+        sim.boot()
+        try:
+            await asyncio.wait_for(asyncio.shield(finished), args.timeout)
+        except asyncio.TimeoutError:
+            sim.scheduler.stop(session)
+        end = loop.time()
+        await sim.stop()
+        return end
+
+    end, wall = sim.run(run())
+    gateway = sim.gateway
+    provision_times = [t - sim.boot_times[hostname]
+                       for hostname, t in gateway.provisioned.items()]
+    times = summary(provision_times)
+    del times['mean']
+    everyone = len(gateway.provisioned) == args.sensors
+
+    return collections.OrderedDict([
+        ('seed', args.seed),
+        ('policy', policy),
+        ('sensors', args.sensors),
+        ('provisioned', len(gateway.provisioned)),
+        ('time_to_all_sensors',
+         round(max(gateway.provisioned.values()), 3) if everyone else None),
+        ('loss', args.loss),
+        ('occupancy', args.occupancy),
+        ('channel', args.channel),
+        ('virtual_seconds', round(end, 3)),
+        ('wall_seconds', round(wall, 3)),
+        ('time_to_provision', times),
+        ('rounds', session.rounds),
+        ('airtime_seconds', round(sim.air.airtime, 3)),
+        ('frames', sim.air.frames),
+        ('final_possible_loss', round(session.loss.possible_loss, 2)),
+        ('pings', gateway.pings),
+    ] + sim.subprocesses())
+
+
+def simulate_flaps(args):
+    """Take the access point away and back while sensors are connected."""
+    sim = Simulation(args)
+    loop = sim.loop
+    trace = read_trace(args.trace) if args.trace else make_trace(args,
+                                                                 sim.rng)
+
+    def apply(event):
+        for sensor in sim.sensors:
+            if event == 'down':
+                sensor.network_down(args.ssid)
+            else:
+                sensor.network_up(args.ssid)
+        if event == 'down':
+            sim.access_points.down.add(args.ssid)
+        else:
+            sim.access_points.down.discard(args.ssid)
+
+    def offline():
+        return [s for s in sim.sensors
+                if not s.monitor.addresses.get(INTERFACE)]
+
+    async def run():
+        for sensor in sim.sensors:
+            await sensor.provision(args.ssid, args.password, args.backup)
+        sim.boot()
+        for at, event in trace:
+            loop.call_at(at, apply, event)
+
+        last = trace[-1][0] if trace else 0
+        await asyncio.sleep(max(last, args.boot_spread))
+        while offline() and loop.time() < last + args.timeout:
+            await asyncio.sleep(1)
+        end = loop.time()
+        await sim.stop()
+        return end
+
+    end, wall = sim.run(run())
+
+    # Each outage runs from a down event to the following up event
+    outages = []
+    for at, event in trace:
+        if event == 'down':
+            outages.append([at, None])
+        elif outages and outages[-1][1] is None:
+            outages[-1][1] = at
+
+    time_offline = []
+    time_to_reconnect = []
+    for index, (down, up) in enumerate(outages):
+        next_down = (outages[index + 1][0] if index + 1 < len(outages)
+                     else float('inf'))
+        for sensor in sim.sensors:
+            back = [t for t in sensor.addresses_added if down <= t < next_down]
+            if back:
+                time_offline.append(back[0] - down)
+                # Sensors that roamed to the backup did not wait for it
+                if up is not None and back[0] >= up:
+                    time_to_reconnect.append(back[0] - up)
+
+    recover_times = [t for s in sim.sensors if s.client.connection
+                     for t in s.client.connection.recover_times]
+
+    return collections.OrderedDict([
+        ('seed', args.seed),
+        ('sensors', args.sensors),
+        ('outages', len(outages)),
+        ('backup', args.backup),
+        ('reconnected', len(time_offline)),
+        ('on_backup', sum(1 for s in sim.sensors
+                          if args.backup and s.joined == args.backup)),
+        ('virtual_seconds', round(end, 3)),
+        ('wall_seconds', round(wall, 3)),
+        ('time_offline', summary(time_offline)),
+        ('time_to_reconnect', summary(time_to_reconnect)),
+        ('mean_time_to_recover',
+         round(sum(recover_times) / len(recover_times), 3)
+         if recover_times else None),
+    ] + sim.subprocesses())
+
+
+def report(result):
+    times = result['time_to_provision']
+    print('{provisioned}/{sensors} sensors provisioned in {virtual_seconds}s '
+          'of virtual time ({wall_seconds}s real)'.format(**result))
+    print('{policy} loss policy: all sensors in after {time_to_all_sensors}s'
+          .format(**result))
+    if times['p50'] is not None:
+        print('time to provision from boot: p50 {p50}s  p90 {p90}s  '
+              'p99 {p99}s  max {max}s'.format(**times))
+    print('broadcast: {rounds} rounds, {frames} frames, {airtime_seconds}s '
+          'of airtime, final possible loss {final_possible_loss}'
+          .format(**result))
+    print('subprocesses: {} ({} per sensor)'.format(
+        ', '.join('{} {}'.format(name, count)
+                  for name, count in result['subprocesses'].items()),
+        result['subprocesses_per_sensor']))
+
+
+def report_flaps(result):
+    print('{sensors} sensors, {outages} outages: {reconnected} reconnections '
+          'in {virtual_seconds}s of virtual time ({wall_seconds}s real)'
+          .format(**result))
+    for name, label in [('time_offline', 'offline per outage'),
+                        ('time_to_reconnect', 'reconnect after AP back')]:
+        times = result[name]
+        if times['mean'] is not None:
+            print('{}: mean {mean}s  p50 {p50}s  p90 {p90}s  max {max}s'
+                  .format(label, **times))
+    print('mean time to recover (sensor_client): {}s'.format(
+        result['mean_time_to_recover']))
+    if result['backup']:
+        print('on {backup} at the end: {on_backup}'.format(**result))
+    print('subprocesses: {} ({} per sensor)'.format(
+        ', '.join('{} {}'.format(name, count)
+                  for name, count in result['subprocesses'].items()),
+        result['subprocesses_per_sensor']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sensors', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--loss', type=float, default=.2,
+                        help="mean frame loss rate of the sensors")
+    parser.add_argument('--occupancy', type=float, default=.3,
+                        help="share of time the channel is busy with "
+                             "other traffic")
+    parser.add_argument('--channel', type=int, default=6,
+                        help="channel the gateway broadcasts on")
+    parser.add_argument('--boot-spread', type=float, default=30,
+                        help="sensors boot at random within this many "
+                             "seconds")
+    parser.add_argument('--timeout', type=float, default=3600,
+                        help="virtual seconds before giving up")
+    parser.add_argument('--scan', default='home.txt',
+                        help="iwlist fixture the sensors see")
+    parser.add_argument('--ssid', default='EHIE-Lab')
+    parser.add_argument('--password', default='secret123')
+    parser.add_argument('--policy', nargs='+', default=['adaptive'],
+                        choices=['adaptive', 'fixed'],
+                        help="how the gateway sets the FEC redundancy")
+    parser.add_argument('--fixed-loss', type=float, default=.8,
+                        help="expected loss rate of the fixed policy")
+    parser.add_argument('--flaps', type=int, default=0,
+                        help="simulate this many access point outages "
+                             "instead of provisioning")
+    parser.add_argument('--outage', type=float, default=60,
+                        help="mean length of an outage in seconds")
+    parser.add_argument('--flap-interval', type=float, default=600,
+                        help="seconds between outages")
+    parser.add_argument('--trace',
+                        help="replay the outages in this link-flap trace")
+    parser.add_argument('--backup',
+                        help="known network that stays up during outages")
+    parser.add_argument('--settings', help="settings file to simulate with")
+    parser.add_argument('--json', action='store_true',
+                        help="print the results as JSON")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else
+                        logging.WARNING)
+
+    # Modules read their settings when they are imported
+    if args.settings:
+        os.environ['WIFI_CONNECT_SETTINGS'] = os.path.abspath(args.settings)
+
+    if args.flaps or args.trace:
+        result = simulate_flaps(args)
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            report_flaps(result)
+        return
+
+    results = [simulate(args, policy) for policy in args.policy]
+    if args.json:
+        print(json.dumps(results[0] if len(results) == 1 else results,
+                         indent=2))
+        return
+
+    for index, result in enumerate(results):
+        if index:
+            print()
+        report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Socket.io messages and server CPU with many dashboards watching a
+broadcast.
+
+--dashboards simulated clients (tests/socketio_clients.py) watch a
+broadcast while --sensors sensors are discovered over --duration
+seconds. Without coalescing, each discovery sends the whole found set to
+every dashboard, as check_for_sensors used to do for the one page that
+started the broadcast. With the publisher, dashboards share a room and
+get the new sensors every PUBLISH_INTERVAL.
+
+    python bench/socketio_fanout.py --dashboards 500 --sensors 200
+
+Needs python-socketio, as the gateway does.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import publisher  # noqa: E402
+
+from socketio_clients import Dashboards  # noqa: E402
+
+ROOM = 'session-bench'
+
+
+async def uncoalesced(sio, sensors, interval):
+    found = []
+    for sensor in sensors:
+        found.append(sensor)
+        await sio.emit('broadcast-update', {'sensors': list(found)},
+                       room=ROOM)
+        await asyncio.sleep(interval)
+
+
+async def coalesced(sio, sensors, interval):
+    updates = publisher.Publisher(sio)
+    for sensor in sensors:
+        updates.add(ROOM, 'broadcast-update', 'sensors', [sensor])
+        await asyncio.sleep(interval)
+    await updates.flush()
+
+
+async def measure(run, args):
+    import socketio
+
+    sio = socketio.AsyncServer()
+    dashboards = Dashboards(sio)
+    sio.eio.send = dashboards.send
+    await dashboards.connect(args.dashboards)
+    for sid in dashboards.sids:
+        sio.enter_room(sid, ROOM)
+
+    sensors = ['sensor-{}'.format(i) for i in range(args.sensors)]
+    begin = time.process_time()
+    await run(sio, sensors, args.duration / args.sensors)
+    cpu = time.process_time() - begin
+    return dashboards.messages, dashboards.size, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dashboards', type=int, default=300)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=2,
+                        help="seconds over which the sensors are found")
+    args = parser.parse_args()
+
+    try:
+        import socketio  # noqa: F401
+    except ImportError as e:
+        raise SystemExit('Needs python-socketio: {}'.format(e))
+
+    loop = asyncio.get_event_loop()
+    for name, run in [('uncoalesced', uncoalesced),
+                      ('publisher', coalesced)]:
+        messages, size, cpu = loop.run_until_complete(measure(run, args))
+        print('{:12} {:7} messages {:8} KB  {:7.3f}s CPU'.format(
+            name, messages, size // 1024, cpu))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Sensor startup time, with python -X importtime reporting.
+
+Each stage is imported in a fresh interpreter, --repeat times, and the
+median wall time is reported against a bare interpreter. The radio loop
+is what the sensor imports before sensor_client.start() runs up to its
+first wait; the web server is what it imports after. Then one run with
+-X importtime (Python 3.7 and later) lists the slowest imports of each
+stage by cumulative time, and whether aiohttp or socketio were loaded.
+
+    python bench/startup_time.py --repeat 10 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+PACKAGE = os.path.join(ROOT, 'wifi_connect')
+
+STAGES = [('interpreter', []),
+          ('radio loop', ['logs', 'settings', 'wifi', 'sensor_client']),
+          ('web server', ['logs', 'settings', 'wifi', 'sensor_client',
+                          'aiohttp.web', 'sensor_server'])]
+WEB = ('aiohttp', 'socketio')
+
+
+def command(modules, importtime=False):
+    code = 'import sys; sys.path.insert(0, {!r})'.format(PACKAGE)
+    for module in modules:
+        code += '; import {}'.format(module)
+    options = ['-X', 'importtime'] if importtime else []
+    return [sys.executable] + options + ['-c', code]
+
+
+def wall_time(modules, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command(modules), check=True, cwd=PACKAGE,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def import_times(modules):
+    """(cumulative microseconds, module, nested) for every import, from
+    -X importtime."""
+    result = subprocess.run(command(modules, importtime=True), cwd=PACKAGE,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, check=True)
+    times = []
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Imports made by another import are indented under it
+        name = name[1:]
+        times.append((int(cumulative), name.strip(), name.startswith(' ')))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10,
+                        help="slowest imports to list for each stage")
+    args = parser.parse_args()
+
+    stages = []
+    for name, modules in STAGES:
+        try:
+            stages.append((name, modules, wall_time(modules, args.repeat)))
+        except subprocess.CalledProcessError:
+            print('{:12} cannot be imported here, skipped'.format(name))
+    for name, modules, elapsed in stages:
+        print('{:12} {:8.1f} ms'.format(name, elapsed * 1000))
+
+    if sys.version_info < (3, 7):
+        print('-X importtime needs Python 3.7 or later')
+        return
+
+    for name, modules, _ in stages[1:]:
+        times = import_times(modules)
+        loaded = [module for _, module, _ in times if module in WEB]
+        print('\n{}: {:.1f} ms of imports, {}'.format(
+            name, sum(t for t, _, nested in times if not nested) / 1000,
+            'loads ' + ' and '.join(loaded) if loaded else
+            'without ' + ' or '.join(WEB)))
+        for cumulative, module, _ in sorted(times, reverse=True)[:args.top]:
+            print('  {:8.1f} ms  {}'.format(cumulative / 1000, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Requests per second and bytes sent for the sensor's page and static
+files.
+
+A browser loading the page fetches the index page and the three static
+files it links. Both ways of serving them run on localhost: before is
+what the apps did before the asset store, a blocking open() for the
+index page and aiohttp's static route for the rest; store is
+assets.AssetStore. The first visit sends only Accept-Encoding, the
+revisit also sends the ETags the first visit got, as a browser
+revalidating its cache does. The client runs in the same process, so
+the store's first visit also pays for decompressing what it was sent.
+
+    python bench/static_serve.py --loads 200 --concurrency 10
+
+Needs aiohttp, as the apps do.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+STATIC = os.path.join(ROOT, 'static')
+PAGE = ['/', '/static/bootstrap.min.css', '/static/jquery-3.1.1.min.js',
+        '/static/socket.io.min.js']
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+
+def before_app():
+    from aiohttp import web
+
+    async def index(request):
+        with open(os.path.join(STATIC, 'sensor-index.html')) as f:
+            return web.Response(text=f.read(), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/', index)
+    app.router.add_static('/static', STATIC)
+    return app
+
+
+def store_app():
+    from aiohttp import web
+    import assets
+
+    store = assets.AssetStore(STATIC)
+
+    async def index(request):
+        return await store.respond(request, 'sensor-index.html')
+
+    app = web.Application()
+    app.router.add_get('/', index)
+    app.router.add_get('/static/{name}', store.handle)
+    return app
+
+
+async def fetch(session, url, etags):
+    headers = {'Accept-Encoding': ACCEPT_ENCODING}
+    if url in etags:
+        headers['If-None-Match'] = etags[url]
+    async with session.get(url, headers=headers) as response:
+        body = await response.read()
+        # The body is decompressed already, what went over the wire is
+        # in Content-Length
+        size = int(response.headers.get('Content-Length', len(body)))
+        return response.headers.get('ETag'), size
+
+
+async def load_pages(base, loads, concurrency, etags):
+    import aiohttp
+
+    sent = 0
+    pending = list(range(loads))
+    seen = {}
+
+    async def browser(session):
+        nonlocal sent
+        while pending:
+            pending.pop()
+            for path in PAGE:
+                etag, size = await fetch(session, base + path, etags)
+                sent += size
+                if etag is not None:
+                    seen[base + path] = etag
+
+    with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[browser(session)
+                               for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return elapsed, sent, seen
+
+
+async def measure(app, args):
+    loop = asyncio.get_event_loop()
+    handler = app.make_handler()
+    server = await loop.create_server(handler, '127.0.0.1', 0)
+    base = 'http://127.0.0.1:{}'.format(server.sockets[0].getsockname()[1])
+    try:
+        # Files are read (and compressed) on their first request
+        await load_pages(base, 1, 1, {})
+        results = []
+        etags = {}
+        for _ in ('first visit', 'revisit'):
+            elapsed, sent, etags = await load_pages(base, args.loads,
+                                                    args.concurrency, etags)
+            results.append((args.loads * len(PAGE) / elapsed,
+                            sent / args.loads))
+        return results
+    finally:
+        server.close()
+        await server.wait_closed()
+        await handler.finish_connections(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--loads', type=int, default=100,
+                        help="page loads for each visit")
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help="browsers loading at the same time")
+    args = parser.parse_args()
+
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError as e:
+        raise SystemExit('Needs aiohttp: {}'.format(e))
+
+    loop = asyncio.get_event_loop()
+    for name, make_app in [('before', before_app), ('store', store_app)]:
+        results = loop.run_until_complete(measure(make_app(), args))
+        for visit, (rate, size) in zip(['first visit', 'revisit'], results):
+            print('{:7} {:12} {:8.0f} requests/s  {:8.1f} KB per page load'
+                  .format(name, visit, rate, size / 1024))
+
+
+if __name__ == '__main__':
+    main()
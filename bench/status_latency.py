@@ -0,0 +1,81 @@
+"""Latency of the status reads the sensor web UI makes.
+
+wifi.get_ssid and wifi.interface_configured answer the wifi-get and
+wifi-status events. They are timed against an interfaces file that
+sources --files files, in three ways: cached is the store as it runs,
+stat checks every call (CHECK_TIME 0), and uncached parses every file
+on each call, as the sensor did before the store.
+
+    python bench/status_latency.py --files 20 --repeat 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, os.path.join(ROOT, 'wifi_connect'))
+
+import interfaces  # noqa: E402
+import wifi  # noqa: E402
+
+INTERFACE = 'wlan0'
+
+
+def write_config(folder, files):
+    sourced = os.path.join(folder, 'interfaces.d')
+    os.mkdir(sourced)
+    with open(os.path.join(folder, 'interfaces'), 'w') as f:
+        f.write('auto lo\niface lo inet loopback\n\n'
+                'source {}/*.cfg\n'.format(sourced))
+    for i in range(files):
+        name = INTERFACE if i == 0 else 'eth{}'.format(i)
+        with open(os.path.join(sourced, '{}.cfg'.format(name)), 'w') as f:
+            f.write('auto {0}\niface {0} inet dhcp\n'
+                    '    wpa-ssid "EHIE-Lab"\n'
+                    '    wpa-psk  "{1}"\n'.format(name, 'ab' * 32))
+    return os.path.join(folder, 'interfaces')
+
+
+async def status():
+    await wifi.get_ssid(INTERFACE)
+    await wifi.interface_configured(INTERFACE)
+
+
+async def measure(repeat, force):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if force:
+            interfaces.store.refresh(force=True)
+        await status()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], times[int(len(times) * .99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, default=10,
+                        help="files sourced by the interfaces file")
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as folder:
+        interfaces.store = interfaces.InterfaceStore(
+            write_config(folder, args.files))
+        for name, check_time, force in [('cached', 1, False),
+                                        ('stat', 0, False),
+                                        ('uncached', 1, True)]:
+            interfaces.CHECK_TIME = check_time
+            p50, p99 = loop.run_until_complete(measure(args.repeat, force))
+            print('{:10} p50 {:8.1f} us  p99 {:8.1f} us'.format(
+                name, p50 * 1e6, p99 * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(TESTS, 'fixtures')
+
+# The modules import each other as top-level names, as when the package
+# folder is run with `python wifi_connect`
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS), 'wifi_connect'))
+os.environ.pop('WIFI_CONNECT_SETTINGS', None)
+
+
+def fixture_path(*parts):
+    return os.path.join(FIXTURES, *parts)
+
+
+def read_fixture(*parts):
+    with open(fixture_path(*parts), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def loop():
+    # Module singletons bind to the default loop when they are created, so
+    # every test shares it
+    return asyncio.get_event_loop()
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    """Replace the shared runner with one that records commands."""
+    import runner
+
+    fake = runner.FakeExecutor()
+    monkeypatch.setattr(runner, 'executor', fake)
+    return fake
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    """Link monitor fed by the test instead of a netlink socket, with
+    wlan0 as interface index 3."""
+    import linkstate
+
+    fake = linkstate.LinkMonitor()
+    fake.active = True
+    fake.names[3] = 'wlan0'
+    monkeypatch.setattr(linkstate, 'monitor', fake)
+    return fake
@@ -0,0 +1,56 @@
+"""Raw rtnetlink messages for feeding linkstate.LinkMonitor."""
+import socket
+
+import linkstate
+
+
+def address_message(index, address, new=True):
+    """Raw rtnetlink message adding (or removing) an IPv4 address."""
+    attribute = linkstate.RTATTR.pack(linkstate.RTATTR.size + 4,
+                                      linkstate.IFA_LOCAL)
+    payload = (linkstate.IFADDRMSG.pack(socket.AF_INET, 24, 0, 0, index) +
+               attribute + socket.inet_aton(address))
+    msg_type = linkstate.RTM_NEWADDR if new else linkstate.RTM_DELADDR
+    return linkstate.NLMSG_HEADER.pack(
+        linkstate.NLMSG_HEADER.size + len(payload), msg_type, 0, 0,
+        0) + payload
+
+
+
+def link_message(index, name, up=True, new=True):
+    """Raw rtnetlink message for a link that is up or down."""
+    flags = linkstate.IFF_UP | linkstate.IFF_LOWER_UP if up else 0
+    name = name.encode() + b'\0'
+    attribute = linkstate.RTATTR.pack(linkstate.RTATTR.size + len(name),
+                                      linkstate.IFLA_IFNAME) + name
+    attribute += b'\0' * (linkstate._align(len(attribute)) - len(attribute))
+    payload = linkstate.IFINFOMSG.pack(socket.AF_UNSPEC, 1, index, flags,
+                                       0) + attribute
+    msg_type = linkstate.RTM_NEWLINK if new else linkstate.RTM_DELLINK
+    return linkstate.NLMSG_HEADER.pack(
+        linkstate.NLMSG_HEADER.size + len(payload), msg_type, 0, 0,
+        0) + payload
+
+
+def done_message():
+    return linkstate.NLMSG_HEADER.pack(linkstate.NLMSG_HEADER.size,
+                                       linkstate.NLMSG_DONE, 0, 0, 0)
+
+
+class DumpSocket():
+    """Netlink socket that answers dump requests with canned messages.
+
+    dumps maps RTM_GETLINK and RTM_GETADDR to the messages returned.
+    """
+
+    def __init__(self, dumps):
+        self.dumps = dumps
+        self._replies = []
+
+    def send(self, data):
+        _, msg_type, _, _, _ = linkstate.NLMSG_HEADER.unpack_from(data)
+        self._replies.append(b''.join(self.dumps.get(msg_type, [])) +
+                             done_message())
+
+    def recv(self, size):
+        return self._replies.pop(0)
@@ -0,0 +1,105 @@
+"""Replay recorded receive_wifi.py output in place of the real receiver.
+
+A recording has one line per chunk of output the receiver wrote:
+
+    <seconds since start> <out|err> <text>
+    <seconds since start> exit <returncode>
+
+Frames are decoded inside receive_wifi.py, so what is replayed is its
+output: progress on stderr and credentials on stdout, with the timing
+they were written at. Without an exit line the receiver keeps running
+until it is killed.
+"""
+import asyncio
+
+import runner
+
+
+def load(filename):
+    with open(filename, 'rb') as f:
+        return parse(f.read())
+
+
+def parse(data):
+    events = []
+    for line in data.splitlines():
+        if not line.strip() or line.startswith(b'#'):
+            continue
+        at, kind, text = (line.split(b' ', 2) + [b''])[:3]
+        events.append((float(at), kind.decode(), text))
+    return events
+
+
+class ReplayProcess():
+    """Stand-in for the receiver process, writing a recording as it plays.
+
+    Times are divided by speed; with speed=None everything is written at
+    once.
+    """
+
+    def __init__(self, events, speed=1, limit=2 ** 16):
+        self.pid = 0
+        self.returncode = None
+        self.stdin = None
+        self.stdout = asyncio.StreamReader(limit=limit)
+        self.stderr = asyncio.StreamReader(limit=limit)
+        loop = asyncio.get_event_loop()
+        self._exited = loop.create_future()
+        self._events = sorted(events, key=lambda event: event[0])
+        self._next = 0
+        self._handles = []
+        for index, (at, _, _) in enumerate(self._events):
+            delay = 0 if not speed else at / speed
+            self._handles.append(loop.call_later(delay, self._play, index))
+
+    def _play(self, index):
+        # Timers due at the same time may fire in any order, so everything
+        # before index is played first
+        while self._next <= index and self.returncode is None:
+            _, kind, text = self._events[self._next]
+            self._next += 1
+            if kind == 'exit':
+                self._exit(int(text))
+            elif kind == 'out':
+                self.stdout.feed_data(text + b'\n')
+            else:
+                self.stderr.feed_data(text + b'\n')
+
+    def _exit(self, returncode):
+        self.returncode = returncode
+        for handle in self._handles:
+            handle.cancel()
+        self.stdout.feed_eof()
+        self.stderr.feed_eof()
+        self._exited.set_result(returncode)
+
+    def kill(self):
+        if self.returncode is None:
+            self._exit(-9)
+
+    async def wait(self):
+        return await asyncio.shield(self._exited)
+
+
+class ReplayExecutor(runner.FakeExecutor):
+    """FakeExecutor that starts receive_wifi as a replay of recordings.
+
+    Each start plays the next recording, the last one is played again once
+    they run out.
+    """
+
+    def __init__(self, recordings, speed=1, responses=None):
+        super().__init__(responses)
+        self.recordings = list(recordings)
+        self.speed = speed
+        self.processes = []
+
+    async def _create(self, name, args, stdin):
+        if name != 'receive_wifi':
+            return await super()._create(name, args, stdin)
+
+        self.calls.append(args)
+        index = min(len(self.processes), len(self.recordings) - 1)
+        proc = ReplayProcess(self.recordings[index], self.speed)
+        self.processes.append(proc)
+        return proc
@@ -0,0 +1,48 @@
+"""Simulated socket.io clients, for load tests of the web apps.
+
+The clients are attached straight to the server's engine.io layer: events
+from a client go through the socket.io server as if they came over a
+transport, and packets sent to a client are recorded instead of being
+written to a socket. This keeps hundreds of clients cheap while the
+server does all of its own work for each of them.
+"""
+from collections import defaultdict
+import json
+
+EVENT = '2'
+
+
+class Dashboards():
+    def __init__(self, sio):
+        self.sio = sio
+        self.sids = []
+        self.received = defaultdict(list)
+
+    async def send(self, sid, data, binary=False):
+        """Stands in for sio.eio.send."""
+        self.received[sid].append(data)
+
+    async def connect(self, count):
+        for i in range(len(self.sids), len(self.sids) + count):
+            sid = 'dashboard-{}'.format(i)
+            self.sids.append(sid)
+            await self.sio._handle_eio_connect(sid, {})
+
+    async def emit(self, sid, event, data=None):
+        await self.sio._handle_eio_message(
+            sid, EVENT + json.dumps([event] if data is None
+                                    else [event, data]))
+
+    def events(self, sid):
+        """(event, data) for every event sid has been sent."""
+        return [tuple(json.loads(packet[1:]))
+                for packet in self.received[sid] if packet.startswith(EVENT)]
+
+    @property
+    def messages(self):
+        return sum(len(self.events(sid)) for sid in self.sids)
+
+    @property
+    def size(self):
+        return sum(len(packet) for packets in self.received.values()
+                   for packet in packets)
@@ -0,0 +1,118 @@
+import gzip
+import types
+
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+
+import assets  # noqa: E402
+
+SCRIPT = b'function hello() { return "hello"; }\n' * 50
+
+
+def request(**headers):
+    return types.SimpleNamespace(headers=headers)
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / 'app.js').write_bytes(SCRIPT)
+    (tmp_path / 'lib-1.2.3.min.js').write_bytes(SCRIPT)
+    (tmp_path / 'tiny.txt').write_bytes(b'hi')
+    return assets.AssetStore(str(tmp_path), cache_size=2)
+
+
+def respond(loop, store, name, **headers):
+    return loop.run_until_complete(store.respond(request(**headers), name))
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', set()),
+    ('gzip, deflate, br', {'gzip', 'deflate', 'br'}),
+    ('GZIP;q=0.5, identity', {'gzip', 'identity'}),
+    ('br;q=0, gzip;q=1.0', {'gzip'}),
+    ('br; q=0.000, gzip', {'gzip'}),
+    ('gzip;q=0.01', {'gzip'}),
+])
+def test_accepted_encodings(header, expected):
+    assert assets.accepted_encodings(header) == expected
+
+
+def test_gzip(loop, store):
+    response = respond(loop, store, 'app.js', **{'Accept-Encoding': 'gzip'})
+
+    assert response.status == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.content_type.endswith('/javascript')
+    assert gzip.decompress(response.body) == SCRIPT
+    assert store.stats['bytes_sent'] == len(response.body)
+
+
+def test_identity(loop, store):
+    for headers in [{}, {'Accept-Encoding': 'gzip;q=0, deflate'}]:
+        response = respond(loop, store, 'app.js', **headers)
+
+        assert response.body == SCRIPT
+        assert 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.skipif(assets.brotli is None, reason="needs brotli")
+def test_brotli_is_preferred(loop, store):
+    response = respond(loop, store, 'app.js',
+                       **{'Accept-Encoding': 'gzip, br'})
+
+    assert response.headers['Content-Encoding'] == 'br'
+
+
+def test_encoding_only_when_smaller(loop, store):
+    response = respond(loop, store, 'tiny.txt', **{'Accept-Encoding': 'gzip'})
+
+    assert response.body == b'hi'
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_etag_per_encoding(loop, store):
+    plain = respond(loop, store, 'app.js')
+    gzipped = respond(loop, store, 'app.js', **{'Accept-Encoding': 'gzip'})
+
+    assert plain.headers['ETag'].endswith('-identity"')
+    assert gzipped.headers['ETag'].endswith('-gzip"')
+    assert plain.headers['ETag'][:17] == gzipped.headers['ETag'][:17]
+
+    # An ETag only matches the encoding it was sent with
+    response = respond(loop, store, 'app.js', **{
+        'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']})
+    assert response.status == 304
+    assert response.headers['ETag'] == gzipped.headers['ETag']
+    assert store.stats['not_modified'] == 1
+
+    response = respond(loop, store, 'app.js', **{
+        'If-None-Match': gzipped.headers['ETag']})
+    assert response.status == 200
+    assert response.body == SCRIPT
+
+
+def test_cache_control(loop, store):
+    assert respond(loop, store, 'app.js').headers['Cache-Control'] == \
+        assets.REVALIDATE
+    assert respond(loop, store, 'lib-1.2.3.min.js').headers[
+        'Cache-Control'] == assets.IMMUTABLE
+
+
+def test_assets_are_cached(loop, store):
+    for name in ['app.js', 'app.js', 'tiny.txt', 'app.js',
+                 'lib-1.2.3.min.js', 'tiny.txt']:
+        respond(loop, store, name)
+
+    # tiny.txt was the least recently used when the third file came in
+    assert store.stats['hits'] == 2
+    assert store.stats['misses'] == 4
+    assert list(store._cache) == ['lib-1.2.3.min.js', 'tiny.txt']
+
+
+@pytest.mark.parametrize('name', ['missing.js', '../secret', '.hidden', ''])
+def test_not_found(loop, store, name):
+    with pytest.raises(web.HTTPNotFound):
+        respond(loop, store, name)
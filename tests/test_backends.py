@@ -0,0 +1,179 @@
+import os
+import socket
+
+import pytest
+
+import backends
+import interfaces
+import runner
+
+from netlink import address_message
+from wpa_server import FakeWpaSupplicant
+
+WPA_CONFIG = '''auto wlan0
+iface wlan0 inet dhcp
+    wpa-ssid "EHIE-Lab"
+    wpa-psk "secret123"
+'''
+
+WEP_CONFIG = '''iface wlan0 inet dhcp
+    wireless-essid Printer
+    wireless-key s:12345
+'''
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = interfaces.InterfaceStore(str(tmp_path / 'interfaces'))
+    monkeypatch.setattr(interfaces, 'store', store)
+    return store
+
+
+def configure(store, text):
+    with open(store.interface_file, 'w') as f:
+        f.write(text)
+    store.refresh(force=True)
+
+
+@pytest.fixture
+def ctrl_dir(tmp_path):
+    path = tmp_path / 'ctrl'
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def wpa(loop, ctrl_dir, monitor, store):
+    configure(store, WPA_CONFIG)
+
+    def lease(ssid):
+        monitor.feed(address_message(3, '10.1.2.3'))
+
+    server = FakeWpaSupplicant(ctrl_dir, networks={'EHIE-Lab': 'secret123'},
+                               on_connected=lease)
+    server.start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def backend(ctrl_dir, monkeypatch):
+    monkeypatch.setattr(backends, 'ADDRESS_WAIT_TIME', .1)
+    monkeypatch.setattr(backends, 'ASSOCIATE_WAIT_TIME', .1)
+    monkeypatch.setattr(backends, 'REQUEST_WAIT_TIME', .1)
+    return backends.WpaSupplicantBackend(ctrl_dir)
+
+
+@pytest.fixture
+def ifup(executor):
+    executor.responses['ifup'] = runner.Result(
+        0, b'', b'DHCPACK of 10.0.0.9 from 10.0.0.1\n'
+                b'bound to 10.0.0.9 -- renewal in 1800 seconds.\n', False, 0)
+    return executor
+
+
+def test_connect(loop, wpa, backend, ifup):
+    address = loop.run_until_complete(backend.connect('wlan0'))
+
+    assert address == '10.1.2.3'
+    assert wpa.commands == [
+        'ATTACH', 'ADD_NETWORK', 'SET_NETWORK 0 ssid "EHIE-Lab"',
+        'SET_NETWORK 0 psk "secret123"', 'SELECT_NETWORK 0', 'DETACH']
+    assert ifup.calls == []
+
+
+def test_derived_psk_is_not_quoted(loop, wpa, backend, store):
+    psk = 'a' * 64
+    configure(store, WPA_CONFIG.replace('"secret123"', psk))
+    wpa.networks['EHIE-Lab'] = psk
+
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.1.2.3'
+    assert 'SET_NETWORK 0 psk {}'.format(psk) in wpa.commands
+
+
+def test_no_new_lease_falls_back(loop, wpa, backend, monitor, ifup):
+    # Associated, but the DHCP client holds on to the old network's lease
+    monitor.feed(address_message(3, '192.168.1.5'))
+    wpa.on_connected = None
+
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.0.0.9'
+    assert 'SELECT_NETWORK 0' in wpa.commands
+    assert ifup.calls == [('ifdown', 'wlan0'), ('ifup', 'wlan0')]
+
+
+def test_renewed_lease_is_returned(loop, wpa, backend, monitor):
+    # The new network's DHCP server hands out the address already held
+    monitor.feed(address_message(3, '10.1.2.3'))
+
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.1.2.3'
+
+
+def test_wrong_psk(loop, wpa, backend, ifup):
+    wpa.networks['EHIE-Lab'] = 'other-password'
+
+    assert loop.run_until_complete(backend.connect('wlan0')) is None
+    assert ifup.calls == []
+
+
+def test_old_network_is_removed(loop, wpa, backend):
+    loop.run_until_complete(backend.connect('wlan0'))
+    loop.run_until_complete(backend.connect('wlan0'))
+
+    assert 'REMOVE_NETWORK 0' in wpa.commands
+    assert 'SELECT_NETWORK 1' in wpa.commands
+    assert list(wpa.configs) == ['1']
+
+
+def test_stale_socket_falls_back(loop, ctrl_dir, store, backend, ifup):
+    configure(store, WPA_CONFIG)
+    # A socket file left behind by a wpa_supplicant that has exited
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale.bind(os.path.join(ctrl_dir, 'wlan0'))
+    stale.close()
+
+    assert backend.available('wlan0')
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.0.0.9'
+    assert ifup.calls == [('ifdown', 'wlan0'), ('ifup', 'wlan0')]
+
+
+def test_failed_request_falls_back(loop, wpa, backend, ifup):
+    wpa.fail.add('SET_NETWORK')
+
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.0.0.9'
+    assert ifup.calls == [('ifdown', 'wlan0'), ('ifup', 'wlan0')]
+
+
+def test_hung_supplicant_falls_back(loop, wpa, backend, ifup):
+    wpa.silent.add('ATTACH')
+
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.0.0.9'
+    assert wpa.commands == ['ATTACH']
+    assert len(ifup.calls) == 2
+
+
+def test_wep_uses_ifupdown(loop, wpa, backend, store, ifup, monkeypatch):
+    configure(store, WEP_CONFIG)
+    monkeypatch.setattr(backends, 'BACKENDS',
+                        [backend, backends.IfupdownBackend()])
+
+    assert not backend.available('wlan0')
+    assert backends.get_backend('wlan0').name == 'ifupdown'
+    # Even when asked for by name, WEP goes through ifupdown
+    assert loop.run_until_complete(backend.connect('wlan0')) == '10.0.0.9'
+    assert wpa.commands == []
+
+
+def test_available_needs_control_socket(ctrl_dir, store, backend):
+    configure(store, WPA_CONFIG)
+
+    assert not backend.available('wlan0')
+
+
+def test_get_backend(monkeypatch, wpa, backend):
+    monkeypatch.setattr(backends, 'BACKENDS',
+                        [backend, backends.IfupdownBackend()])
+
+    assert backends.get_backend('wlan0') is backend
+    assert backends.get_backend('wlan0', 'ifupdown').name == 'ifupdown'
+    with pytest.raises(ValueError):
+        backends.get_backend('wlan0', 'nm')
@@ -0,0 +1,137 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import broadcaster
+
+# Stands in for send_wifi.py: logs each round with the worker's pid
+SEND_WIFI = '''
+import os
+import subprocess
+import sys
+import time
+
+ssid = sys.argv[-2]
+print('sending ' + ssid)
+if ssid == 'fail':
+    sys.exit(3)
+if ssid == 'crash':
+    os._exit(1)
+if ssid == 'hang':
+    time.sleep(60)
+with open({log!r}, 'a') as f:
+    f.write('{{}} {{}}\\n'.format(os.getpid(), ' '.join(sys.argv[1:])))
+'''
+
+
+
+def find_python2():
+    # pyenv installs shims that exist but fail when 2.7 is not selected
+    for name in ('python2', 'python2.7'):
+        try:
+            subprocess.check_call([name, '-c', ''],
+                                  stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+            return name
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return None
+
+
+PYTHON2 = find_python2()
+
+
+@pytest.fixture
+def log(tmp_path):
+    return str(tmp_path / 'rounds.log')
+
+
+def make_sink(tmp_path, log, python=sys.executable):
+    script = tmp_path / 'send_wifi.py'
+    script.write_text(SEND_WIFI.format(log=log))
+    return broadcaster.WorkerSink(str(script), python=python)
+
+
+@pytest.fixture
+def sink(loop, tmp_path, log):
+    sink = make_sink(tmp_path, log)
+    yield sink
+    loop.run_until_complete(sink.close())
+
+
+def rounds(log):
+    if not os.path.exists(log):
+        return []
+    with open(log) as f:
+        return [line.split(' ', 1) for line in f.read().splitlines()]
+
+
+def test_rounds_share_one_worker(loop, sink, log):
+    loop.run_until_complete(sink.send('net', 'pass word', 0, .2))
+    loop.run_until_complete(sink.send('net', 'pass word', 1, .3))
+
+    (first_pid, first), (second_pid, second) = rounds(log)
+    assert first_pid == second_pid
+    assert first == '-l 0.2 -s 0 net pass word'
+    assert second == '-l 0.3 -s 1 net pass word'
+
+
+def test_failed_round_raises(loop, sink, log):
+    with pytest.raises(OSError, match='replied'):
+        loop.run_until_complete(sink.send('fail', 'password', 0, .2))
+
+    # The worker survives a failing round
+    loop.run_until_complete(sink.send('net', 'password', 0, .2))
+    loop.run_until_complete(sink.send('net', 'password', 1, .2))
+    (first_pid, _), (second_pid, _) = rounds(log)
+    assert first_pid == second_pid
+
+
+def test_worker_restarts_after_exit(loop, sink, log):
+    loop.run_until_complete(sink.send('net', 'password', 0, .2))
+    with pytest.raises(OSError, match='exited'):
+        loop.run_until_complete(sink.send('crash', 'password', 0, .2))
+    loop.run_until_complete(sink.send('net', 'password', 1, .2))
+
+    (first_pid, _), (second_pid, _) = rounds(log)
+    assert first_pid != second_pid
+
+
+def test_round_times_out(loop, sink, log, monkeypatch):
+    monkeypatch.setattr(broadcaster, 'ROUND_TIMEOUT', .5)
+
+    with pytest.raises(OSError, match='timed out'):
+        loop.run_until_complete(sink.send('hang', 'password', 0, .2))
+    loop.run_until_complete(sink.send('net', 'password', 0, .2))
+
+    assert len(rounds(log)) == 1
+
+
+def test_close(loop, sink):
+    loop.run_until_complete(sink.send('net', 'password', 0, .2))
+    proc = sink._proc
+
+    loop.run_until_complete(sink.close())
+
+    assert proc.returncode == 0
+    assert sink._proc is None
+
+
+@pytest.mark.skipif(PYTHON2 is None,
+                    reason="Python 2 is not installed")
+def test_python2_worker(loop, tmp_path, log):
+    sink = make_sink(tmp_path, log, python=PYTHON2)
+
+    async def send():
+        await sink.send('net', 'password', 0, .2)
+        with pytest.raises(OSError, match='replied'):
+            await sink.send('fail', 'password', 1, .2)
+        await sink.send('net', 'password', 1, .2)
+        await sink.close()
+
+    loop.run_until_complete(send())
+
+    (first_pid, _), (second_pid, _) = rounds(log)
+    assert first_pid == second_pid
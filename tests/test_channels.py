@@ -0,0 +1,104 @@
+import pytest
+
+import channels
+import wifi
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(channels, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def scheduler(clock):
+    return channels.ChannelScheduler(max_dwell=15, min_dwell=3,
+                                     half_life=100)
+
+
+def access_point(channel, signal=-50):
+    return wifi.Network('AP {}'.format(channel), 'wpa2', channel=channel,
+                        signal=signal)
+
+
+def test_default_order(scheduler):
+    assert scheduler.order() == list(range(1, 12))
+
+
+def test_order_by_score(scheduler):
+    scheduler.record_access_points([access_point(6), access_point(6),
+                                    access_point(11), access_point(3, -80),
+                                    access_point(None), access_point(14)])
+    scheduler.record_traffic(9)
+
+    # Weak access points, unknown channels and channels not swept are
+    # left out
+    assert scheduler.order()[:3] == [9, 6, 11]
+    assert scheduler.score(3) == 0
+    assert scheduler.score(14) == 0
+
+
+def test_scores_decay(scheduler, clock):
+    scheduler.record_traffic(1)
+    clock.now += 100
+    assert scheduler.score(1) == pytest.approx(channels.TRAFFIC_WEIGHT / 2)
+
+    scheduler.record_access_points([access_point(6)] * 6)
+    assert scheduler.order()[:2] == [6, 1]
+
+    clock.now += 100
+    scheduler.record_traffic(1)
+    assert scheduler.score(1) == pytest.approx(
+        channels.TRAFFIC_WEIGHT * 1.25)
+
+
+def test_split(scheduler):
+    scheduler.record_traffic(11)
+    scheduler.record_access_points([access_point(6)])
+
+    assert scheduler.split(1) == [[11, 6, 1, 2, 3, 4, 5, 7, 8, 9, 10]]
+    assert scheduler.split(3) == [[11, 2, 5, 9], [6, 3, 7, 10], [1, 4, 8]]
+
+
+def test_dwell_grows_with_failed_sweeps(scheduler):
+    dwells = []
+    for _ in range(5):
+        dwells.append(scheduler.dwell(1))
+        scheduler.record_failed_sweep()
+
+    assert dwells == [3, 6, 12, 15, 15]
+
+
+def test_full_dwell_where_gateway_was_heard(scheduler, clock):
+    scheduler.record_traffic(6)
+    assert scheduler.dwell(6) == 15
+    assert scheduler.dwell(1) == 3
+
+    # Until the traffic is old
+    clock.now += 150
+    assert scheduler.dwell(6) == 3
+
+
+def test_access_points_do_not_extend_dwell(scheduler):
+    scheduler.record_access_points([access_point(6)] * 20)
+
+    assert scheduler.order()[0] == 6
+    assert scheduler.dwell(6) == 3
+
+
+def test_traffic_resets_failed_sweeps(scheduler):
+    scheduler.record_failed_sweep()
+    scheduler.record_failed_sweep()
+    scheduler.record_traffic(6)
+
+    assert scheduler.failed_sweeps == 0
+    assert scheduler.dwell(1) == 3
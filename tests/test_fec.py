@@ -0,0 +1,79 @@
+import fec
+
+
+def stall(loss, rounds, found, expected=10):
+    for _ in range(rounds):
+        loss.round_finished(found, expected)
+
+
+def test_starts_low():
+    assert fec.AdaptiveLoss().possible_loss == fec.MIN_LOSS
+
+
+def test_stalled_rounds_raise_one_step():
+    loss = fec.AdaptiveLoss(min_loss=.2, step=.1, stall_rounds=4)
+    loss.round_finished(2, 10)
+
+    stall(loss, 3, 2)
+    assert loss.possible_loss == .2
+    stall(loss, 1, 2)
+    assert loss.possible_loss == .3
+    stall(loss, 4, 2)
+    assert loss.possible_loss == .4
+
+
+def test_new_sensor_resets_stall():
+    loss = fec.AdaptiveLoss(min_loss=.2, step=.1, stall_rounds=4)
+
+    stall(loss, 3, 0)
+    loss.round_finished(1, 10)
+    stall(loss, 3, 1)
+    assert loss.possible_loss == .2
+
+
+def test_faster_once_half_found():
+    loss = fec.AdaptiveLoss(min_loss=.2, step=.1, stall_rounds=4)
+    loss.round_finished(5, 10)
+
+    stall(loss, 2, 5)
+    assert loss.possible_loss == .3
+    stall(loss, 2, 5)
+    assert loss.possible_loss == .4
+
+
+def test_unknown_expected_does_not_speed_up():
+    loss = fec.AdaptiveLoss(min_loss=.2, step=.1, stall_rounds=4)
+    loss.round_finished(5, 0)
+
+    stall(loss, 2, 5, expected=0)
+    assert loss.possible_loss == .2
+
+
+def test_capped_at_max_loss():
+    loss = fec.AdaptiveLoss(min_loss=.2, max_loss=.5, step=.1,
+                            stall_rounds=1)
+
+    stall(loss, 10, 0)
+    assert loss.possible_loss == .5
+
+
+def test_reported_loss_sets_floor():
+    loss = fec.AdaptiveLoss(min_loss=.2)
+
+    loss.report_loss(.35)
+    assert loss.possible_loss == round(.35 + fec.FEEDBACK_MARGIN, 2)
+
+    # Lower reports never bring the level down
+    loss.report_loss(.1)
+    assert loss.possible_loss == .45
+
+    loss.report_loss(.95)
+    assert loss.possible_loss == fec.MAX_LOSS
+
+
+def test_fixed_loss():
+    loss = fec.FixedLoss(.5)
+
+    stall(loss, 10, 0)
+    loss.report_loss(.9)
+    assert loss.possible_loss == .5
@@ -0,0 +1,145 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+
+import gateway_client  # noqa: E402
+
+
+class StandInGateway():
+    """Local gateway answering /ping with the statuses it is given."""
+
+    def __init__(self, statuses=(200,), port=0):
+        self.statuses = list(statuses)
+        self.port = port
+        self.pings = []
+        self._server = None
+        self._handler = None
+
+    async def ping(self, request):
+        self.pings.append(dict(await request.post()))
+        status = self.statuses.pop(0) if len(self.statuses) > 1 \
+            else self.statuses[0]
+        return web.Response(status=status, text='OK')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/ping', self.ping)
+        self._handler = app.make_handler()
+        self._server = await asyncio.get_event_loop().create_server(
+            self._handler, '127.0.0.1', self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self._handler.finish_connections(.1)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/ping'.format(self.port)
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(gateway_client, 'RETRY_TIME', .01)
+    monkeypatch.setattr(gateway_client, 'MAX_RETRY_TIME', .05)
+
+
+@pytest.fixture
+def gateway(loop):
+    gateway = StandInGateway()
+    loop.run_until_complete(gateway.start())
+    yield gateway
+    loop.run_until_complete(gateway.close())
+
+
+@pytest.fixture
+def client(gateway):
+    client = gateway_client.GatewayClient(gateway.url)
+    yield client
+    client.close()
+
+
+def test_ping(loop, gateway, client):
+    assert loop.run_until_complete(client.ping(
+        'sensor-1', 'EHIE-Lab', signal=-52, channel=6, time_to_connect=None))
+
+    # Fields that are None are left out
+    assert gateway.pings == [{'sensor': 'sensor-1', 'ssid': 'EHIE-Lab',
+                              'signal': '-52', 'channel': '6'}]
+
+
+def test_session_is_reused(loop, gateway, client):
+    loop.run_until_complete(client.ping('sensor-1', 'EHIE-Lab'))
+    session = client.session
+    loop.run_until_complete(client.ping('sensor-1', 'EHIE-Lab'))
+
+    assert client.session is session
+    assert len(gateway.pings) == 2
+
+
+def test_retries_server_errors(loop, gateway, client):
+    gateway.statuses = [503, 500, 200]
+
+    assert loop.run_until_complete(client.ping('sensor-1', 'EHIE-Lab'))
+    assert len(gateway.pings) == 3
+
+
+def test_client_error_is_not_retried(loop, gateway, client):
+    gateway.statuses = [404]
+
+    assert not loop.run_until_complete(client.ping('sensor-1', 'EHIE-Lab'))
+    assert len(gateway.pings) == 1
+
+
+def test_retries_until_gateway_is_up(loop):
+    gateway = StandInGateway(port=unused_port())
+    client = gateway_client.GatewayClient(gateway.url)
+
+    async def ping():
+        # Refused until the gateway starts listening
+        loop.call_later(.2, asyncio.ensure_future, gateway.start())
+        return await client.ping('sensor-1', 'EHIE-Lab', deadline=5)
+
+    try:
+        assert loop.run_until_complete(ping())
+        assert len(gateway.pings) == 1
+    finally:
+        client.close()
+        loop.run_until_complete(gateway.close())
+
+
+def test_gives_up_at_deadline(loop, gateway, client):
+    gateway.statuses = [500]
+
+    start = time.monotonic()
+    assert not loop.run_until_complete(
+        client.ping('sensor-1', 'EHIE-Lab', deadline=.3))
+
+    assert time.monotonic() - start < .3 + gateway_client.MAX_RETRY_TIME
+    assert len(gateway.pings) > 1
+
+
+def test_network_changed_drops_session(loop, gateway, client, monkeypatch):
+    monkeypatch.setattr(gateway_client, 'client', client)
+    loop.run_until_complete(client.ping('sensor-1', 'EHIE-Lab'))
+    session = client.session
+
+    gateway_client.network_changed('wlan0', 'Other')
+
+    assert client._session is None
+    assert session.closed
+    # The next ping opens a new session
+    assert loop.run_until_complete(client.ping('sensor-1', 'Other'))
+    assert client.session is not session
@@ -0,0 +1,220 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip('aiohttp')
+from aiohttp import test_utils  # noqa: E402
+
+import broadcaster  # noqa: E402
+import gateway_server  # noqa: E402
+import roster  # noqa: E402
+
+from socketio_clients import Dashboards  # noqa: E402
+
+LOAD_SENSORS = 300
+LOAD_DASHBOARDS = 300
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    sink = broadcaster.FakeSink()
+    monkeypatch.setattr(gateway_server.scheduler, 'sink', sink)
+    monkeypatch.setattr(gateway_server.scheduler, 'wait_time', .01)
+    return sink
+
+
+@pytest.fixture
+def store(loop, monkeypatch, tmp_path):
+    store = roster.Roster(str(tmp_path / 'roster.db'))
+    loop.run_until_complete(store.open())
+    monkeypatch.setattr(roster, 'store', store)
+    return store
+
+
+@pytest.fixture
+def client(loop, sink, store):
+    client = test_utils.TestClient(gateway_server.app)
+    loop.run_until_complete(client.start_server())
+    yield client
+
+    scheduler = gateway_server.scheduler
+    for session in list(scheduler.sessions.values()):
+        scheduler.stop(session)
+    if scheduler._task is not None:
+        loop.run_until_complete(scheduler._task)
+    loop.run_until_complete(client.close())
+
+
+def start(loop, ssid, sensors=''):
+    loop.run_until_complete(gateway_server.start_broadcast(
+        'operator', {'ssid': ssid, 'password': 'secret123',
+                     'sensors': str(sensors)}))
+    return gateway_server.scheduler.route(ssid=ssid)
+
+
+async def ping(client, sensor, **fields):
+    fields['sensor'] = sensor
+    async with client.post('/ping', data=fields) as response:
+        assert response.status == 200
+        return await response.text()
+
+
+async def wait_until(predicate, timeout=5):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "Timed out"
+        await asyncio.sleep(.001)
+
+
+def test_ping_without_broadcast(loop, client):
+    text = loop.run_until_complete(ping(client, 'sensor-1'))
+    assert text == 'Not broadcasting'
+
+
+def test_ping_requires_sensor(loop, client):
+    start(loop, 'net', 1)
+
+    async def post():
+        async with client.post('/ping', data={'ssid': 'net'}) as response:
+            return await response.text()
+
+    assert loop.run_until_complete(post()) == 'Must have sensor field'
+
+
+def test_concurrent_pings_stop_broadcast(loop, client, sink, capsys):
+    """Hundreds of sensors pinging at once are all registered, and the
+    broadcast stops as soon as the last one is in."""
+    session = start(loop, 'load-test', LOAD_SENSORS)
+    scheduler = gateway_server.scheduler
+
+    async def load():
+        await wait_until(lambda: sink.rounds)
+        pings = [ping(client, 'sensor-{}'.format(i), ssid='load-test',
+                      signal='-60', channel='6', time_to_connect='4.2')
+                 for i in range(LOAD_SENSORS)]
+        begin = time.monotonic()
+        replies = await asyncio.gather(*pings)
+        answered = time.monotonic() - begin
+        await wait_until(lambda: session.id not in scheduler.sessions)
+        return replies, answered, time.monotonic() - begin
+
+    replies, answered, time_to_stop = loop.run_until_complete(load())
+
+    assert replies == ['Sensor has been added'] * LOAD_SENSORS
+    assert not session.running
+    assert len(session.found_sensors) == LOAD_SENSORS
+    # No more rounds go out once the last sensor is in
+    assert time_to_stop - answered < .5
+    with capsys.disabled():
+        print('\n{} concurrent pings answered in {:.3f}s, broadcast '
+              'stopped after {:.3f}s ({} rounds)'.format(
+                  LOAD_SENSORS, answered, time_to_stop, len(sink.rounds)))
+
+
+def test_duplicate_pings_count_once(loop, client):
+    session = start(loop, 'net', 2)
+
+    async def pings():
+        await ping(client, 'sensor-1', ssid='net')
+        return await ping(client, 'sensor-1', ssid='net')
+
+    assert loop.run_until_complete(pings()) == 'Sensor has been added'
+    assert session.found_sensors == {'sensor-1'}
+    assert session.running
+
+
+def test_pings_are_routed_to_their_session(loop, client):
+    first = start(loop, 'floor-1', 2)
+    second = start(loop, 'floor-2', 2)
+
+    async def pings():
+        await ping(client, 'a', ssid='floor-1')
+        await ping(client, 'b', ssid='floor-2')
+        await ping(client, 'c', session=second.id)
+
+    loop.run_until_complete(pings())
+
+    assert first.found_sensors == {'a'}
+    assert second.found_sensors == {'b', 'c'}
+    assert first.running and not second.running
+
+
+def test_same_ssid_is_not_started_twice(loop, client):
+    start(loop, 'net', 2)
+    start(loop, 'net', 2)
+
+    assert len(gateway_server.scheduler.sessions) == 1
+
+
+def test_roster_broadcast_waits_for_pending_sensors(loop, client, store):
+    loop.run_until_complete(store.import_csv(
+        'hostname\nsensor-1\nsensor-2\nsensor-3\n'))
+    store.provisioned.add('sensor-3')
+    session = start(loop, 'net')
+
+    async def pings():
+        replies = [await ping(client, 'stray', ssid='net')]
+        for sensor in ('sensor-1', 'sensor-2'):
+            replies.append(await ping(client, sensor, ssid='net'))
+        return replies
+
+    replies = loop.run_until_complete(pings())
+
+    assert session.hostnames == {'sensor-1', 'sensor-2'}
+    assert replies == ['Sensor is not expected', 'Sensor has been added',
+                       'Sensor has been added']
+    assert session.found_sensors == {'sensor-1', 'sensor-2'}
+    assert not session.running
+
+
+def test_roster_with_count_ignores_strays(loop, client, store):
+    loop.run_until_complete(store.import_csv('hostname\nsensor-1\n'))
+    session = start(loop, 'net', 1)
+
+    text = loop.run_until_complete(ping(client, 'stray', ssid='net'))
+
+    assert text == 'Sensor is not expected'
+    assert session.running
+    assert session.found_sensors == set()
+
+
+def test_many_dashboards(loop, client, monkeypatch, capsys):
+    """Hundreds of open dashboards watching a broadcast get a snapshot
+    when they join and a few merged updates, not one message per sensor."""
+    dashboards = Dashboards(gateway_server.sio)
+    monkeypatch.setattr(gateway_server.sio.eio, 'send', dashboards.send)
+    sensors = ['sensor-{}'.format(i) for i in range(100)]
+
+    async def load():
+        await dashboards.connect(LOAD_DASHBOARDS)
+        owner = dashboards.sids[0]
+        await dashboards.emit(owner, 'broadcast-start', {
+            'ssid': 'net', 'password': 'secret123',
+            'sensors': str(len(sensors))})
+        session = gateway_server.scheduler.route(ssid='net')
+        for sid in dashboards.sids[1:]:
+            await dashboards.emit(sid, 'broadcast-join',
+                                  {'session': session.id})
+
+        begin = time.process_time()
+        await asyncio.gather(*[ping(client, sensor, ssid='net')
+                               for sensor in sensors])
+        # Finished once the last update has gone out
+        await wait_until(gateway_server.scheduler._task.done)
+        return time.process_time() - begin
+
+    cpu = loop.run_until_complete(load())
+
+    for sid in dashboards.sids:
+        updates = [data for event, data in dashboards.events(sid)
+                   if event == 'broadcast-update']
+        heard = [s for data in updates for s in data.get('sensors', [])]
+        assert sorted(heard) == sorted(sensors)
+        assert updates[-1]['message'] == 'Stopped (net)'
+        assert len(updates) <= 4
+    with capsys.disabled():
+        print('\n{} dashboards, {} sensors: {} messages ({} KB) in {:.3f}s '
+              'of CPU'.format(LOAD_DASHBOARDS, len(sensors),
+                              dashboards.messages, dashboards.size // 1024,
+                              cpu))
@@ -0,0 +1,195 @@
+from collections import OrderedDict
+import os
+import stat
+
+import pytest
+
+import interfaces
+
+INTERFACES = '''# The loopback network interface
+auto lo
+iface lo inet loopback
+
+allow-hotplug wlan0
+iface wlan0 inet dhcp
+    wpa-ssid "EHIE-Lab"
+    wpa-psk  "secret123"
+    # wpa-scan-ssid 1
+mapping eth0
+    script /usr/local/bin/map
+source {}/*.cfg
+'''
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    (tmp_path / 'interfaces.d').mkdir()
+    (tmp_path / 'interfaces').write_text(INTERFACES.format(
+        tmp_path / 'interfaces.d'))
+    monkeypatch.setattr(interfaces, 'CHECK_TIME', 0)
+    return interfaces.InterfaceStore(str(tmp_path / 'interfaces'))
+
+
+def touch(path, mtime):
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_parse():
+    stanzas = {}
+    sources = []
+    interfaces.parse(INTERFACES.format('/etc/network/interfaces.d'),
+                     stanzas, sources)
+
+    assert stanzas == {
+        'lo': OrderedDict(),
+        'wlan0': OrderedDict([('wpa-ssid', '"EHIE-Lab"'),
+                              ('wpa-psk', '"secret123"')])}
+    assert sources == ['/etc/network/interfaces.d/*.cfg']
+
+
+def test_parse_merges_stanzas():
+    stanzas = {}
+    interfaces.parse('iface wlan0 inet dhcp\n    wpa-ssid One\n',
+                     stanzas, [])
+    interfaces.parse('iface wlan0 inet6 auto\n    wpa-psk two\n',
+                     stanzas, [])
+
+    assert stanzas['wlan0'] == OrderedDict([('wpa-ssid', 'One'),
+                                            ('wpa-psk', 'two')])
+
+
+def test_unquote():
+    assert interfaces.unquote('"EHIE-Lab"') == 'EHIE-Lab'
+    assert interfaces.unquote('EHIE-Lab') == 'EHIE-Lab'
+    assert interfaces.unquote('"') == '"'
+
+
+def test_write_atomic_keeps_mode(tmp_path):
+    filename = tmp_path / 'interfaces'
+    filename.write_text('old\n')
+    os.chmod(str(filename), 0o644)
+
+    interfaces.write_atomic(str(filename), 'new\n')
+
+    assert filename.read_text() == 'new\n'
+    assert stat.S_IMODE(os.stat(str(filename)).st_mode) == 0o644
+    assert os.listdir(str(tmp_path)) == ['interfaces']
+
+
+def test_write_atomic_new_file_is_private(tmp_path):
+    filename = tmp_path / 'wlan0.cfg'
+
+    interfaces.write_atomic(str(filename), 'wpa-psk "secret123"\n')
+
+    assert filename.read_text() == 'wpa-psk "secret123"\n'
+    assert stat.S_IMODE(os.stat(str(filename)).st_mode) == 0o600
+
+
+def test_write_atomic_failure_leaves_file(tmp_path, monkeypatch):
+    filename = tmp_path / 'interfaces'
+    filename.write_text('old\n')
+
+    def fail(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(interfaces.os, 'replace', fail)
+    with pytest.raises(OSError):
+        interfaces.write_atomic(str(filename), 'new\n')
+
+    assert filename.read_text() == 'old\n'
+    assert os.listdir(str(tmp_path)) == ['interfaces']
+
+
+def test_sourced_files(store, tmp_path):
+    (tmp_path / 'interfaces.d' / 'wlan1.cfg').write_text(
+        'iface wlan1 inet dhcp\n    wpa-ssid "Other"\n    wpa-psk "x"\n')
+
+    assert store.ssid('wlan0') == 'EHIE-Lab'
+    assert store.ssid('wlan1') == 'Other'
+    assert store.configured('wlan1')
+    assert not store.configured('lo')
+    assert store.has_source(str(tmp_path / 'interfaces.d' / '*.cfg'))
+
+
+def test_refresh_reloads_changed_files(store, tmp_path):
+    main = tmp_path / 'interfaces'
+    assert store.ssid('wlan0') == 'EHIE-Lab'
+
+    main.write_text(main.read_text().replace('EHIE-Lab', 'Changed'))
+    touch(str(main), 1)
+    assert store.ssid('wlan0') == 'Changed'
+
+
+def test_refresh_notices_new_sourced_file(store, tmp_path):
+    assert store.ssid('wlan1') is None
+
+    (tmp_path / 'interfaces.d' / 'wlan1.cfg').write_text(
+        'iface wlan1 inet dhcp\n    wpa-ssid "Other"\n')
+    touch(str(tmp_path / 'interfaces.d'), 1)
+    assert store.ssid('wlan1') == 'Other'
+
+
+def test_refresh_skips_unchanged_files(store, monkeypatch):
+    store.refresh()
+    loads = []
+    monkeypatch.setattr(store, '_load', lambda: loads.append(1))
+
+    store.refresh()
+    assert loads == []
+    store.refresh(force=True)
+    assert loads == [1]
+
+
+def test_refresh_waits_check_time(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(interfaces, 'CHECK_TIME', 60)
+    main = tmp_path / 'interfaces'
+    assert store.ssid('wlan0') == 'EHIE-Lab'
+
+    main.write_text(main.read_text().replace('EHIE-Lab', 'Changed'))
+    touch(str(main), 1)
+    assert store.ssid('wlan0') == 'EHIE-Lab'
+
+
+def test_write_and_read_config(loop, store):
+    loop.run_until_complete(store.write('wlan2', [
+        'iface wlan2 inet dhcp', '    wpa-ssid "New"']))
+
+    assert store.ssid('wlan2') == 'New'
+    assert loop.run_until_complete(store.read_config('wlan2')) == \
+        'iface wlan2 inet dhcp\n    wpa-ssid "New"\n'
+    assert loop.run_until_complete(store.read_config('wlan3')) is None
+
+
+def test_restore_config(loop, store):
+    loop.run_until_complete(store.write('wlan2', [
+        'iface wlan2 inet dhcp', '    wpa-ssid "New"']))
+
+    loop.run_until_complete(store.restore_config('wlan2', None))
+    assert store.ssid('wlan2') is None
+    assert not os.path.exists(store.config_file('wlan2'))
+
+    loop.run_until_complete(store.restore_config(
+        'wlan2', 'iface wlan2 inet dhcp\n    wpa-ssid "Old"\n'))
+    assert store.ssid('wlan2') == 'Old'
+
+
+def test_add_source(loop, store, tmp_path):
+    pattern = str(tmp_path / 'extra' / '*')
+    (tmp_path / 'extra').mkdir()
+    (tmp_path / 'extra' / 'wlan5').write_text(
+        'iface wlan5 inet dhcp\n    wpa-ssid "Extra"\n')
+
+    loop.run_until_complete(store.add_source(pattern))
+
+    text = (tmp_path / 'interfaces').read_text()
+    assert text.endswith('\nsource {}\n'.format(pattern))
+    assert store.has_source(pattern)
+    assert store.ssid('wlan5') == 'Extra'
+
+
+def test_add_source_creates_file(loop, tmp_path):
+    store = interfaces.InterfaceStore(str(tmp_path / 'interfaces'))
+
+    loop.run_until_complete(store.add_source('/etc/wifi/*'))
+
+    assert (tmp_path / 'interfaces').read_text() == 'source /etc/wifi/*\n'
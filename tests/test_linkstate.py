@@ -0,0 +1,99 @@
+import pytest
+
+import linkstate
+
+from netlink import DumpSocket, address_message, link_message
+
+
+@pytest.fixture
+def events(monitor):
+    events = []
+    monitor.add_listener(lambda interface, event: events.append(
+        (interface, event)))
+    return events
+
+
+def test_address_events(monitor, events):
+    monitor.feed(address_message(3, '10.0.0.5'))
+    assert monitor.address('wlan0') == '10.0.0.5'
+
+    monitor.feed(address_message(3, '10.0.0.5', new=False))
+    assert monitor.address('wlan0') is None
+
+    assert events == [('wlan0', 'address-added'),
+                      ('wlan0', 'address-removed')]
+
+
+def test_link_events(monitor, events):
+    monitor.feed(link_message(4, 'eth0'))
+    monitor.feed(link_message(4, 'eth0'))
+    monitor.feed(link_message(4, 'eth0', up=False))
+
+    assert not monitor.has_carrier('eth0')
+    assert monitor.names[4] == 'eth0'
+    # Only changes are reported
+    assert events == [('eth0', 'link-up'), ('eth0', 'link-down')]
+
+
+def test_removed_link_drops_addresses(monitor):
+    monitor.feed(address_message(3, '10.0.0.5'))
+    monitor.feed(link_message(3, 'wlan0', up=False, new=False))
+
+    assert monitor.address('wlan0') is None
+
+
+def test_next_address_ignores_current_lease(loop, monitor):
+    monitor.feed(address_message(3, '192.168.1.5'))
+    lease = monitor.next_address('wlan0')
+
+    async def wait():
+        loop.call_later(.01, monitor.feed, address_message(3, '10.0.0.5'))
+        return await monitor.wait_for_address('wlan0', 1, lease=lease)
+
+    assert loop.run_until_complete(wait()) == '10.0.0.5'
+    assert not monitor._waiters.get('wlan0')
+
+
+def test_wait_for_address(loop, monitor):
+    monitor.feed(address_message(3, '10.0.0.5'))
+
+    assert loop.run_until_complete(
+        monitor.wait_for_address('wlan0', 1)) == '10.0.0.5'
+    assert loop.run_until_complete(
+        monitor.wait_for_address('wlan1', .01)) is None
+    assert not monitor._waiters.get('wlan1')
+
+
+def test_resync_notifies_changes(loop, monitor, events):
+    monitor.feed(link_message(3, 'wlan0'))
+    monitor.feed(address_message(3, '10.0.0.5'))
+    monitor.feed(link_message(4, 'eth0'))
+    lease = monitor.next_address('eth0')
+    del events[:]
+
+    # Events were dropped: wlan0 went down and lost its address, eth0 got
+    # an address
+    sock = DumpSocket({
+        linkstate.RTM_GETLINK: [link_message(3, 'wlan0', up=False),
+                                link_message(4, 'eth0')],
+        linkstate.RTM_GETADDR: [address_message(4, '192.168.1.7')]})
+    monitor._sync(sock)
+
+    assert monitor.addresses == {'eth0': ['192.168.1.7']}
+    assert monitor.carrier == {'wlan0': False, 'eth0': True}
+    assert events == [('wlan0', 'link-down'), ('eth0', 'address-added'),
+                      ('wlan0', 'address-removed')]
+    assert lease.result() == '192.168.1.7'
+
+
+def test_resync_without_changes_is_quiet(monitor, events):
+    monitor.feed(link_message(3, 'wlan0'))
+    monitor.feed(address_message(3, '10.0.0.5'))
+    del events[:]
+
+    monitor._sync(DumpSocket({
+        linkstate.RTM_GETLINK: [link_message(3, 'wlan0')],
+        linkstate.RTM_GETADDR: [address_message(3, '10.0.0.5')]}))
+
+    assert events == []
+    assert monitor.address('wlan0') == '10.0.0.5'
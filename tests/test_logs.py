@@ -0,0 +1,98 @@
+import logging
+
+import pytest
+
+import logs
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(logs, 'time', clock)
+    return clock
+
+
+def record(msg, *args, level=logging.DEBUG, name='runner'):
+    return logging.makeLogRecord({'name': name, 'levelno': level,
+                                  'levelname': logging.getLevelName(level),
+                                  'msg': msg, 'args': args})
+
+
+def passed(limit, records):
+    return [r.getMessage() for r in records if limit.filter(r)]
+
+
+def test_burst_then_drop(clock):
+    limit = logs.RateLimitFilter(interval=60, burst=3)
+
+    # The same format string with other arguments is a repeat
+    messages = passed(limit, [record('Running %s', i) for i in range(5)])
+    assert messages == ['Running 0', 'Running 1', 'Running 2']
+
+    # Other messages have their own count
+    assert passed(limit, [record('Scanning')]) == ['Scanning']
+    assert passed(limit, [record('Running %s', 9, name='wifi')]) == \
+        ['Running 9']
+
+
+def test_dropped_count_is_added(clock):
+    limit = logs.RateLimitFilter(interval=60, burst=2)
+    passed(limit, [record('Running %s', i) for i in range(6)])
+
+    clock.now += 59
+    assert passed(limit, [record('Running %s', 6)]) == []
+    clock.now += 1
+    assert passed(limit, [record('Running %s', 7), record('Running %s', 8),
+                          record('Running %s', 9)]) == [
+        'Running 7 (5 similar messages dropped)', 'Running 8']
+
+
+def test_warnings_are_not_dropped(clock):
+    limit = logs.RateLimitFilter(interval=60, burst=1)
+
+    records = [record('Failed %s', i, level=logging.WARNING)
+               for i in range(3)]
+    records += [record('Crashed', level=logging.ERROR) for _ in range(3)]
+    assert len(passed(limit, records)) == 6
+
+
+def test_oldest_keys_are_forgotten(clock):
+    limit = logs.RateLimitFilter(interval=60, burst=1, max_keys=2)
+
+    passed(limit, [record('one'), record('two'), record('three')])
+    assert passed(limit, [record('one'), record('three')]) == ['one']
+
+
+def test_truncate():
+    truncate = logs.TruncateFilter(max_length=10)
+    long = record('stdout: %s', 'x' * 20)
+    short = record('stdout: %s', 'x')
+
+    assert truncate.filter(long)
+    assert long.getMessage() == 'stdout: xx... (18 characters dropped)'
+    assert long.args is None
+
+    assert truncate.filter(short)
+    assert short.getMessage() == 'stdout: x'
+    assert short.args == ('x',)
+
+
+def test_set_levels():
+    logger = logging.getLogger('test_logs.levels')
+    try:
+        logs.set_levels({'test_logs.levels': 'info'})
+        assert logger.level == logging.INFO
+        assert logs.levels()['test_logs.levels'] == 'INFO'
+
+        with pytest.raises(ValueError):
+            logs.set_levels({'test_logs.levels': 'loud'})
+    finally:
+        logger.setLevel(logging.NOTSET)
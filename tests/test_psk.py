@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+import pytest
+
+import wifi
+
+# IEEE 802.11i-2004, H.4.2
+PASSPHRASE = 'password'
+SSID = 'IEEE'
+PSK = 'f42c6fc52df0ebef9ebb4b90b38a5f902e83fe1b135a70e23aed762e9710a12e'
+
+
+@pytest.fixture
+def derived(monkeypatch):
+    """SSIDs _derive_psk is called for, with an empty cache."""
+    monkeypatch.setattr(wifi, '_psk_cache', OrderedDict())
+    calls = []
+    derive = wifi._derive_psk
+
+    def _derive_psk(ssid, passphrase):
+        calls.append(ssid)
+        return derive(ssid, passphrase)
+
+    monkeypatch.setattr(wifi, '_derive_psk', _derive_psk)
+    return calls
+
+
+def test_test_vector():
+    assert wifi._derive_psk(SSID, PASSPHRASE) == PSK
+
+
+@pytest.mark.skipif(wifi.PBKDF2 is None, reason="needs pbkdf2")
+def test_test_vector_without_hashlib(monkeypatch):
+    monkeypatch.delattr(wifi.hashlib, 'pbkdf2_hmac')
+
+    assert wifi._derive_psk(SSID, PASSPHRASE) == PSK
+
+
+def test_derive_psk(loop, derived):
+    assert loop.run_until_complete(wifi.derive_psk(SSID, PASSPHRASE)) == PSK
+    assert derived == [SSID]
+
+
+def test_cache_hit(loop, derived):
+    loop.run_until_complete(wifi.derive_psk(SSID, PASSPHRASE))
+    assert loop.run_until_complete(wifi.derive_psk(SSID, PASSPHRASE)) == PSK
+    assert derived == [SSID]
+
+    # Another passphrase for the same network is derived again
+    loop.run_until_complete(wifi.derive_psk(SSID, 'other password'))
+    assert derived == [SSID, SSID]
+
+
+def test_passphrase_is_not_a_key(loop, derived):
+    loop.run_until_complete(wifi.derive_psk(SSID, PASSPHRASE))
+
+    for key in wifi._psk_cache:
+        assert PASSPHRASE.encode() not in key
+
+
+def test_least_recently_used_is_evicted(loop, derived):
+    ssids = ['net-{}'.format(i) for i in range(wifi.PSK_CACHE_SIZE)]
+    for ssid in ssids:
+        loop.run_until_complete(wifi.derive_psk(ssid, PASSPHRASE))
+    # Using the oldest entry keeps it in
+    loop.run_until_complete(wifi.derive_psk(ssids[0], PASSPHRASE))
+    assert len(derived) == wifi.PSK_CACHE_SIZE
+
+    loop.run_until_complete(wifi.derive_psk('one more', PASSPHRASE))
+    assert len(wifi._psk_cache) == wifi.PSK_CACHE_SIZE
+
+    del derived[:]
+    loop.run_until_complete(wifi.derive_psk(ssids[0], PASSPHRASE))
+    assert derived == []
+    loop.run_until_complete(wifi.derive_psk(ssids[1], PASSPHRASE))
+    assert derived == [ssids[1]]
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+import publisher
+
+
+class FakeSio():
+    """Records what would be emitted through socket.io."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.emitted = []
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def emit(self, event, data, room=None):
+        self.emitted.append((event, data, room))
+
+
+@pytest.fixture
+def sio():
+    return FakeSio()
+
+
+@pytest.fixture
+def updates(loop, sio):
+    updates = publisher.Publisher(sio, interval=.02)
+    yield updates
+    if updates._task is not None:
+        loop.run_until_complete(updates._task)
+
+
+def settle(loop, updates):
+    loop.run_until_complete(asyncio.sleep(updates.interval * 2))
+
+
+def test_updates_are_coalesced(loop, sio, updates):
+    updates.update(None, 'status', message='Starting', session=1)
+    updates.update(None, 'status', message='Broadcasting')
+    updates.update(None, 'status', session=1)
+    assert sio.emitted == []
+
+    settle(loop, updates)
+
+    assert sio.emitted == [('status', {'message': 'Broadcasting',
+                                       'session': 1}, None)]
+    assert updates.stats == {'updates': 2, 'messages': 1}
+
+
+def test_only_changes_are_sent(loop, sio, updates):
+    updates.update(None, 'status', message='Broadcasting', session=1)
+    settle(loop, updates)
+    updates.update(None, 'status', message='Broadcasting', session=2)
+    settle(loop, updates)
+    updates.update(None, 'status', message='Broadcasting', session=2)
+    settle(loop, updates)
+
+    assert [data for _, data, _ in sio.emitted] == [
+        {'message': 'Broadcasting', 'session': 1}, {'session': 2}]
+
+
+def test_added_items_are_sent_once(loop, sio, updates):
+    updates.add('room-1', 'broadcast-update', 'sensors', ['a', 'b'])
+    updates.add('room-1', 'broadcast-update', 'sensors', ['b', 'c'])
+    settle(loop, updates)
+    updates.add('room-1', 'broadcast-update', 'sensors', ['a', 'd'])
+    updates.add('room-1', 'broadcast-update', 'sensors', ['d'])
+    settle(loop, updates)
+
+    assert sio.emitted == [
+        ('broadcast-update', {'sensors': ['a', 'b', 'c']}, 'room-1'),
+        ('broadcast-update', {'sensors': ['d']}, 'room-1')]
+
+
+def test_rooms_and_events_are_kept_apart(loop, sio, updates):
+    updates.update('room-1', 'broadcast-update', message='one')
+    updates.update('room-2', 'broadcast-update', message='two')
+    updates.update(None, 'status', message='all')
+    settle(loop, updates)
+
+    assert sorted(sio.emitted, key=lambda e: str(e[2])) == [
+        ('status', {'message': 'all'}, None),
+        ('broadcast-update', {'message': 'one'}, 'room-1'),
+        ('broadcast-update', {'message': 'two'}, 'room-2')]
+
+
+def test_flush(loop, sio, updates):
+    updates.update(None, 'status', message='Stopping')
+    loop.run_until_complete(updates.flush())
+
+    assert sio.emitted == [('status', {'message': 'Stopping'}, None)]
+    settle(loop, updates)
+    assert len(sio.emitted) == 1
+
+
+def test_snapshot(loop, sio, updates):
+    updates.update('room-1', 'broadcast-update', message='Broadcasting')
+    updates.add('room-1', 'broadcast-update', 'sensors', ['a'])
+    updates.update(None, 'status', message='Broadcasting (net)')
+    loop.run_until_complete(updates.flush())
+    del sio.emitted[:]
+
+    loop.run_until_complete(updates.snapshot('sid-1', 'room-1'))
+
+    assert sio.emitted == [
+        ('broadcast-update', {'message': 'Broadcasting', 'sensors': ['a'],
+                              'snapshot': True}, 'sid-1')]
+
+
+def test_forget(loop, sio, updates):
+    updates.update('room-1', 'broadcast-update', message='Stopped')
+    loop.run_until_complete(updates.flush())
+    updates.forget('room-1')
+    del sio.emitted[:]
+
+    loop.run_until_complete(updates.snapshot('sid-1', 'room-1'))
+    assert sio.emitted == []
+
+    # The same update is sent again, as nothing is known about the room
+    updates.update('room-1', 'broadcast-update', message='Stopped')
+    loop.run_until_complete(updates.flush())
+    assert sio.emitted == [
+        ('broadcast-update', {'message': 'Stopped'}, 'room-1')]
+
+
+def test_on(loop, sio, updates):
+    calls = []
+
+    @updates.on('status')
+    async def status(sid):
+        calls.append(sid)
+        return 'done'
+
+    assert loop.run_until_complete(sio.handlers['status']('sid-1')) == 'done'
+    assert calls == ['sid-1']
+    assert publisher.handler_time._values[('status',)][1] >= 1
+
+
+def test_send(loop, sio, updates):
+    before = publisher.messages_sent.get(event='wifi-scan')
+
+    loop.run_until_complete(updates.send('wifi-scan', [], room='sid-1'))
+
+    assert sio.emitted == [('wifi-scan', [], 'sid-1')]
+    assert updates.stats['messages'] == 1
+    assert publisher.messages_sent.get(event='wifi-scan') == before + 1
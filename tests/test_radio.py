@@ -0,0 +1,103 @@
+import errno
+import struct
+
+import pytest
+
+import radio
+
+
+class FakeIoctl():
+    """Stands in for fcntl.ioctl, failing requests in errors with their
+    errno."""
+
+    def __init__(self):
+        self.requests = []
+        self.errors = {}
+
+    def __call__(self, fd, request, arg):
+        assert len(arg) == radio.IWREQ_SIZE
+        if request in self.errors:
+            raise OSError(self.errors[request], 'ioctl failed')
+        self.requests.append((request, arg))
+        return arg
+
+
+@pytest.fixture
+def ioctl(monkeypatch, executor):
+    fake = FakeIoctl()
+    monkeypatch.setattr(radio.fcntl, 'ioctl', fake)
+    monkeypatch.setattr(radio, '_radios', {})
+    monkeypatch.setattr(radio, 'ioctl_radio', radio.IoctlRadio())
+    yield fake
+    if radio.ioctl_radio._sock is not None:
+        radio.ioctl_radio._sock.close()
+
+
+def test_iwreq():
+    request = radio._iwreq('wlan0', struct.pack('I', 6))
+
+    assert request == b'wlan0' + b'\0' * 11 + b'\6\0\0\0' + b'\0' * 12
+    # Names are cut to what fits in IFNAMSIZ with the terminator
+    assert radio._iwreq('x' * 20, b'')[:16] == b'x' * 15 + b'\0'
+
+
+def test_set_mode(loop, ioctl, executor):
+    loop.run_until_complete(radio.set_mode('wlan0', 'monitor'))
+
+    request, arg = ioctl.requests[-1]
+    assert request == radio.SIOCSIWMODE
+    assert arg[:16].rstrip(b'\0') == b'wlan0'
+    assert struct.unpack_from('I', arg, 16) == (radio.MODES['monitor'],)
+    assert executor.calls == []
+
+
+def test_set_channel(loop, ioctl, executor):
+    loop.run_until_complete(radio.set_channel('wlan0', 11))
+
+    request, arg = ioctl.requests[-1]
+    assert request == radio.SIOCSIWFREQ
+    assert struct.unpack_from('ihBB', arg, 16) == (11, 0, 0,
+                                                   radio.IW_FREQ_FIXED)
+    assert executor.calls == []
+
+
+def test_radio_is_probed_once(loop, ioctl):
+    loop.run_until_complete(radio.set_channel('wlan0', 1))
+    loop.run_until_complete(radio.set_channel('wlan0', 6))
+
+    requests = [request for request, _ in ioctl.requests]
+    assert requests == [radio.SIOCGIWMODE, radio.SIOCSIWFREQ,
+                        radio.SIOCSIWFREQ]
+
+
+def test_no_wireless_extensions(loop, ioctl, executor):
+    ioctl.errors[radio.SIOCGIWMODE] = errno.ENOTTY
+
+    loop.run_until_complete(radio.set_mode('wlan0', 'monitor'))
+
+    assert radio.get_radio('wlan0') is radio.iwconfig_radio
+    assert executor.calls == [('iwconfig', 'wlan0', 'mode', 'monitor')]
+
+
+@pytest.mark.parametrize('error', [errno.EOPNOTSUPP, errno.ENOTTY])
+def test_unsupported_falls_back_to_iwconfig(loop, ioctl, executor, error):
+    ioctl.errors[radio.SIOCSIWFREQ] = error
+    before = radio.hop_latency._values.get(('iwconfig',), [0, 0])[1]
+
+    loop.run_until_complete(radio.set_channel('wlan0', 6))
+    loop.run_until_complete(radio.set_channel('wlan0', 11))
+
+    assert executor.calls == [('iwconfig', 'wlan0', 'channel', '6'),
+                              ('iwconfig', 'wlan0', 'channel', '11')]
+    # Later calls go straight to iwconfig
+    assert radio.get_radio('wlan0') is radio.iwconfig_radio
+    assert radio.hop_latency._values[('iwconfig',)][1] == before + 2
+
+
+def test_other_errors_do_not_fall_back(loop, ioctl, executor):
+    ioctl.errors[radio.SIOCSIWFREQ] = errno.EINVAL
+
+    loop.run_until_complete(radio.set_channel('wlan0', 14))
+
+    assert executor.calls == []
+    assert radio.get_radio('wlan0') is radio.ioctl_radio
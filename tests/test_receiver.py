@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+import channels
+import radio
+import receiver
+import runner
+import sensor_client
+
+from conftest import fixture_path
+from receiver_replay import ReplayExecutor, load, parse
+
+
+@pytest.fixture
+def replay(monkeypatch):
+    """Install an executor replaying the named recordings for receive_wifi."""
+    monkeypatch.setattr(receiver, 'RESTART_WAIT_TIME', .01)
+    # Channel hops go through iwconfig, which the executor fakes
+    monkeypatch.setattr(radio, '_radios', {'wlan0': radio.iwconfig_radio})
+
+    def install(*recordings, speed=10):
+        recordings = [load(fixture_path('receiver', r))
+                      if isinstance(r, str) else r for r in recordings]
+        executor = ReplayExecutor(recordings, speed)
+        monkeypatch.setattr(runner, 'executor', executor)
+        return executor
+
+    return install
+
+
+def receiver_calls(executor):
+    return [args for args in executor.calls
+            if args[0] == receiver.RECEIVE_PYTHON]
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('EHIE-Lab:secret123\n', ('EHIE-Lab', 'secret123')),
+    ('EHIE-Lab:p4ss:w0rd:', ('EHIE-Lab', 'p4ss:w0rd:')),
+    ('open-network:', ('open-network', '')),
+    ('{"ssid": "floor:1", "password": "a:b"}', ('floor:1', 'a:b')),
+    ('{"ssid": "x"}', None),
+    ('{"ssid": "x", ', None),
+    ('[1, 2]', None),
+    ('no separator', None),
+    (':password', None),
+    ('   ', None),
+])
+def test_parse_credentials(line, expected):
+    credentials = receiver.parse_credentials(line)
+    if expected is None:
+        assert credentials is None
+    else:
+        assert credentials == receiver.Credentials(*expected)
+
+
+def test_receive(loop, replay):
+    executor = replay('colon_password.rec')
+
+    async def receive():
+        async with receiver.Receiver('wlan0') as listener:
+            return await listener.get(1)
+
+    credentials = loop.run_until_complete(receive())
+
+    assert credentials == ('EHIE-Lab', 'p4ss:w0rd:')
+    assert executor.calls == [(receiver.RECEIVE_PYTHON,
+                               receiver.RECEIVE_SCRIPT, 'wlan0')]
+    # Leaving the context kills the receiver
+    assert executor.processes[0].returncode == -9
+
+
+def test_get_times_out(loop, replay):
+    replay('colon_password.rec', speed=1)
+
+    async def receive():
+        async with receiver.Receiver('wlan0') as listener:
+            return await listener.get(.05)
+
+    assert loop.run_until_complete(receive()) is None
+
+
+def test_iterate(loop, replay):
+    replay('json.rec')
+
+    async def receive():
+        received = []
+        async with receiver.Receiver('wlan0') as listener:
+            async for credentials in listener:
+                received.append(credentials)
+                if len(received) == 2:
+                    break
+        return received
+
+    assert loop.run_until_complete(receive()) == [
+        ('floor:1', 'first password'), ('floor-2', 'second')]
+
+
+def test_one_receiver_across_hops(loop, replay, monkeypatch):
+    """Rounds heard on earlier channels count, so the credentials arrive
+    a few hops in without the receiver being restarted."""
+    executor = replay('colon_password.rec')
+    monkeypatch.setattr(sensor_client, 'scheduler', channels.ChannelScheduler(
+        min_dwell=.05, max_dwell=.05))
+
+    wifi_info = loop.run_until_complete(sensor_client.sweep_channels(
+        'wlan0', list(range(1, 12)), receiver.Receiver))
+
+    assert wifi_info == ('EHIE-Lab', 'p4ss:w0rd:')
+    assert len(receiver_calls(executor)) == 1
+    hops = [args[-1] for args in executor.calls if 'channel' in args]
+    assert 3 <= len(hops) < 11
+    assert sensor_client.scheduler.score(int(hops[-1])) > 0
+
+
+def test_chatty_stderr(loop, replay):
+    # Far more than a pipe buffer of progress, and one line over the
+    # stream limit, before the credentials
+    events = [(0, 'err', 'round {}: 3/12 packets'.format(i).encode())
+              for i in range(20000)]
+    events.append((0, 'err', b'x' * 2 ** 17))
+    events.append((0, 'out', b'EHIE-Lab:secret123'))
+    replay(events, speed=None)
+
+    async def receive():
+        async with receiver.Receiver('wlan0') as listener:
+            return await listener.get(5)
+
+    assert loop.run_until_complete(receive()) == ('EHIE-Lab', 'secret123')
+
+
+def test_restarts_after_exit(loop, replay):
+    executor = replay('crash.rec', 'colon_password.rec')
+
+    async def receive():
+        async with receiver.Receiver('wlan0') as listener:
+            return await listener.get(2)
+
+    assert loop.run_until_complete(receive()) == ('EHIE-Lab', 'p4ss:w0rd:')
+    assert len(executor.calls) == 2
+    assert executor.processes[0].returncode == 1
+
+
+def test_close(loop, replay):
+    executor = replay('colon_password.rec', speed=1)
+    listener = receiver.Receiver('wlan0')
+    running = executor.running.get()
+
+    async def run():
+        await listener.start()
+        await asyncio.sleep(.05)
+        await listener.close()
+
+    loop.run_until_complete(run())
+
+    assert listener._task is None
+    assert executor.processes[0].returncode == -9
+    assert executor.running.get() == running
+    # Closing again is harmless
+    loop.run_until_complete(listener.close())
+
+
+def test_parse_recording():
+    events = parse(b'# comment\n0.5 err a b c\n\n1 out x:y\n2 exit 3\n')
+
+    assert events == [(.5, 'err', b'a b c'), (1.0, 'out', b'x:y'),
+                      (2.0, 'exit', b'3')]
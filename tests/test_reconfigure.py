@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+import reconfigure
+import utils
+import wifi
+
+from netlink import address_message
+
+
+@pytest.fixture
+def listeners(monkeypatch):
+    """Start from no listeners, whatever the imported modules added."""
+    monkeypatch.setattr(reconfigure, '_listeners', [])
+    return reconfigure._listeners
+
+
+def observed():
+    return sum(value[1] for value in
+               reconfigure.reconfigure_time._values.values())
+
+
+def test_listeners_run_in_order(loop, listeners):
+    calls = []
+
+    def plain(interface, ssid):
+        calls.append(('plain', interface, ssid))
+
+    async def coroutine(interface, ssid):
+        await asyncio.sleep(0)
+        calls.append(('coroutine', interface, ssid))
+
+    reconfigure.add_listener(coroutine)
+    reconfigure.add_listener(plain)
+
+    assert loop.run_until_complete(
+        reconfigure.network_changed('wlan0', 'EHIE-Lab'))
+    assert calls == [('coroutine', 'wlan0', 'EHIE-Lab'),
+                     ('plain', 'wlan0', 'EHIE-Lab')]
+
+    reconfigure.remove_listener(plain)
+    assert listeners == [coroutine]
+
+
+def test_failing_listener(loop, listeners):
+    calls = []
+
+    def failing(interface, ssid):
+        raise OSError('gone')
+
+    reconfigure.add_listener(failing)
+    reconfigure.add_listener(lambda *args: calls.append(args))
+
+    assert not loop.run_until_complete(
+        reconfigure.network_changed('wlan0', 'EHIE-Lab'))
+    # The listeners after the failing one still run
+    assert calls == [('wlan0', 'EHIE-Lab')]
+
+
+def test_time_from_saved_credentials(loop, listeners):
+    before = observed()
+
+    async def change():
+        saved_at = reconfigure.time.monotonic()
+        await asyncio.sleep(.05)
+        await reconfigure.network_changed('wlan0', 'EHIE-Lab',
+                                          saved_at=saved_at)
+
+    loop.run_until_complete(change())
+    assert observed() == before + 1
+
+    # Without new credentials nothing is timed
+    loop.run_until_complete(reconfigure.network_changed('wlan0', 'EHIE-Lab'))
+    assert observed() == before + 1
+
+
+def test_restart(loop, listeners, executor, monkeypatch):
+    monkeypatch.setattr(reconfigure, 'RESTART_ON_NETWORK_CHANGE', True)
+    calls = []
+    reconfigure.add_listener(lambda *args: calls.append(args))
+
+    assert loop.run_until_complete(
+        reconfigure.network_changed('wlan0', 'EHIE-Lab'))
+    assert executor.calls == [(utils.SYSTEMCTL, 'restart', 'sensor.service')]
+    assert calls == []
+
+
+def test_failed_restart(loop, listeners, executor, monkeypatch):
+    monkeypatch.setattr(reconfigure, 'RESTART_ON_NETWORK_CHANGE', True)
+    executor.responses['systemctl'] = lambda args: 1 / 0
+
+    assert not loop.run_until_complete(
+        reconfigure.network_changed('wlan0', 'EHIE-Lab'))
+
+
+@pytest.fixture
+def sensor_server(monkeypatch, monitor):
+    pytest.importorskip('socketio')
+    import sensor_server
+
+    monkeypatch.setattr(sensor_server.app, 'interface', 'wlan0',
+                        raising=False)
+
+    def iter_scan(interface, force=False):
+        async def networks():
+            yield wifi.Network('EHIE-Lab', 'wpa2')
+        return networks()
+
+    async def replace(interface, network, password):
+        pass
+
+    monkeypatch.setattr(wifi, 'iter_scan', iter_scan)
+    monkeypatch.setattr(wifi, 'replace', replace)
+    return sensor_server
+
+
+@pytest.mark.parametrize('address', ['10.1.2.3', None])
+def test_web_update(loop, sensor_server, monitor, monkeypatch, address):
+    async def connect(interface):
+        if address is not None:
+            monitor.feed(address_message(3, address))
+        return address
+
+    changes = []
+
+    async def network_changed(interface, ssid, saved_at=None):
+        changes.append((interface, ssid, saved_at))
+        return True
+
+    monkeypatch.setattr(wifi, 'connect', connect)
+    monkeypatch.setattr(reconfigure, 'network_changed', network_changed)
+
+    loop.run_until_complete(sensor_server.handle_wifi_update(
+        'sid', {'ssid': 'EHIE-Lab', 'password': 'secret123'}))
+
+    # Listeners hear about the new configuration either way, but only a
+    # connect that worked counts as a change to the new network
+    [(interface, ssid, saved_at)] = changes
+    assert (interface, ssid) == ('wlan0', 'EHIE-Lab')
+    assert (saved_at is not None) == (address is not None)
+    status = sensor_server.updates._state[(None, 'wifi-status')]
+    assert status['message'] == ('Connected (10.1.2.3)' if address
+                                 else 'Not Connected')
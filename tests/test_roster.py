@@ -0,0 +1,97 @@
+import pytest
+
+import roster
+import sessions
+
+ROSTER_CSV = '''hostname,mac,site
+sensor-1,b8:27:eb:00:00:01,north
+sensor-2,b8:27:eb:00:00:02,north
+sensor-3,,south
+,b8:27:eb:00:00:04,south
+'''
+
+
+@pytest.fixture
+def store(loop, tmp_path):
+    store = roster.Roster(str(tmp_path / 'roster.db'))
+    loop.run_until_complete(store.open())
+    yield store
+
+    if store._flush_task is not None:
+        store._flush_task.cancel()
+    loop.run_until_complete(store.flush())
+
+
+def provision(loop, store, session, *hostnames):
+    for hostname in hostnames:
+        store.record_provisioning(session, hostname, '4.2', '-61', '6')
+    loop.run_until_complete(store.flush())
+
+
+def test_import_csv(loop, store):
+    count = loop.run_until_complete(store.import_csv(ROSTER_CSV))
+
+    assert count == 3
+    assert store.expected == {'sensor-1', 'sensor-2', 'sensor-3'}
+    assert store.pending() == store.expected
+
+
+def test_pending_shrinks_as_sensors_check_in(loop, store):
+    loop.run_until_complete(store.import_csv(ROSTER_CSV))
+    session = sessions.BroadcastSession('net', 'password', 3)
+
+    provision(loop, store, session, 'sensor-2', 'stray-1')
+
+    assert store.pending() == {'sensor-1', 'sensor-3'}
+
+
+def test_state_survives_reopening(loop, store):
+    loop.run_until_complete(store.import_csv(ROSTER_CSV))
+    provision(loop, store, sessions.BroadcastSession('net', 'pw', 3),
+              'sensor-1')
+
+    reopened = roster.Roster(store.filename)
+    loop.run_until_complete(reopened.open())
+
+    assert reopened.expected == store.expected
+    assert reopened.pending() == {'sensor-2', 'sensor-3'}
+
+
+def test_sensors_pages(loop, store):
+    loop.run_until_complete(store.import_csv(ROSTER_CSV))
+
+    first = loop.run_until_complete(store.sensors(limit=2))
+    rest = loop.run_until_complete(store.sensors(after=first[-1]['hostname'],
+                                                 limit=2))
+    south = loop.run_until_complete(store.sensors(site='south'))
+
+    assert [s['hostname'] for s in first] == ['sensor-1', 'sensor-2']
+    assert [s['hostname'] for s in rest] == ['sensor-3']
+    assert [s['hostname'] for s in south] == ['sensor-3']
+    assert first[0]['mac'] == 'b8:27:eb:00:00:01'
+
+
+def test_history(loop, store):
+    loop.run_until_complete(store.import_csv(ROSTER_CSV))
+    session = sessions.BroadcastSession('net', 'password', 3)
+    provision(loop, store, session, 'sensor-1', 'sensor-2', 'stray-1')
+
+    newest = loop.run_until_complete(store.history(limit=2))
+    older = loop.run_until_complete(store.history(before=newest[-1]['id']))
+    stray = loop.run_until_complete(store.history(hostname='stray-1'))
+
+    assert [r['hostname'] for r in newest] == ['stray-1', 'sensor-2']
+    assert [r['hostname'] for r in older] == ['sensor-1']
+    record, = stray
+    assert record['session_id'] == session.id
+    assert record['signal'] == -61
+    assert record['channel'] == 6
+    assert not record['expected']
+
+
+def test_page_size():
+    assert roster.page_size(None) == roster.PAGE_SIZE
+    assert roster.page_size('20') == 20
+    assert roster.page_size('0') == roster.PAGE_SIZE
+    assert roster.page_size('-5') == 1
+    assert roster.page_size('100000') == roster.MAX_PAGE_SIZE
@@ -0,0 +1,190 @@
+import asyncio
+import sys
+
+import pytest
+
+import runner
+
+
+class SlowProcess(runner.FakeProcess):
+    """Fake process that runs for a while, like a hop or a scan."""
+
+    def __init__(self, executor, run_time):
+        super().__init__(runner.Result(0, b'', b'', False, 0))
+        self.executor = executor
+        self.run_time = run_time
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+        super().kill()
+
+    async def wait(self):
+        if self.returncode is None:
+            self.executor.active += 1
+            self.executor.peak = max(self.executor.peak, self.executor.active)
+            try:
+                await asyncio.sleep(self.run_time)
+            finally:
+                self.executor.active -= 1
+        return await super().wait()
+
+
+class SlowExecutor(runner.Executor):
+    """Executor whose processes take start_time to come up and run_time to
+    finish, counting how many run at once."""
+
+    def __init__(self, start_time=0, run_time=.05, max_processes=2):
+        super().__init__(max_processes)
+        self.start_time = start_time
+        self.run_time = run_time
+        self.processes = []
+        self.active = 0
+        self.peak = 0
+
+    async def _create(self, name, args, stdin):
+        await asyncio.sleep(self.start_time)
+        proc = SlowProcess(self, self.run_time)
+        self.processes.append(proc)
+        return proc
+
+
+def python(code):
+    return (sys.executable, '-c', code)
+
+
+def test_run(loop):
+    executor = runner.Executor()
+
+    result = loop.run_until_complete(executor.run(*python(
+        'import sys; print("out"); sys.stderr.write("err"); sys.exit(3)')))
+
+    assert result.returncode == 3
+    assert result.stdout == b'out\n'
+    assert result.stderr == b'err'
+    assert not result.timed_out
+    assert result.duration > 0
+    assert executor._semaphore._value == runner.MAX_PROCESSES
+
+
+def test_timeout(loop):
+    executor = runner.Executor()
+    name = runner.command_name((sys.executable,))
+    timeouts = runner.timeouts.get(command=name)
+
+    result = loop.run_until_complete(executor.run(
+        *python('import time; time.sleep(10)'), timeout=.2))
+
+    assert result.timed_out
+    assert result.returncode == -9
+    assert result.duration < 5
+    assert runner.timeouts.get(command=name) == timeouts + 1
+
+
+def test_output_is_capped(loop):
+    executor = runner.Executor()
+
+    result = loop.run_until_complete(executor.run(
+        *python('import sys; sys.stdout.write("x" * 100000)'),
+        max_output=1000))
+
+    assert result.stdout == b'x' * 1000 + b'... (99000 bytes dropped)'
+
+
+def test_interface_lock(loop):
+    executor = SlowExecutor(max_processes=8)
+
+    async def run_all():
+        await asyncio.gather(
+            executor.run('iwconfig', 'wlan0', interface='wlan0'),
+            executor.run('iwconfig', 'wlan0', interface='wlan0'),
+            executor.run('iwconfig', 'wlan1', interface='wlan1'))
+
+    loop.run_until_complete(run_all())
+
+    # The two commands on wlan0 ran one after the other, next to wlan1's
+    assert executor.peak == 2
+    assert not executor.lock('wlan0').locked()
+
+
+def test_process_limit(loop):
+    executor = SlowExecutor(max_processes=2)
+
+    loop.run_until_complete(asyncio.gather(
+        *[executor.run('iwlist') for _ in range(5)]))
+
+    assert executor.peak == 2
+    assert len(executor.processes) == 5
+
+
+@pytest.mark.parametrize('start_time, cancel_after', [
+    # Cancelled while the process is being started
+    (.1, .02),
+    # Cancelled while it runs
+    (0, .02),
+])
+def test_cancel_gives_slot_back(loop, start_time, cancel_after):
+    executor = SlowExecutor(start_time=start_time, run_time=.2)
+
+    async def cancel_two():
+        tasks = [asyncio.ensure_future(executor.run(
+            'iwconfig', 'wlan{}'.format(i), interface='wlan{}'.format(i)))
+            for i in range(2)]
+        await asyncio.sleep(cancel_after)
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+        # Let processes that came up after the cancel be reaped
+        await asyncio.sleep(start_time + .05)
+
+    loop.run_until_complete(cancel_two())
+
+    assert executor._semaphore._value == 2
+    assert not executor.lock('wlan0').locked()
+    assert all(proc.killed for proc in executor.processes)
+
+    # Later commands still get to run
+    result = loop.run_until_complete(asyncio.wait_for(
+        executor.run('iwconfig', 'wlan0', interface='wlan0'), 1))
+    assert result.returncode == 0
+
+
+def test_cancel_kills_real_process(loop):
+    executor = runner.Executor(max_processes=1)
+    running = executor.running.get()
+
+    async def cancel():
+        task = asyncio.ensure_future(executor.run(
+            *python('import time; time.sleep(10)')))
+        await asyncio.sleep(.2)
+        task.cancel()
+        await asyncio.wait([task])
+
+    loop.run_until_complete(cancel())
+
+    assert executor.running.get() == running
+    assert executor._semaphore._value == 1
+
+
+def test_failed_start_gives_slot_back(loop):
+    executor = runner.Executor(max_processes=1)
+
+    with pytest.raises(FileNotFoundError):
+        loop.run_until_complete(executor.run('/nonexistent/iwlist',
+                                             interface='wlan0'))
+
+    assert executor._semaphore._value == 1
+    assert not executor.lock('wlan0').locked()
+
+
+def test_spawn(loop):
+    executor = runner.Executor()
+
+    async def spawn():
+        async with executor.spawn(*python('print(input())'),
+                                  stdin=True) as proc:
+            proc.stdin.write(b'hello\n')
+            return await proc.stdout.readline()
+
+    assert loop.run_until_complete(spawn()) == b'hello\n'
+    assert executor._semaphore._value == runner.MAX_PROCESSES
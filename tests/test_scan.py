@@ -0,0 +1,129 @@
+import pytest
+
+import runner
+import wifi
+
+from conftest import read_fixture
+
+
+def parse(name):
+    parser = wifi.ScanParser()
+    networks = []
+    for line in read_fixture('iwlist', name).decode().splitlines(True):
+        network = parser.feed(line)
+        if network is not None:
+            networks.append(network)
+
+    network = parser.close()
+    if network is not None:
+        networks.append(network)
+    return networks
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    monkeypatch.setattr(wifi, '_scans', {})
+
+
+def iwlist_output(name, returncode=0):
+    return runner.Result(returncode, read_fixture('iwlist', name), b'', False,
+                         0)
+
+
+def test_parse_home():
+    lab, neighbour, guest = parse('home.txt')
+
+    assert lab == wifi.Network(
+        'EHIE-Lab', 'wpa2', bssid='14:CC:20:5A:11:02', channel=6,
+        frequency=2.437, signal=-52,
+        ies=('Unknown: 0008454849452D4C6162', 'Unknown: 010882848B960C121824',
+             'Unknown: 030106', 'IEEE 802.11i/WPA2 Version 1'),
+        group_cipher='CCMP', pairwise_ciphers=('CCMP',),
+        authentication_suites=('PSK',))
+
+    assert neighbour.ssid == 'Neighbour WPA'
+    assert neighbour.encryption == 'wpa2'
+    assert neighbour.channel == 11
+    assert neighbour.signal == -74
+    # The first cipher listed for the cell is kept
+    assert neighbour.group_cipher == 'TKIP'
+    assert neighbour.pairwise_ciphers == ('CCMP', 'TKIP')
+
+    assert guest.ssid == 'Guest'
+    assert guest.encryption is None
+    assert guest.signal == -85
+
+
+def test_parse_mixed():
+    printer, hidden, cafe = parse('mixed.txt')
+
+    # Encryption on without WPA information elements is WEP
+    assert printer.encryption == 'wep'
+
+    assert hidden.ssid == ''
+    assert hidden.channel == 36
+    assert hidden.frequency == 5.18
+    assert hidden.authentication_suites == ('802.1x',)
+
+    # The channel comes from the frequency line when there is no Channel
+    assert cafe.ssid == r'Café WPA2 \x26 more'
+    assert cafe.channel == 149
+    assert cafe.authentication_suites == ('PSK',)
+
+
+def test_cell_without_essid_is_dropped():
+    assert 'Ad-Hoc' in read_fixture('iwlist', 'mixed.txt').decode()
+    assert [n.bssid for n in parse('mixed.txt')] == [
+        '00:0F:66:01:02:03', '3C:37:86:AA:BB:CC', '3C:37:86:AA:BB:CD']
+
+
+def test_parse_truncated():
+    lab, neighbour = parse('truncated.txt')
+
+    assert lab.encryption == 'wpa2'
+    assert neighbour.ssid == 'Neighbour WPA'
+    assert neighbour.channel == 11
+
+
+def test_parse_empty():
+    assert parse('empty.txt') == []
+
+
+def test_scan_streams_from_iwlist(loop, executor, scans):
+    executor.responses['iwlist'] = iwlist_output('home.txt')
+
+    networks = loop.run_until_complete(wifi.scan('wlan0'))
+
+    assert [n.ssid for n in networks] == ['EHIE-Lab', 'Neighbour WPA',
+                                          'Guest']
+    assert executor.calls == [('iwlist', 'wlan0', 'scan')]
+
+
+def test_scan_is_cached(loop, executor, scans):
+    executor.responses['iwlist'] = iwlist_output('home.txt')
+
+    first = loop.run_until_complete(wifi.scan('wlan0'))
+    second = loop.run_until_complete(wifi.scan('wlan0'))
+    forced = loop.run_until_complete(wifi.scan('wlan0', force=True))
+
+    assert first == second == forced
+    assert len(executor.calls) == 2
+
+
+def test_failed_scan_is_not_cached(loop, executor, scans):
+    executor.responses['iwlist'] = iwlist_output('truncated.txt',
+                                                 returncode=1)
+
+    loop.run_until_complete(wifi.scan('wlan0'))
+    loop.run_until_complete(wifi.scan('wlan0'))
+
+    assert len(executor.calls) == 2
+
+
+def test_last_seen(loop, executor, scans):
+    executor.responses['iwlist'] = iwlist_output('home.txt')
+    loop.run_until_complete(wifi.scan('wlan0'))
+
+    assert wifi.last_seen('wlan0', 'Guest').bssid == '02:1A:11:F0:33:9E'
+    assert wifi.last_seen('wlan0', 'Missing') is None
+    assert wifi.last_seen('wlan1', 'Guest') is None
@@ -0,0 +1,199 @@
+import time
+
+import pytest
+
+import credentials
+import interfaces
+import runner
+import sensor_client
+import wifi
+
+from conftest import read_fixture
+
+KEY = 'ab' * 32
+PREVIOUS = '''auto wlan0
+iface wlan0 inet dhcp
+    wpa-ssid "Old network"
+    wpa-psk  "{}"
+'''.format('cd' * 32)
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sensor_client, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def sensor(monkeypatch, tmp_path, executor, monitor):
+    interface_file = tmp_path / 'interfaces'
+    (tmp_path / 'interfaces.d').mkdir()
+    interface_file.write_text('source {}/*.cfg\n'.format(
+        tmp_path / 'interfaces.d'))
+    store = interfaces.InterfaceStore(str(interface_file))
+    monkeypatch.setattr(interfaces, 'store', store)
+    monkeypatch.setattr(credentials, 'store', credentials.CredentialStore(
+        str(tmp_path / 'credentials.json')))
+    monkeypatch.setattr(wifi, '_scans', {})
+    monkeypatch.setattr(wifi, 'backend_name', 'ifupdown')
+
+    executor.responses['iwlist'] = runner.Result(
+        0, read_fixture('iwlist', 'home.txt'), b'', False, 0)
+    executor.working = set()
+
+    def ifup(args):
+        if store.ssid('wlan0') in executor.working:
+            return runner.Result(0, b'', b'bound to 10.0.0.9 -- renewal in '
+                                         b'1800 seconds.', False, 0)
+        return runner.Result(1, b'', b'No DHCPOFFERS received.', False, 0)
+
+    executor.responses['ifup'] = ifup
+    return executor
+
+
+def remember(loop, *ssids):
+    for ssid in ssids:
+        loop.run_until_complete(credentials.store.add(ssid, 'wpa', KEY))
+
+
+def config_text(loop):
+    return loop.run_until_complete(interfaces.store.read_config('wlan0'))
+
+
+def test_roam_connects_to_known_network(loop, sensor):
+    remember(loop, 'EHIE-Lab', 'Neighbour WPA')
+    sensor.working.add('Neighbour WPA')
+
+    assert loop.run_until_complete(sensor_client.roam('wlan0')) == '10.0.0.9'
+    assert interfaces.store.ssid('wlan0') == 'Neighbour WPA'
+    assert credentials.store.get('Neighbour WPA')['successes'] == 1
+
+
+def test_roam_restores_config_when_all_fail(loop, sensor):
+    with open(interfaces.store.config_file('wlan0'), 'w') as f:
+        f.write(PREVIOUS)
+    remember(loop, 'EHIE-Lab', 'Neighbour WPA')
+
+    assert loop.run_until_complete(sensor_client.roam('wlan0')) is None
+    # Both candidates were tried before giving up
+    assert [args[0] for args in sensor.calls].count('ifup') == 2
+    assert config_text(loop) == PREVIOUS
+    assert interfaces.store.ssid('wlan0') == 'Old network'
+    assert credentials.store.get('EHIE-Lab')['failures'] == 1
+
+
+def test_roam_removes_config_it_created(loop, sensor):
+    remember(loop, 'EHIE-Lab')
+
+    assert loop.run_until_complete(sensor_client.roam('wlan0')) is None
+    assert config_text(loop) is None
+    assert interfaces.store.ssid('wlan0') is None
+
+
+def test_roam_without_candidates_leaves_config(loop, sensor):
+    with open(interfaces.store.config_file('wlan0'), 'w') as f:
+        f.write(PREVIOUS)
+    remember(loop, 'Out of range')
+
+    assert loop.run_until_complete(sensor_client.roam('wlan0')) is None
+    assert config_text(loop) == PREVIOUS
+    assert [args[0] for args in sensor.calls] == ['iwlist']
+
+
+def test_time_in_state_and_recovery(clock):
+    connection = sensor_client.Connection('wlan0')
+    before = sensor_client.state_time.get(state=sensor_client.CONNECTED)
+
+    connection.set_state(sensor_client.CONNECTED)
+    clock.now += 100
+    connection.set_state(sensor_client.LOST)
+    clock.now += 5
+    connection.set_state(sensor_client.CONNECTING)
+    clock.now += 20
+    connection.set_state(sensor_client.CONNECTED)
+
+    assert connection.time_in_state == {sensor_client.CONNECTED: 100,
+                                        sensor_client.LOST: 5,
+                                        sensor_client.CONNECTING: 20}
+    assert sensor_client.state_time.get(
+        state=sensor_client.CONNECTED) == before + 100
+    # Recovery runs from the first state that is not connected
+    assert connection.recover_times == [25]
+    assert connection.lost_at is None
+
+    clock.now += 50
+    connection.set_state(sensor_client.SCANNING)
+    clock.now += 15
+    connection.set_state(sensor_client.CONNECTED)
+    assert connection.recover_times == [25, 15]
+    assert connection.mean_time_to_recover == 20
+
+
+def test_no_recovery_until_connected(clock):
+    connection = sensor_client.Connection('wlan0')
+    assert connection.mean_time_to_recover is None
+
+    connection.set_state(sensor_client.LOST)
+    clock.now += 10
+    connection.set_state(sensor_client.SCANNING)
+
+    assert connection.recover_times == []
+    assert connection.lost_at == 1000
+
+
+def test_backoff(monkeypatch):
+    monkeypatch.setattr(sensor_client.random, 'uniform',
+                        lambda low, high: high)
+    connection = sensor_client.Connection('wlan0')
+
+    delays = []
+    for failures in range(8):
+        connection.failures = failures
+        delays.append(connection.backoff())
+
+    assert delays == [5, 10, 20, 40, 60, 60, 60, 60]
+
+
+def test_backoff_is_jittered():
+    connection = sensor_client.Connection('wlan0')
+    connection.failures = 2
+
+    delays = [connection.backoff() for _ in range(100)]
+    assert all(0 <= delay <= 20 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_wait_for_change_wakes_on_link_event(loop):
+    connection = sensor_client.Connection('wlan0')
+    loop.call_later(.01, connection.on_link_event, 'eth0', 'link-down')
+    loop.call_later(.05, connection.on_link_event, 'wlan0', 'link-down')
+
+    start = time.monotonic()
+    loop.run_until_complete(connection.wait_for_change(5))
+    assert .04 <= time.monotonic() - start < 1
+
+
+def test_wait_for_change_times_out(loop):
+    connection = sensor_client.Connection('wlan0')
+
+    start = time.monotonic()
+    loop.run_until_complete(connection.wait_for_change(.05))
+    assert time.monotonic() - start >= .04
+
+
+def test_wait_for_change_ignores_earlier_events(loop):
+    connection = sensor_client.Connection('wlan0')
+    connection.on_link_event('wlan0', 'mode-changed')
+
+    start = time.monotonic()
+    loop.run_until_complete(connection.wait_for_change(.05))
+    assert time.monotonic() - start >= .04
@@ -0,0 +1,211 @@
+import asyncio
+
+import pytest
+
+import broadcaster
+import fec
+import sessions
+
+
+class Transmitter(broadcaster.FakeSink):
+    """Fake sink that takes airtime for each round, like the radio."""
+
+    def __init__(self, airtime=.005, close_time=0):
+        super().__init__()
+        self.airtime = airtime
+        self.close_time = close_time
+        self.closed = 0
+        self.failures = set()
+
+    async def send(self, ssid, password, send_flag, possible_loss):
+        await asyncio.sleep(self.airtime)
+        if ssid in self.failures:
+            raise OSError('Broadcast worker replied error')
+        await super().send(ssid, password, send_flag, possible_loss)
+
+    async def close(self):
+        await asyncio.sleep(self.close_time)
+        self.closed += 1
+
+
+@pytest.fixture
+def transmitter():
+    return Transmitter()
+
+
+@pytest.fixture
+def scheduler(loop, transmitter):
+    scheduler = sessions.SessionScheduler(transmitter, wait_time=.01)
+    yield scheduler
+
+    for session in list(scheduler.sessions.values()):
+        scheduler.stop(session)
+    if scheduler._task is not None:
+        loop.run_until_complete(scheduler._task)
+
+
+def session(ssid, expected=2, **kwargs):
+    return sessions.BroadcastSession(ssid, 'password', expected,
+                                     loss=fec.FixedLoss(.5), **kwargs)
+
+
+async def wait_for_rounds(transmitter, count):
+    while len(transmitter.rounds) < count:
+        await asyncio.sleep(.001)
+
+
+async def wait_for_session_rounds(session, count):
+    while session.rounds < count:
+        await asyncio.sleep(.001)
+
+
+def ssids(transmitter):
+    return [r[0] for r in transmitter.rounds]
+
+
+def test_sessions_take_turns(loop, scheduler, transmitter):
+    for ssid in ('floor-1', 'floor-2', 'floor-3'):
+        scheduler.add(session(ssid))
+
+    loop.run_until_complete(wait_for_rounds(transmitter, 9))
+
+    assert ssids(transmitter)[:9] == ['floor-1', 'floor-2', 'floor-3'] * 3
+
+
+def test_send_flag_alternates_per_session(loop, scheduler, transmitter):
+    scheduler.add(session('a'))
+    scheduler.add(session('b'))
+
+    loop.run_until_complete(wait_for_rounds(transmitter, 6))
+
+    flags = [(r[0], r[2]) for r in transmitter.rounds[:6]]
+    assert flags == [('a', 0), ('b', 0), ('a', 1), ('b', 1), ('a', 0),
+                     ('b', 0)]
+
+
+def test_session_stops_when_sensors_are_found(loop, scheduler, transmitter):
+    finished = []
+
+    async def on_finished(session):
+        finished.append(session)
+
+    scheduler.on_finished = on_finished
+    first = session('a', expected=2)
+    second = session('b', expected=1)
+    scheduler.add(first)
+    scheduler.add(second)
+
+    async def run():
+        await wait_for_rounds(transmitter, 2)
+        assert scheduler.add_sensor(second, 'sensor-1')
+        count = len(transmitter.rounds)
+        await wait_for_rounds(transmitter, count + 4)
+
+    loop.run_until_complete(run())
+
+    assert not second.running
+    assert finished == [second]
+    assert list(scheduler.sessions) == [first.id]
+    # Only the running session goes on air once the other is done
+    assert set(ssids(transmitter)[-3:]) == {'a'}
+
+
+def test_stop_cancels_round_on_air(loop, scheduler, transmitter):
+    transmitter.airtime = 10
+    first = session('a')
+    scheduler.add(first)
+
+    async def run():
+        await asyncio.sleep(.01)
+        scheduler.stop(first)
+        await scheduler._task
+
+    loop.run_until_complete(run())
+
+    assert first.rounds == 0
+    assert transmitter.rounds == []
+    assert transmitter.closed == 1
+
+
+def test_failed_rounds_are_not_counted(loop, scheduler, transmitter):
+    transmitter.failures.add('broken')
+    broken = session('broken')
+    working = session('working')
+    scheduler.add(broken)
+    scheduler.add(working)
+
+    loop.run_until_complete(wait_for_session_rounds(working, 3))
+
+    assert broken.rounds == 0
+    assert broken.send_flag == 0
+
+
+def test_session_added_while_closing(loop, scheduler, transmitter):
+    transmitter.close_time = .05
+    first = session('a', expected=1)
+    scheduler.add(first)
+
+    async def run():
+        await wait_for_rounds(transmitter, 1)
+        scheduler.add_sensor(first, 'sensor-1')
+        # Let the task finish the session and start closing the sink
+        await asyncio.sleep(.02)
+        assert transmitter.closed == 0
+        second = session('b')
+        scheduler.add(second)
+        count = len(transmitter.rounds)
+        await asyncio.wait_for(wait_for_rounds(transmitter, count + 1), 1)
+        return second
+
+    second = loop.run_until_complete(run())
+
+    assert second.rounds >= 1
+
+
+def test_route(loop, scheduler):
+    first = session('net')
+    second = session('other')
+    scheduler.add(first)
+    scheduler.add(second)
+
+    assert scheduler.route(ssid='net') is first
+    assert scheduler.route(session_id=second.id) is second
+    assert scheduler.route(ssid='missing') is None
+    # Ambiguous without an SSID or session id
+    assert scheduler.route() is None
+
+
+def test_route_skips_stopped_sessions(loop, scheduler):
+    first = session('net')
+    scheduler.add(first)
+    scheduler.stop(first)
+
+    assert scheduler.route(ssid='net') is None
+
+
+def test_stats(loop, scheduler, transmitter):
+    first = session('a')
+    scheduler.add(first)
+    loop.run_until_complete(wait_for_session_rounds(first, 2))
+    scheduler.add_sensor(first, 'sensor-1')
+
+    stats = scheduler.stats()
+
+    assert 0 < stats['radio_utilization'] <= 1
+    session_stats, = stats['sessions']
+    assert session_stats['ssid'] == 'a'
+    assert session_stats['found_sensors'] == 1
+    assert session_stats['rounds'] >= 2
+    assert session_stats['airtime'] > 0
+
+
+def test_only_listed_hostnames_count():
+    roster_session = session('net', expected=None,
+                             hostnames={'sensor-1', 'sensor-2'})
+
+    assert roster_session.expected_sensors == 2
+    assert not roster_session.add_sensor('stray')
+    assert roster_session.add_sensor('sensor-1')
+    assert roster_session.running
+    assert roster_session.add_sensor('sensor-2')
+    assert not roster_session.running
@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import TESTS
+
+SIMULATE = os.path.join(os.path.dirname(TESTS), 'bench', 'simulate.py')
+
+
+def simulate(*args):
+    output = subprocess.check_output(
+        [sys.executable, SIMULATE, '--json', '--sensors', '8'] + list(args),
+        timeout=120)
+    result = json.loads(output.decode())
+    # The only number that depends on the machine
+    del result['wall_seconds']
+    return result
+
+
+def test_all_sensors_are_provisioned():
+    result = simulate('--seed', '7')
+
+    assert result['provisioned'] == 8
+    times = result['time_to_provision']
+    assert 0 < times['p50'] <= times['p90'] <= times['p99'] <= times['max']
+    assert times['max'] < result['virtual_seconds']
+    assert result['rounds'] > 0
+    assert result['airtime_seconds'] > 0
+    subprocesses = result['subprocesses']
+    assert subprocesses['ifup'] >= 8
+    assert subprocesses['iwlist'] >= 8
+    assert subprocesses['receive_wifi'] >= 8
+
+
+def test_loss_policies():
+    output = subprocess.check_output(
+        [sys.executable, SIMULATE, '--json', '--sensors', '8', '--seed', '7',
+         '--policy', 'fixed', 'adaptive'], timeout=120)
+    fixed, adaptive = json.loads(output.decode())
+
+    assert (fixed['policy'], adaptive['policy']) == ('fixed', 'adaptive')
+    for result in fixed, adaptive:
+        assert result['provisioned'] == 8
+        assert 0 < result['time_to_all_sensors'] <= result['virtual_seconds']
+    assert fixed['final_possible_loss'] == .8
+    # The fixed policy spends more airtime on redundancy per round
+    assert fixed['frames'] / fixed['rounds'] > \
+        adaptive['frames'] / adaptive['rounds']
+
+
+def test_same_seed_same_result():
+    assert simulate('--seed', '7') == simulate('--seed', '7')
+
+
+def test_settings_are_used(tmp_path):
+    settings = tmp_path / 'settings.json'
+    settings.write_text('{"BROADCAST_WAIT_TIME": 10}')
+
+    default = simulate('--seed', '7')
+    slow = simulate('--seed', '7', '--settings', str(settings))
+
+    assert slow['provisioned'] == 8
+    assert slow['virtual_seconds'] > default['virtual_seconds']
+    assert slow['airtime_seconds'] / slow['virtual_seconds'] < \
+        default['airtime_seconds'] / default['virtual_seconds']
+
+
+def test_sensors_reconnect_after_flaps():
+    result = simulate('--seed', '7', '--flaps', '3')
+
+    assert result['outages'] == 3
+    assert result['reconnected'] == 8 * 3
+    offline = result['time_offline']
+    reconnect = result['time_to_reconnect']
+    assert 0 < reconnect['mean'] <= offline['mean']
+    assert result['mean_time_to_recover'] > 0
+    assert result['subprocesses']['ifup'] >= 8 * 3
+
+
+def test_flap_trace(tmp_path):
+    trace = tmp_path / 'trace.txt'
+    trace.write_text('# one outage\n100 down\n160 up  # back\n')
+
+    result = simulate('--trace', str(trace))
+
+    assert result['outages'] == 1
+    assert result['reconnected'] == 8
+    assert result['time_offline']['max'] < result['virtual_seconds'] - 100
+
+
+def test_sensors_roam_to_backup():
+    alone = simulate('--seed', '7', '--flaps', '1')
+    backup = simulate('--seed', '7', '--flaps', '1',
+                      '--backup', 'Neighbour WPA')
+
+    assert backup['reconnected'] == backup['on_backup'] == 8
+    # No one waited for the access point to come back
+    assert backup['time_to_reconnect']['mean'] is None
+    assert backup['time_offline']['max'] < alone['time_offline']['p50']
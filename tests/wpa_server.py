@@ -0,0 +1,130 @@
+"""Fake wpa_supplicant control socket, for tests and benchmarks.
+
+Speaks enough of the control interface protocol for
+backends.WpaSupplicantBackend: each request is a datagram answered with
+one reply datagram, and attached clients also receive events such as
+<3>CTRL-EVENT-CONNECTED.
+"""
+import asyncio
+import os
+import socket
+
+
+def unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+
+    return value
+
+
+class FakeWpaSupplicant():
+    """Control socket for one interface in ctrl_dir.
+
+    networks maps the SSIDs in range to their passphrase. Selecting one
+    with the right passphrase connects after associate_time seconds and
+    calls on_connected(ssid), anything else is temporarily disabled.
+    Commands named in fail are answered with FAIL and those in silent are
+    never answered.
+    """
+
+    def __init__(self, ctrl_dir, interface='wlan0', networks=None,
+                 associate_time=.01, on_connected=None):
+        self.path = os.path.join(ctrl_dir, interface)
+        self.networks = networks or {}
+        self.associate_time = associate_time
+        self.on_connected = on_connected
+        self.fail = set()
+        self.silent = set()
+        self.commands = []
+        self.configs = {}
+        self.attached = set()
+        self._ids = 0
+        self._sock = None
+
+    def start(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        asyncio.get_event_loop().add_reader(sock.fileno(), self._read)
+        self._sock = sock
+
+    def close(self):
+        if self._sock is not None:
+            asyncio.get_event_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            os.unlink(self.path)
+
+    def _read(self):
+        try:
+            data, address = self._sock.recvfrom(4096)
+        except BlockingIOError:
+            return
+
+        command = data.decode()
+        self.commands.append(command)
+        name = command.split()[0]
+        if name in self.silent:
+            return
+
+        if name in self.fail:
+            reply = 'FAIL'
+        else:
+            reply = self._handle(name, command.split(' ')[1:], address)
+        self._send(address, reply)
+
+    def _handle(self, name, args, address):
+        if name == 'ATTACH':
+            self.attached.add(address)
+        elif name == 'DETACH':
+            self.attached.discard(address)
+        elif name == 'ADD_NETWORK':
+            network_id = str(self._ids)
+            self._ids += 1
+            self.configs[network_id] = {}
+            return network_id
+        elif name == 'SET_NETWORK':
+            network_id, key = args[:2]
+            if network_id not in self.configs:
+                return 'FAIL'
+            self.configs[network_id][key] = ' '.join(args[2:])
+        elif name == 'SELECT_NETWORK':
+            if args[0] not in self.configs:
+                return 'FAIL'
+            asyncio.get_event_loop().call_later(
+                self.associate_time, self._associate, args[0])
+        elif name == 'REMOVE_NETWORK':
+            if self.configs.pop(args[0], None) is None:
+                return 'FAIL'
+        else:
+            return 'UNKNOWN COMMAND'
+
+        return 'OK'
+
+    def _associate(self, network_id):
+        config = self.configs.get(network_id, {})
+        ssid = unquote(config.get('ssid', ''))
+        psk = unquote(config.get('psk', ''))
+        if ssid in self.networks and self.networks[ssid] == psk:
+            self._event('CTRL-EVENT-CONNECTED - Connection to '
+                        '14:cc:20:5a:11:02 completed [id={} id_str=]'
+                        .format(network_id))
+            if self.on_connected is not None:
+                self.on_connected(ssid)
+        else:
+            self._event('CTRL-EVENT-SSID-TEMP-DISABLED id={} ssid="{}" '
+                        'auth_failures=1 duration=10 reason=WRONG_KEY'
+                        .format(network_id, ssid))
+
+    def _event(self, text):
+        for address in list(self.attached):
+            self._send(address, '<3>' + text)
+
+    def _send(self, address, text):
+        if self._sock is None:
+            return
+        try:
+            self._sock.sendto(text.encode(), address)
+        except OSError:
+            # The client went away without detaching
+            self.attached.discard(address)
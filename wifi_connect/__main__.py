@@ -1,34 +1,30 @@
 import argparse
 import asyncio
 import functools
-import logging
-from logging import handlers
 import signal
 
-from aiohttp import web
-
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s:%(threadName)s:%(levelname)s:'
-                           '%(name)s:%(message)s',
-                    handlers=[
-                        handlers.TimedRotatingFileHandler(
-                            'prisms-wifi.log', when='midnight', backupCount=7,
-                            delay=True),
-                        logging.StreamHandler()])
+import logs
+import settings
 
 
 def ask_exit(signame):
     print("got signal %s: exit" % signame)
-    loop.stop()
+    asyncio.get_event_loop().stop()
 
-# Set up the loop
-loop = asyncio.get_event_loop()
 # for signame in ('SIGINT', 'SIGTERM'):
 #     loop.add_signal_handler(getattr(signal, signame),
 #                             functools.partial(ask_exit, signame))
 
 
 def run_gateway(args):
+    import roster
+
+    # Load the roster before serving, so /ping can check it without
+    # waiting on the database
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(roster.store.open())
+
+    from aiohttp import web
     from gateway_server import app
     web.run_app(app, port=3210)
 
@@ -36,15 +32,23 @@ def run_gateway(args):
 def run_sensor(args):
     import wifi
     import sensor_client
-    from sensor_server import app
 
-    app.interface = args.interface
+    loop = asyncio.get_event_loop()
+    wifi.backend_name = args.backend
 
     # Make sure interface file is configured correctly
     loop.run_until_complete(wifi.update_interfaces())
 
-    # Start process to listen for gateway broadcasts
-    asyncio.ensure_future(sensor_client.start(args.interface))
+    # Start process to listen for gateway broadcasts, and let it run up to
+    # its first wait before aiohttp and socketio are imported for the web
+    # server
+    asyncio.ensure_future(sensor_client.start(args.interface,
+                                              args.monitor_interfaces))
+    loop.run_until_complete(asyncio.sleep(0))
+
+    from aiohttp import web
+    from sensor_server import app
+    app.interface = args.interface
 
     # Start server
     web.run_app(app, port=3210)
@@ -52,16 +56,31 @@ def run_sensor(args):
 
 parser = argparse.ArgumentParser(
     description='Application to help sensors connect to WiFi')
+parser.add_argument('--settings',
+                    help='JSON file overriding timing constants and tool '
+                         'paths (default: $WIFI_CONNECT_SETTINGS)')
 subparsers = parser.add_subparsers(help='Which device to run application on',
                                    dest='type')
 subparsers.required = True
 
 parser_sensor = subparsers.add_parser('sensor')
 parser_sensor.add_argument('interface', help='Wireless interface to use')
+parser_sensor.add_argument('--backend',
+                           choices=['ifupdown', 'wpa_supplicant'],
+                           help='How to connect to a network (default: '
+                                'wpa_supplicant when its control socket '
+                                'exists, otherwise ifupdown)')
+parser_sensor.add_argument('--monitor-interface', action='append',
+                           dest='monitor_interfaces', default=[],
+                           help='Additional wireless interface to listen for '
+                                'the gateway on (can be repeated)')
 parser_sensor.set_defaults(func=run_sensor)
 
 parser_gateway = subparsers.add_parser('gateway')
 parser_gateway.set_defaults(func=run_gateway)
 
 args = parser.parse_args()
+logs.setup('prisms-wifi.log')
+settings.load(args.settings)
+logs.set_levels(settings.get('LOG_LEVELS', {}))
 args.func(args)
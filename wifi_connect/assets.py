@@ -0,0 +1,130 @@
+"""Serve the static files from memory, compressed and with cache headers.
+
+Each file is read and compressed once, off the event loop, the first time
+it is requested and then kept in a small LRU cache. Files with a version
+in their name never change, so browsers may keep them for good; the rest
+are revalidated with their ETag.
+"""
+import asyncio
+from collections import namedtuple, OrderedDict
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_LOGGER = logging.getLogger(__name__)
+STATIC_FOLDER = 'static'
+CACHE_SIZE = 16
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+versioned_re = re.compile(r'-\d+(?:\.\d+)+\.')
+
+Asset = namedtuple('Asset', ['content_type', 'etag', 'cache_control',
+                             'encodings'])
+
+
+def load(path):
+    """Read path and return an Asset with every encoding that is smaller."""
+    with open(path, 'rb') as f:
+        body = f.read()
+
+    encodings = OrderedDict()
+    if brotli is not None:
+        encodings['br'] = brotli.compress(body)
+    encodings['gzip'] = gzip.compress(body, 9)
+    encodings = OrderedDict((name, data) for name, data in encodings.items()
+                            if len(data) < len(body))
+    encodings['identity'] = body
+
+    name = os.path.basename(path)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    cache_control = IMMUTABLE if versioned_re.search(name) else REVALIDATE
+    etag = hashlib.sha1(body).hexdigest()[:16]
+    return Asset(content_type, etag, cache_control, encodings)
+
+
+def accepted_encodings(header):
+    """Encodings named in an Accept-Encoding header, without q=0 ones."""
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if name and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.lower())
+
+    return accepted
+
+
+class AssetStore():
+    def __init__(self, folder=STATIC_FOLDER, cache_size=CACHE_SIZE):
+        self.folder = folder
+        self.cache_size = cache_size
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0,
+                      'bytes_sent': 0}
+        self._cache = OrderedDict()
+
+    async def get(self, name):
+        if name in self._cache:
+            self.stats['hits'] += 1
+            self._cache.move_to_end(name)
+            return self._cache[name]
+
+        self.stats['misses'] += 1
+        loop = asyncio.get_event_loop()
+        asset = await loop.run_in_executor(
+            None, load, os.path.join(self.folder, name))
+
+        self._cache[name] = asset
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return asset
+
+    async def respond(self, request, name):
+        # Only plain file names directly in the folder are served
+        if os.path.basename(name) != name or name.startswith('.'):
+            raise web.HTTPNotFound()
+
+        try:
+            asset = await self.get(name)
+        except (FileNotFoundError, IsADirectoryError):
+            raise web.HTTPNotFound()
+
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding',
+                                                          ''))
+        encoding = next(e for e in asset.encodings
+                        if e in accepted or e == 'identity')
+
+        # Strong ETags differ between the encoded forms of the same file
+        etag = '"{}-{}"'.format(asset.etag, encoding)
+        headers = {'ETag': etag,
+                   'Cache-Control': asset.cache_control,
+                   'Vary': 'Accept-Encoding'}
+
+        if etag in request.headers.get('If-None-Match', ''):
+            self.stats['not_modified'] += 1
+            return web.Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        body = asset.encodings[encoding]
+        self.stats['bytes_sent'] += len(body)
+        return web.Response(body=body, headers=headers,
+                            content_type=asset.content_type)
+
+    async def handle(self, request):
+        return await self.respond(request, request.match_info['name'])
+
+
+store = AssetStore()
@@ -0,0 +1,252 @@
+import asyncio
+import itertools
+import logging
+import os
+import re
+import socket
+import tempfile
+
+import interfaces
+import linkstate
+import runner
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+ADDRESS_WAIT_TIME = settings.get('ADDRESS_WAIT_TIME', 10)
+IFDOWN_TIMEOUT = settings.get('IFDOWN_TIMEOUT', 30)
+IFUP_TIMEOUT = settings.get('IFUP_TIMEOUT', 90)
+ASSOCIATE_WAIT_TIME = settings.get('ASSOCIATE_WAIT_TIME', 15)
+REQUEST_WAIT_TIME = settings.get('REQUEST_WAIT_TIME', 5)
+IFUP = settings.get('IFUP', 'ifup')
+IFDOWN = settings.get('IFDOWN', 'ifdown')
+CTRL_DIR = settings.get('CTRL_DIR', '/var/run/wpa_supplicant')
+
+bound_ip_re = re.compile(r'^bound to (?P<ip_address>\S+)', flags=re.MULTILINE)
+_counter = itertools.count()
+
+
+class IfupdownBackend():
+    """Reconnect by taking the interface down and up with ifupdown."""
+    name = 'ifupdown'
+
+    def available(self, interface):
+        return True
+
+    async def connect(self, interface):
+        _LOGGER.debug("Calling ifdown")
+        await runner.run(IFDOWN, interface, timeout=IFDOWN_TIMEOUT,
+                         interface=interface)
+
+        _LOGGER.debug("Calling ifup")
+        result = await runner.run(IFUP, interface, timeout=IFUP_TIMEOUT,
+                                  interface=interface)
+        output = result.stderr.decode()
+        matches = bound_ip_re.search(output)
+        if matches:
+            return matches.group('ip_address')
+
+        # The lease may not have been reported on stderr, so wait for the
+        # address to show up on the interface instead
+        if result.returncode != 0:
+            return None
+
+        return await linkstate.monitor.wait_for_address(interface,
+                                                        ADDRESS_WAIT_TIME)
+
+
+class WpaControl():
+    """Client for the wpa_supplicant control interface of one interface."""
+
+    def __init__(self, path):
+        self.path = path
+        self.events = asyncio.Queue()
+        self._sock = None
+        self._local = None
+        self._reply = None
+
+    def open(self):
+        self._local = os.path.join(
+            tempfile.gettempdir(),
+            'wifi_connect-{}-{}'.format(os.getpid(), next(_counter)))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(self._local)
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            self._unlink()
+            raise
+
+        sock.setblocking(False)
+        asyncio.get_event_loop().add_reader(sock.fileno(), self._read)
+        self._sock = sock
+
+    def close(self):
+        if self._sock is not None:
+            asyncio.get_event_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+        self._unlink()
+
+    def _unlink(self):
+        try:
+            os.unlink(self._local)
+        except OSError:
+            pass
+
+    def _read(self):
+        try:
+            data = self._sock.recv(4096).decode(errors='replace')
+        except BlockingIOError:
+            return
+
+        # Unsolicited events start with a priority such as <3>
+        if data.startswith('<'):
+            self.events.put_nowait(data.split('>', 1)[-1].strip())
+        elif self._reply is not None and not self._reply.done():
+            self._reply.set_result(data.strip())
+
+    async def request(self, command):
+        self._reply = asyncio.get_event_loop().create_future()
+        self._sock.send(command.encode())
+        reply = await asyncio.wait_for(self._reply, REQUEST_WAIT_TIME)
+        _LOGGER.debug("%s: %s", command.split()[0], reply)
+
+        if reply.startswith('FAIL'):
+            raise OSError('{} failed: {}'.format(command.split()[0], reply))
+
+        return reply
+
+    async def wait_for_event(self, prefixes, timeout):
+        """Return the first event starting with one of prefixes."""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            event = await asyncio.wait_for(self.events.get(), remaining)
+            if event.startswith(prefixes):
+                return event
+
+
+class WpaSupplicantBackend():
+    """Switch networks through a running wpa_supplicant's control socket.
+
+    The interface stays up, so only association and addressing are
+    repeated. The address is expected from the DHCP client that already
+    watches the interface (dhcpcd, or dhclient started by ifupdown).
+
+    Networks without a WPA configuration, such as WEP ones, failures to
+    talk to wpa_supplicant and associations that get no new lease fall
+    back to ifupdown.
+    """
+    name = 'wpa_supplicant'
+
+    def __init__(self, ctrl_dir=CTRL_DIR, fallback=None):
+        self.ctrl_dir = ctrl_dir
+        self.fallback = fallback or IfupdownBackend()
+        self._network_ids = {}
+
+    def ctrl_path(self, interface):
+        return os.path.join(self.ctrl_dir, interface)
+
+    def available(self, interface):
+        return (os.path.exists(self.ctrl_path(interface)) and
+                _has_wpa_options(interfaces.store.options(interface)))
+
+    async def connect(self, interface):
+        options = interfaces.store.options(interface)
+        if not _has_wpa_options(options):
+            _LOGGER.debug("No WPA configuration for %s, using %s", interface,
+                          self.fallback.name)
+            return await self.fallback.connect(interface)
+
+        ssid = interfaces.unquote(options['wpa-ssid'])
+        psk = interfaces.unquote(options['wpa-psk'])
+
+        try:
+            return await self._connect(interface, ssid, psk)
+        except (OSError, asyncio.TimeoutError) as e:
+            # A stale control socket refuses connections, a hung
+            # wpa_supplicant times out
+            _LOGGER.warning("wpa_supplicant control failed (%r), using %s",
+                            e, self.fallback.name)
+            return await self.fallback.connect(interface)
+
+    async def _connect(self, interface, ssid, psk):
+        ctrl = WpaControl(self.ctrl_path(interface))
+        ctrl.open()
+        try:
+            await ctrl.request('ATTACH')
+
+            old_id = self._network_ids.pop(interface, None)
+            if old_id is not None:
+                try:
+                    await ctrl.request('REMOVE_NETWORK {}'.format(old_id))
+                except OSError:
+                    pass
+
+            network_id = await ctrl.request('ADD_NETWORK')
+            self._network_ids[interface] = network_id
+
+            # A 64 character key is the derived PSK and is sent unquoted
+            if len(psk) != 64:
+                psk = '"{}"'.format(psk)
+
+            await ctrl.request('SET_NETWORK {} ssid "{}"'.format(network_id,
+                                                                 ssid))
+            await ctrl.request('SET_NETWORK {} psk {}'.format(network_id, psk))
+            await ctrl.request('SELECT_NETWORK {}'.format(network_id))
+
+            # The interface is never taken down, so it may still have the
+            # lease from the old network. Only a lease that arrives after
+            # switching counts.
+            lease = linkstate.monitor.next_address(interface)
+
+            try:
+                event = await ctrl.wait_for_event(
+                    ('CTRL-EVENT-CONNECTED', 'CTRL-EVENT-SSID-TEMP-DISABLED'),
+                    ASSOCIATE_WAIT_TIME)
+            except asyncio.TimeoutError:
+                _LOGGER.debug("Timed out associating with %s", ssid)
+                lease.cancel()
+                return None
+
+            if not event.startswith('CTRL-EVENT-CONNECTED'):
+                _LOGGER.debug("Association failed: %s", event)
+                lease.cancel()
+                return None
+
+            await ctrl.request('DETACH')
+        finally:
+            ctrl.close()
+
+        address = await linkstate.monitor.wait_for_address(
+            interface, ADDRESS_WAIT_TIME, lease=lease)
+        if address is None:
+            # dhclient started by ifupdown keeps its old lease when the
+            # network changes under it, ifup starts it again
+            _LOGGER.debug("Associated with %s but got no new lease, using %s",
+                          ssid, self.fallback.name)
+            return await self.fallback.connect(interface)
+
+        return address
+
+
+def _has_wpa_options(options):
+    return 'wpa-ssid' in options and 'wpa-psk' in options
+
+
+BACKENDS = [WpaSupplicantBackend(), IfupdownBackend()]
+
+
+def get_backend(interface, name=None):
+    """Return the backend called name, or the first one available."""
+    for backend in BACKENDS:
+        if name is None and backend.available(interface):
+            return backend
+        if backend.name == name:
+            return backend
+
+    raise ValueError('Unknown connection backend: {}'.format(name))
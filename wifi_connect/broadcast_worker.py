@@ -0,0 +1,53 @@
+"""Long-lived worker that runs send_wifi.py rounds requested over stdin.
+
+Each line on stdin is a JSON object with ssid, password, send_flag and
+possible_loss. One line is written to stdout when the round is done,
+either "done" or "error: " and the reason.
+
+The worker runs on the same interpreter as send_wifi.py, which may be
+Python 2, so it must stay compatible with both.
+"""
+import json
+import runpy
+import sys
+
+
+def send_round(script, request):
+    sys.argv = [script,
+                '-l', str(request['possible_loss']),
+                '-s', str(request['send_flag']),
+                request['ssid'], request['password']]
+
+    # send_wifi.py prints its own progress, keep stdout for replies
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError('send_wifi.py exited with {}'.format(e.code))
+    finally:
+        sys.stdout = stdout
+
+
+def main(script):
+    # readline() rather than iterating, which reads ahead on Python 2 and
+    # would never see a request while stdin stays open
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+
+        try:
+            send_round(script, json.loads(line))
+            sys.stdout.write('done\n')
+        except Exception as e:
+            sys.stdout.write('error: {}\n'.format(e))
+
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
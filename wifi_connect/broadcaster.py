@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import runner
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+SEND_WIFI_SCRIPT = settings.get('SEND_WIFI_SCRIPT',
+                                '/home/pi/unassociated_transfer/send_wifi.py')
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'broadcast_worker.py')
+ROUND_TIMEOUT = settings.get('ROUND_TIMEOUT', 5 * 60)
+SEND_PYTHON = settings.get('SEND_PYTHON', 'python')
+
+
+class SubprocessSink():
+    """Start a new send_wifi.py process for every round."""
+
+    def __init__(self, script=SEND_WIFI_SCRIPT, python=SEND_PYTHON):
+        self.script = script
+        self.python = python
+
+    async def send(self, ssid, password, send_flag, possible_loss):
+        await runner.run(self.python,
+                         self.script,
+                         '-l', str(possible_loss),
+                         '-s', str(send_flag),
+                         ssid, password,
+                         name='send_wifi',
+                         timeout=ROUND_TIMEOUT)
+
+    async def close(self):
+        pass
+
+
+class WorkerSink():
+    """Feed rounds to one long-lived broadcast_worker.py process.
+
+    The worker keeps the interpreter and everything send_wifi.py imports
+    loaded between rounds, so a round only pays for putting frames on air.
+    """
+
+    def __init__(self, script=SEND_WIFI_SCRIPT, python=SEND_PYTHON):
+        self.script = script
+        self.python = python
+        self._worker = None
+        self._proc = None
+        self._stderr = None
+        self._lock = asyncio.Lock()
+
+    async def _start(self):
+        _LOGGER.debug("Starting broadcast worker")
+        self._worker = runner.spawn(self.python, '-u', WORKER_SCRIPT,
+                                    self.script,
+                                    name='broadcast_worker', stdin=True)
+        self._proc = await self._worker.start()
+        self._stderr = asyncio.ensure_future(self._log_stderr(self._proc))
+
+    async def _log_stderr(self, proc):
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                break
+            _LOGGER.debug("send_wifi: %s",
+                          line.decode(errors='replace').rstrip())
+
+    async def _stop(self):
+        if self._worker is None:
+            return
+
+        worker, self._worker, self._proc = self._worker, None, None
+        await worker.close()
+        await self._stderr
+
+    async def send(self, ssid, password, send_flag, possible_loss):
+        """Broadcast one round. Raises OSError if the worker did not finish
+        it, so it is not counted."""
+        async with self._lock:
+            if self._proc is None or self._proc.returncode is not None:
+                await self._stop()
+                await self._start()
+
+            request = {'ssid': ssid,
+                       'password': password,
+                       'send_flag': send_flag,
+                       'possible_loss': possible_loss}
+            start = time.monotonic()
+            try:
+                self._proc.stdin.write(json.dumps(request).encode() + b'\n')
+                await self._proc.stdin.drain()
+                line = await asyncio.wait_for(self._proc.stdout.readline(),
+                                              ROUND_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self._stop()
+                raise OSError('Broadcast round timed out, restarting worker')
+            except asyncio.CancelledError:
+                # The worker is mid-round, stop it rather than read its
+                # reply as the answer to the next round
+                await self._stop()
+                raise
+
+            if not line:
+                await self._stop()
+                raise OSError('Broadcast worker exited unexpectedly')
+
+            reply = line.decode(errors='replace').strip()
+            if reply != 'done':
+                raise OSError('Broadcast worker replied {!r}'.format(reply))
+
+            runner.executor.record('send_wifi_round', time.monotonic() - start)
+
+    async def close(self):
+        if self._proc is not None and self._proc.returncode is None:
+            _LOGGER.debug("Stopping broadcast worker")
+            self._proc.stdin.close()
+            await self._proc.wait()
+
+        await self._stop()
+
+
+class FakeSink():
+    """Record rounds instead of putting them on air."""
+
+    def __init__(self):
+        self.rounds = []
+
+    async def send(self, ssid, password, send_flag, possible_loss):
+        self.rounds.append((ssid, password, send_flag, possible_loss))
+
+    async def close(self):
+        pass
+
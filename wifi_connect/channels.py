@@ -0,0 +1,93 @@
+import logging
+import time
+
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+CHANNELS = range(1, 12)
+MAX_DWELL_TIME = settings.get('MAX_DWELL_TIME', 15)
+MIN_DWELL_TIME = settings.get('MIN_DWELL_TIME', 3)
+HALF_LIFE = 30 * 60
+TRAFFIC_WEIGHT = 10
+AP_WEIGHT = 1
+STRONG_SIGNAL = -70
+
+
+class ChannelScheduler():
+    """Decide which channels to listen on first and for how long.
+
+    Channels where the gateway was heard recently, or where strong access
+    points were seen, get a higher score and are listened on first.
+    Scores decay over time so an old observation does not pin the sweep
+    to a channel forever. Only channels where the gateway was heard get
+    the full dwell time; the others are probed briefly, and every sweep
+    that comes back empty widens the probe until it reaches the full
+    dwell time.
+    """
+
+    def __init__(self, channels=CHANNELS, max_dwell=MAX_DWELL_TIME,
+                 min_dwell=MIN_DWELL_TIME, half_life=HALF_LIFE):
+        self.channels = list(channels)
+        self.max_dwell = max_dwell
+        self.min_dwell = min_dwell
+        self.half_life = half_life
+        self.failed_sweeps = 0
+        self._scores = {}
+        self._traffic = {}
+
+    def _decayed(self, scores, channel):
+        if channel not in scores:
+            return 0
+
+        score, updated = scores[channel]
+        age = time.time() - updated
+        return score * 0.5 ** (age / self.half_life)
+
+    def _add(self, scores, channel, weight):
+        if channel not in self.channels:
+            return
+
+        scores[channel] = (self._decayed(scores, channel) + weight,
+                           time.time())
+
+    def score(self, channel):
+        return self._decayed(self._scores, channel)
+
+    def traffic(self, channel):
+        """Score of channel from gateway traffic alone."""
+        return self._decayed(self._traffic, channel)
+
+    def record_traffic(self, channel):
+        _LOGGER.debug("Recording gateway traffic on channel %s", channel)
+        self.failed_sweeps = 0
+        self._add(self._scores, channel, TRAFFIC_WEIGHT)
+        self._add(self._traffic, channel, TRAFFIC_WEIGHT)
+
+    def record_access_points(self, networks):
+        for network in networks:
+            if network.channel is None:
+                continue
+            if network.signal is not None and network.signal < STRONG_SIGNAL:
+                continue
+
+            self._add(self._scores, network.channel, AP_WEIGHT)
+
+    def record_failed_sweep(self):
+        self.failed_sweeps += 1
+
+    def order(self):
+        return sorted(self.channels, key=lambda c: (-self.score(c), c))
+
+    def dwell(self, channel):
+        # Access points only say where a gateway might be, which is enough
+        # to listen there first but not to listen there longer
+        if self.traffic(channel) >= TRAFFIC_WEIGHT / 2:
+            return self.max_dwell
+
+        dwell = self.min_dwell * 2 ** self.failed_sweeps
+        return min(dwell, self.max_dwell)
+
+    def split(self, count):
+        """Split the channel order between count radios."""
+        order = self.order()
+        return [order[i::count] for i in range(count)]
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import interfaces
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+CREDENTIALS_FILE = settings.get('CREDENTIALS_FILE',
+                                '/etc/wifi_connect/networks.json')
+
+
+class CredentialStore():
+    """Networks the sensor has credentials for, ranked by priority.
+
+    Each entry keeps the key as written to the interface configuration
+    (the derived PSK for WPA networks), the BSSID and channel it was last
+    seen on and how often connecting to it worked.
+    """
+
+    def __init__(self, filename=CREDENTIALS_FILE):
+        self.filename = filename
+        self._networks = None
+
+    @property
+    def networks(self):
+        if self._networks is None:
+            try:
+                with open(self.filename) as f:
+                    self._networks = json.load(f)
+            except FileNotFoundError:
+                self._networks = {}
+            except ValueError:
+                _LOGGER.exception("Credential file is corrupt, ignoring it")
+                self._networks = {}
+
+        return self._networks
+
+    def ranked(self):
+        def rank(entry):
+            attempts = entry['successes'] + entry['failures']
+            ratio = entry['successes'] / attempts if attempts else 0
+            return (-entry['priority'], -ratio, -entry['last_connected'])
+
+        return sorted(self.networks.values(), key=rank)
+
+    def get(self, ssid):
+        return self.networks.get(ssid)
+
+    async def add(self, ssid, encryption, key, priority=None):
+        """Store credentials. New networks go to the top unless a priority
+        is given; known networks keep their rank."""
+        entry = self.networks.get(ssid)
+
+        if entry is None:
+            if priority is None:
+                priority = max((e['priority'] for e in self.networks.values()),
+                               default=0) + 1
+            entry = {'ssid': ssid,
+                     'priority': priority,
+                     'bssid': None,
+                     'channel': None,
+                     'successes': 0,
+                     'failures': 0,
+                     'last_connected': 0}
+            self.networks[ssid] = entry
+        elif priority is not None:
+            entry['priority'] = priority
+
+        entry['encryption'] = encryption
+        entry['key'] = key
+        await self.save()
+
+    async def remove(self, ssid):
+        if self.networks.pop(ssid, None) is not None:
+            await self.save()
+
+    def candidates(self, scanned):
+        """Known networks in scanned, best first, with where they were seen."""
+        seen = {}
+        for network in scanned:
+            best = seen.get(network.ssid)
+            signal = network.signal or -100
+            if best is None or signal > (best.signal or -100):
+                seen[network.ssid] = network
+
+        candidates = []
+        for entry in self.ranked():
+            network = seen.get(entry['ssid'])
+            if network is not None:
+                entry['bssid'] = network.bssid
+                entry['channel'] = network.channel
+                candidates.append(entry)
+
+        return candidates
+
+    async def record_result(self, ssid, connected):
+        entry = self.networks.get(ssid)
+        if entry is None:
+            return
+
+        if connected:
+            entry['successes'] += 1
+            entry['last_connected'] = time.time()
+        else:
+            entry['failures'] += 1
+
+        await self.save()
+
+    async def save(self):
+        text = json.dumps(self.networks, indent=2, sort_keys=True)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._write, text)
+
+    def _write(self, text):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        interfaces.write_atomic(self.filename, text)
+
+
+store = CredentialStore()
@@ -0,0 +1,69 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+MIN_LOSS = .2
+MAX_LOSS = .9
+LOSS_STEP = .1
+STALL_ROUNDS = 4
+FEEDBACK_MARGIN = .1
+
+
+class FixedLoss():
+    """Always send with the same expected loss rate."""
+
+    def __init__(self, possible_loss=.8):
+        self.possible_loss = possible_loss
+
+    def round_finished(self, found_sensors, expected_sensors):
+        pass
+
+    def report_loss(self, loss):
+        pass
+
+
+class AdaptiveLoss():
+    """Raise the expected loss rate (and so the FEC redundancy) only when
+    sensors stop checking in.
+
+    Broadcasting starts with little redundancy so clean RF environments
+    are served quickly. Every STALL_ROUNDS rounds without a new sensor
+    raise the level one step, twice as often once half of the expected
+    sensors are in. Loss rates reported by sensors set a floor
+    for the level. The level never goes down during a session: the
+    sensors still missing are the ones with the worst links.
+    """
+
+    def __init__(self, min_loss=MIN_LOSS, max_loss=MAX_LOSS,
+                 step=LOSS_STEP, stall_rounds=STALL_ROUNDS):
+        self.max_loss = max_loss
+        self.step = step
+        self.stall_rounds = stall_rounds
+        self.possible_loss = min_loss
+        self._stalled = 0
+        self._found = 0
+
+    def round_finished(self, found_sensors, expected_sensors):
+        if found_sensors > self._found:
+            self._found = found_sensors
+            self._stalled = 0
+            return
+
+        # Once most sensors are in, the rest are in poor spots and waiting
+        # at the current level is unlikely to help
+        stall_rounds = self.stall_rounds
+        if found_sensors * 2 >= expected_sensors > 0:
+            stall_rounds = max(1, stall_rounds // 2)
+
+        self._stalled += 1
+        if self._stalled >= stall_rounds:
+            self._stalled = 0
+            self._raise(self.possible_loss + self.step)
+
+    def report_loss(self, loss):
+        self._raise(loss + FEEDBACK_MARGIN)
+
+    def _raise(self, loss):
+        loss = round(min(loss, self.max_loss), 2)
+        if loss > self.possible_loss:
+            _LOGGER.debug("Raising expected loss to %s", loss)
+            self.possible_loss = loss
@@ -0,0 +1,88 @@
+"""Tell the gateway that a sensor has joined its network.
+
+The session is kept for the life of the process, so its connection pool
+and resolved gateway address are reused between pings.
+"""
+import asyncio
+import logging
+import random
+
+import aiohttp
+
+import reconfigure
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+GATEWAY_URL = settings.get('GATEWAY_URL', 'http://gateway.local:3210/ping')
+REQUEST_TIMEOUT = settings.get('REQUEST_TIMEOUT', 10)
+PING_DEADLINE = settings.get('PING_DEADLINE', 60)
+RETRY_TIME = 1
+MAX_RETRY_TIME = 10
+
+
+class GatewayClient():
+    def __init__(self, url=GATEWAY_URL):
+        self.url = url
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(use_dns_cache=True)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _post(self, data):
+        async with self.session.post(self.url, data=data) as response:
+            text = await response.text()
+            return response.status, text
+
+    async def ping(self, sensor, ssid, deadline=PING_DEADLINE, **health):
+        """Report sensor on ssid, retrying until deadline seconds pass.
+
+        health holds optional fields such as signal, channel and
+        time_to_connect; the ones that are None are left out.
+        """
+        data = {'sensor': sensor, 'ssid': ssid}
+        data.update((k, str(v)) for k, v in health.items() if v is not None)
+
+        loop = asyncio.get_event_loop()
+        end = loop.time() + deadline
+        attempt = 0
+        while True:
+            try:
+                status, text = await asyncio.wait_for(self._post(data),
+                                                      REQUEST_TIMEOUT)
+                if status < 500:
+                    _LOGGER.debug("Gateway replied (%s): %s", status, text)
+                    return status == 200
+                _LOGGER.debug("Gateway error (%s): %s", status, text)
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                _LOGGER.debug("Unable to reach gateway: %r", e)
+
+            # Exponential backoff with full jitter, cut short by the deadline
+            delay = random.uniform(
+                0, min(MAX_RETRY_TIME, RETRY_TIME * 2 ** attempt))
+            attempt += 1
+            if loop.time() + delay >= end:
+                _LOGGER.warning("Giving up pinging the gateway after %s "
+                                "attempts", attempt)
+                return False
+            await asyncio.sleep(delay)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+client = GatewayClient()
+
+
+def network_changed(interface, ssid):
+    # The gateway's address and any pooled connections belong to the old
+    # network
+    client.close()
+
+
+reconfigure.add_listener(network_changed)
@@ -1,169 +1,287 @@
-import asyncio
+import csv
+import json
 import logging
 
 from aiohttp import web
 import socketio
 
-# from send_wifi import main as send_wifi
-
-import utils
-import wifi
+import assets
+import broadcaster
+import logs
+import metrics
+import publisher
+import roster
+import sessions
 
 
 _LOGGER = logging.getLogger(__name__)
-BROADCAST_WAIT_TIME = 2
+pings = metrics.counter('wifi_connect_sensor_pings_total',
+                        'Pings from sensors by outcome', ['result'])
+running_sessions = metrics.gauge('wifi_connect_sessions_running',
+                                 'Broadcast sessions running')
+sensor_metrics = {}
 
 sio = socketio.AsyncServer()
 app = web.Application()
 sio.attach(app)
+updates = publisher.Publisher(sio)
+
+
+async def session_finished(session):
+    updates.update(session.room, 'broadcast-update',
+                   message='Stopped ({})'.format(session.ssid))
+    publish_status()
+    await roster.store.flush()
+    await roster.store.record_session(session)
+    await updates.flush()
+    updates.forget(session.room)
+
 
-broadcasting = False
-sensor_queue = asyncio.Queue()
+scheduler = sessions.SessionScheduler(broadcaster.WorkerSink(),
+                                      on_finished=session_finished)
 
 
 async def index(request):
     """Serve the client-side application."""
-    with open('static/gateway-index.html') as f:
-        return web.Response(text=f.read(), content_type='text/html')
+    return await assets.store.respond(request, 'gateway-index.html')
 
 
 async def sensor_ping(request):
-    if not broadcasting:
+    if not scheduler.active:
+        pings.inc(result='not_broadcasting')
         return web.Response(text='Not broadcasting', content_type='text')
     data = await request.post()
 
     if 'sensor' not in data:
+        pings.inc(result='invalid')
         return web.Response(text='Must have sensor field', content_type='text')
 
-    sensor_queue.put_nowait(data['sensor'])
+    if 'metrics' in data:
+        sensor_metrics[data['sensor']] = data['metrics']
+
+    session = scheduler.route(ssid=data.get('ssid'),
+                              session_id=data.get('session'))
+    if session is None:
+        pings.inc(result='no_session')
+        return web.Response(text='No matching broadcast', content_type='text')
+
+    if 'loss' in data:
+        try:
+            session.loss.report_loss(float(data['loss']))
+        except ValueError:
+            _LOGGER.warning("Invalid loss reported: %s", data['loss'])
+
+    _LOGGER.debug("Sensor %s joined (signal %s, channel %s, %ss to "
+                  "connect)", data['sensor'], data.get('signal'),
+                  data.get('channel'), data.get('time_to_connect'))
+    if not session.expects(data['sensor']):
+        # Strays are kept in the history, but do not count towards the
+        # sensors the broadcast waits for
+        pings.inc(result='stray')
+        _LOGGER.warning("Sensor %s is not expected by session %s",
+                        data['sensor'], session.id)
+        roster.store.record_provisioning(session, data['sensor'],
+                                         data.get('time_to_connect'),
+                                         data.get('signal'),
+                                         data.get('channel'))
+        return web.Response(text='Sensor is not expected',
+                            content_type='text')
+
+    if scheduler.add_sensor(session, data['sensor']):
+        pings.inc(result='added')
+        roster.store.record_provisioning(session, data['sensor'],
+                                         data.get('time_to_connect'),
+                                         data.get('signal'),
+                                         data.get('channel'))
+        updates.add(session.room, 'broadcast-update', 'sensors',
+                    [data['sensor']])
+    else:
+        pings.inc(result='duplicate')
     return web.Response(text='Sensor has been added', content_type='text')
 
 
-@sio.on('status')
+async def session_stats(request):
+    stats = scheduler.stats()
+    stats['publisher'] = updates.stats
+    return web.json_response(stats)
+
+
+async def sensor_metrics_page(request):
+    """Metrics the sensors sent along with their last ping."""
+    lines = []
+    for sensor, text in sorted(sensor_metrics.items()):
+        lines.extend(metrics.relabel(text, sensor=sensor))
+    return web.Response(body='\n'.join(lines + ['']).encode(),
+                        headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def roster_import(request):
+    """Add expected sensors from a CSV body with hostname, mac and site
+    columns."""
+    try:
+        count = await roster.store.import_csv(await request.text())
+    except (ValueError, csv.Error) as e:
+        return web.Response(status=400, text=str(e), content_type='text')
+    return web.json_response({'imported': count,
+                              'pending': len(roster.store.pending())})
+
+
+async def roster_page(request):
+    """One page of the roster. Pass the next value back as after to get
+    the following page."""
+    query = request.GET
+    limit = roster.page_size(query.get('limit'))
+    sensors = await roster.store.sensors(site=query.get('site'),
+                                         after=query.get('after'),
+                                         limit=limit)
+    next_page = sensors[-1]['hostname'] if len(sensors) == limit else None
+    return web.json_response({'sensors': sensors, 'next': next_page})
+
+
+async def history_page(request):
+    """Provisioning records, newest first.
+
+    With stream=1 every record is sent as one JSON object per line,
+    fetching a page at a time, instead of a single page.
+    """
+    query = request.GET
+    limit = roster.page_size(query.get('limit'))
+    filters = {'hostname': query.get('hostname'),
+               'session_id': query.get('session')}
+    try:
+        before = int(query['before']) if 'before' in query else None
+    except ValueError:
+        return web.Response(status=400, text='Invalid before',
+                            content_type='text')
+
+    if query.get('stream') != '1':
+        records = await roster.store.history(before=before, limit=limit,
+                                             **filters)
+        next_page = records[-1]['id'] if len(records) == limit else None
+        return web.json_response({'records': records, 'next': next_page})
+
+    response = web.StreamResponse(
+        headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    while True:
+        records = await roster.store.history(before=before, limit=limit,
+                                             **filters)
+        for record in records:
+            response.write((json.dumps(record) + '\n').encode())
+        await response.drain()
+        if len(records) < limit:
+            break
+        before = records[-1]['id']
+
+    await response.write_eof()
+    return response
+
+
+def publish_status():
+    running = [s.ssid for s in scheduler.sessions.values() if s.running]
+    if running:
+        text = 'Broadcasting ({})'.format(', '.join(running))
+    else:
+        text = 'Not broadcasting'
+
+    running_sessions.set(len(running))
+    updates.update(None, 'status', message=text)
+
+
+@updates.on('status')
 async def status(sid):
-    text = 'Broadcasting' if broadcasting else 'Not broadcasting'
-    await sio.emit('status',
-                   {'message': text},
-                   room=sid)
+    publish_status()
+    await updates.snapshot(sid)
 
 
-@sio.on('broadcast-start')
+@updates.on('broadcast-start')
 async def start_broadcast(sid, data):
-    global broadcasting
-
     if 'ssid' not in data or len(data['ssid']) == 0:
-        await sio.emit('broadcast-update',
-                       {'message': 'Network name must be provided'},
-                       room=sid)
+        await updates.send('broadcast-update',
+                           {'message': 'Network name must be provided'},
+                           room=sid)
         return
 
     if 'password' not in data or len(data['password']) == 0:
-        await sio.emit('broadcast-update',
-                       {'message': 'Password must be provided'},
-                       room=sid)
+        await updates.send('broadcast-update',
+                           {'message': 'Password must be provided'},
+                           room=sid)
         return
 
-    if 'sensors' not in data or len(data['sensors']) == 0:
-        await sio.emit('broadcast-update',
-                       {'message': 'Number of sensors must be provided'},
-                       room=sid)
+    hostnames = None
+    if roster.store.expected:
+        # Only sensors on the roster count. Without a number, wait for the
+        # ones that have not been provisioned yet.
+        hostnames = (roster.store.expected if data.get('sensors')
+                     else roster.store.pending())
+
+    if not data.get('sensors') and not hostnames:
+        await updates.send('broadcast-update',
+                           {'message': 'Number of sensors must be provided'},
+                           room=sid)
         return
 
-    if broadcasting:
-        await sio.emit('broadcast-update',
-                       {'message': 'Already broadcasting'},
-                       room=sid)
+    if scheduler.route(ssid=data['ssid']) is not None:
+        await updates.send('broadcast-update',
+                           {'message': 'Already broadcasting {}'
+                                       .format(data['ssid'])},
+                           room=sid)
         return
 
-    ssid = data['ssid']
-    password = data['password']
-    expected_sensors = int(data['sensors'])
-    broadcasting = True
-
-    await sio.emit('broadcast-update',
-                   {'message': 'Starting...'},
-                   room=sid)
-    await status(sid)
-
-    asyncio.ensure_future(broadcast(ssid, password, expected_sensors, sid))
-
-
-async def broadcast(ssid, password, expected_sensors, sid):
-    global broadcasting
-    found_sensors = set()
-    # Something that keeps track of how long its beens sending and increases FEC
-
-    send_flag = 0
-    while broadcasting:
-        await send_wifi_info(ssid, password, send_flag, .8)
-
-        # Switch between 0 and 1
-        send_flag = 1 - send_flag
-
-        for i in range(BROADCAST_WAIT_TIME):
-            _LOGGER.debug("Waiting (%s)...", i)
-            if not broadcasting:
-                break
-
-            await check_for_sensors(expected_sensors, found_sensors, sid)
-            await asyncio.sleep(1)
-
-    await sio.emit('broadcast-update',
-                   {'message': 'Stopped'},
-                   room=sid)
-    await status(sid)
-
-
-async def send_wifi_info(ssid, password, send_flag, possible_loss):
-    _LOGGER.debug("Sending WiFi information")
-    # TODO: Generalize this
-    cmd = asyncio.create_subprocess_exec(
-        'python',
-        '/home/pi/unassociated_transfer/send_wifi.py',
-        '-l', str(possible_loss),
-        '-s', str(send_flag),
-        ssid, password,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE)
-    proc = await cmd
-    stdout_data, stderr_data = await proc.communicate()
-    _LOGGER.debug("stdout: %s", stdout_data)
-    _LOGGER.debug("stderr: %s", stderr_data)
-    _LOGGER.debug("-" * 80)
-    _LOGGER.debug("Done sending WiFi information")
-
-
-async def check_for_sensors(expected_sensors, found_sensors, sid):
-    global broadcasting
-
-    try:
-        found_sensors.add(sensor_queue.get_nowait())
-        _LOGGER.debug("sensors discovered: %s", found_sensors)
-        await sio.emit('broadcast-update',
-                       {'message': 'Starting... (Discovered sensors: {})'.format(found_sensors)},
-                       room=sid)
+    expected = int(data['sensors']) if data.get('sensors') else None
+    session = sessions.BroadcastSession(data['ssid'],
+                                        data['password'],
+                                        expected,
+                                        owner=sid,
+                                        hostnames=hostnames)
+    sio.enter_room(sid, session.room)
+
+    updates.update(session.room, 'broadcast-update',
+                   message='Starting... (session {})'.format(session.id),
+                   session=session.id)
+
+    scheduler.add(session)
+    publish_status()
+    await roster.store.record_session(session)
+
+
+@updates.on('broadcast-join')
+async def join_broadcast(sid, data):
+    session = scheduler.sessions.get(data.get('session'))
+    if session is None:
+        await updates.send('broadcast-update',
+                           {'message': 'No such broadcast'},
+                           room=sid)
+        return
 
-        if len(found_sensors) >= expected_sensors:
-            _LOGGER.debug("Discovered all sensors so stopping")
-            broadcasting = False
-    except asyncio.QueueEmpty:
-        pass
+    sio.enter_room(sid, session.room)
+    await updates.snapshot(sid, session.room)
 
 
-@sio.on('broadcast-stop')
-async def stop_broadcast(sid):
-    global broadcasting
+@updates.on('broadcast-stop')
+async def stop_broadcast(sid, data=None):
+    session_id = data.get('session') if data else None
+    stopping = [s for s in scheduler.sessions.values()
+                if s.running and (s.id == session_id or
+                                  session_id is None and s.owner == sid)]
 
-    if not broadcasting:
-        return
+    for session in stopping:
+        scheduler.stop(session)
+        updates.update(session.room, 'broadcast-update',
+                       message='Stopping...')
 
-    broadcasting = False
-    await sio.emit('broadcast-update',
-                   {'message': 'Stopping...'},
-                   room=sid)
-    await status(sid)
+    if stopping:
+        publish_status()
 
 
-app.router.add_static('/static', 'static')
+app.router.add_get('/static/{name}', assets.store.handle)
 app.router.add_get('/', index)
+app.router.add_get('/sessions', session_stats)
+app.router.add_get('/metrics', metrics.handle)
+app.router.add_get('/sensor-metrics', sensor_metrics_page)
+app.router.add_get('/log-levels', logs.handle_levels)
+app.router.add_post('/log-levels', logs.handle_levels)
 app.router.add_post('/ping', sensor_ping)
+app.router.add_get('/roster', roster_page)
+app.router.add_post('/roster/import', roster_import)
+app.router.add_get('/history', history_page)
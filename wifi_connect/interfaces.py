@@ -0,0 +1,212 @@
+import asyncio
+from collections import OrderedDict
+import glob
+import logging
+import os
+import stat
+import tempfile
+import time
+
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+INTERFACE_FILE = settings.get('INTERFACE_FILE', '/etc/network/interfaces')
+CHECK_TIME = settings.get('CHECK_TIME', 1)
+
+
+def parse(text, stanzas, sources):
+    """Parse ifupdown configuration into stanzas and source patterns."""
+    options = None
+    for line in text.splitlines():
+        # Only whole-line comments are supported by ifupdown
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        parts = line.split(None, 1)
+        key = parts[0]
+        value = parts[1].strip() if len(parts) > 1 else ''
+
+        if key == 'iface':
+            name = value.split()[0]
+            options = stanzas.setdefault(name, OrderedDict())
+        elif key in ('auto', 'allow-hotplug', 'mapping', 'source',
+                     'source-directory') or key.startswith('allow-'):
+            options = None
+            if key == 'source':
+                sources.append(value)
+        elif options is not None:
+            options[key] = value
+
+
+def unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+
+    return value
+
+
+def read_file(filename):
+    """Text of filename, or None if there is no such file."""
+    try:
+        with open(filename) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_atomic(filename, text):
+    """Replace filename so readers see either the old or the new file."""
+    folder = os.path.dirname(filename)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    try:
+        if os.path.exists(filename):
+            os.chmod(tmp, stat.S_IMODE(os.stat(filename).st_mode))
+
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+    dir_fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class InterfaceStore():
+    """Parsed view of /etc/network/interfaces and the files it sources.
+
+    The files are only read again when one of them (or a sourced folder)
+    changes on disk. Writes made through the store update the view
+    directly.
+    """
+
+    def __init__(self, interface_file=INTERFACE_FILE):
+        self.interface_file = interface_file
+        self.stanzas = {}
+        self.sources = []
+        self._mtimes = None
+        self._checked = 0
+
+    @property
+    def folder(self):
+        return '{}.d'.format(self.interface_file)
+
+    def config_file(self, interface):
+        return os.path.join(self.folder, '{}.cfg'.format(interface))
+
+    def _watched(self):
+        paths = [self.interface_file, self.folder]
+        for pattern in self.sources:
+            paths.append(os.path.dirname(pattern))
+            paths.extend(glob.glob(pattern))
+        return paths
+
+    def _stat(self):
+        mtimes = {}
+        for path in self._watched():
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def _load(self):
+        _LOGGER.debug("Loading interface configuration")
+        stanzas = {}
+        sources = []
+        pending = [self.interface_file]
+
+        while pending:
+            filename = pending.pop(0)
+            try:
+                with open(filename) as f:
+                    text = f.read()
+            except OSError:
+                continue
+
+            new_sources = []
+            parse(text, stanzas, new_sources)
+            sources.extend(new_sources)
+            for pattern in new_sources:
+                pending.extend(sorted(glob.glob(pattern)))
+
+        self.stanzas = stanzas
+        self.sources = sources
+        self._mtimes = self._stat()
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._mtimes is not None and \
+                now - self._checked < CHECK_TIME:
+            return
+
+        self._checked = now
+        if force or self._mtimes is None or self._stat() != self._mtimes:
+            self._load()
+
+    def options(self, interface):
+        self.refresh()
+        return self.stanzas.get(interface, {})
+
+    def ssid(self, interface):
+        options = self.options(interface)
+        for key in ('wpa-ssid', 'wireless-essid'):
+            if key in options:
+                return unquote(options[key])
+
+        return None
+
+    def configured(self, interface):
+        keys = self.options(interface).keys()
+        return any('ssid' in k for k in keys) and any('psk' in k for k in keys)
+
+    def has_source(self, pattern):
+        self.refresh()
+        return pattern in self.sources
+
+    async def write(self, interface, lines):
+        filename = self.config_file(interface)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, write_atomic, filename,
+                                   '\n'.join(lines) + '\n')
+        self.refresh(force=True)
+
+    async def read_config(self, interface):
+        """Text of the configuration file of interface, or None."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, read_file,
+                                          self.config_file(interface))
+
+    async def restore_config(self, interface, text):
+        """Put back what read_config() returned, removing the file if
+        there was none."""
+        filename = self.config_file(interface)
+        loop = asyncio.get_event_loop()
+        if text is not None:
+            await loop.run_in_executor(None, write_atomic, filename, text)
+        else:
+            try:
+                os.unlink(filename)
+            except FileNotFoundError:
+                pass
+        self.refresh(force=True)
+
+    async def add_source(self, pattern):
+        loop = asyncio.get_event_loop()
+        text = await loop.run_in_executor(None, read_file,
+                                          self.interface_file) or ''
+
+        text = '{}\n{}\n'.format(text.rstrip('\n'), 'source ' + pattern)
+        await loop.run_in_executor(None, write_atomic, self.interface_file,
+                                   text.lstrip('\n'))
+        self.refresh(force=True)
+
+
+store = InterfaceStore()
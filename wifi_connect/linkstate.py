@@ -0,0 +1,368 @@
+import asyncio
+import fcntl
+import logging
+import socket
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+SIOCGIFADDR = 0x8915
+
+NLMSG_HEADER = struct.Struct('=IHHII')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+RTGENMSG = struct.Struct('=Bxxx')
+
+POLL_TIME = 1
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def parse_messages(data):
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size:
+            break
+
+        yield msg_type, data[offset + NLMSG_HEADER.size:offset + length]
+        offset += _align(length)
+
+
+def parse_attributes(data):
+    attributes = {}
+    offset = 0
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+
+        attributes[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+
+    return attributes
+
+
+def read_address(interface):
+    """Read the IPv4 address of interface straight from the kernel."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        request = struct.pack('256s', interface[:15].encode())
+        result = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+    return socket.inet_ntoa(result[20:24])
+
+
+def read_carrier(interface):
+    try:
+        with open('/sys/class/net/{}/carrier'.format(interface)) as f:
+            return f.read().strip() == '1'
+    except OSError:
+        return False
+
+
+class LinkMonitor():
+    """In-memory view of interface addresses and carrier state.
+
+    The view is kept up to date from rtnetlink events. When a netlink
+    socket cannot be opened, lookups fall back to reading the kernel state
+    directly on every call.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.addresses = {}
+        self.carrier = {}
+        self.active = False
+        self.available = True
+        self._sock = None
+        self._listeners = []
+        self._waiters = {}
+        self._syncing = False
+
+    def start(self):
+        if self.active or not self.available:
+            return
+
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                 NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+        except (AttributeError, OSError):
+            _LOGGER.warning("Netlink is not available, reading link state "
+                            "on demand")
+            self.available = False
+            return
+
+        # Subscribe first, then dump, so no event is lost in between
+        self._sync(sock)
+
+        sock.setblocking(False)
+        asyncio.get_event_loop().add_reader(sock.fileno(), self._read)
+        self._sock = sock
+        self.active = True
+
+    def stop(self):
+        if self.active:
+            asyncio.get_event_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+
+        self._sock = None
+        self.active = False
+
+    def _sync(self, sock):
+        """Rebuild the view from a dump, then notify whatever changed."""
+        old_addresses, old_carrier = self.addresses, self.carrier
+        self.addresses, self.carrier = {}, {}
+        self._syncing = True
+        try:
+            self._dump(sock, RTM_GETLINK)
+            self._dump(sock, RTM_GETADDR)
+        finally:
+            self._syncing = False
+
+        # Anything missed while events were being dropped shows up here,
+        # including addresses and links that have gone away
+        for name in sorted(set(old_carrier) | set(self.carrier)):
+            carrier = self.carrier.get(name, False)
+            if old_carrier.get(name, False) != carrier:
+                self._notify(name, 'link-up' if carrier else 'link-down')
+
+        for name in sorted(set(old_addresses) | set(self.addresses)):
+            old = old_addresses.get(name, [])
+            new = self.addresses.get(name, [])
+            if any(address not in new for address in old):
+                self._notify(name, 'address-removed')
+
+            added = [address for address in new if address not in old]
+            if added:
+                self._notify(name, 'address-added')
+                self._resolve_waiters(name, added[0])
+
+    def _dump(self, sock, msg_type):
+        payload = RTGENMSG.pack(socket.AF_UNSPEC)
+        header = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload),
+                                   msg_type, NLM_F_REQUEST | NLM_F_DUMP,
+                                   msg_type, 0)
+        sock.send(header + payload)
+
+        done = False
+        while not done:
+            done = self.feed(sock.recv(65536))
+
+    def _read(self):
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            # The socket buffer overran, the view may be stale now
+            _LOGGER.exception("Netlink read failed, resynchronizing")
+            sock, self._sock = self._sock, None
+            asyncio.get_event_loop().remove_reader(sock.fileno())
+            sock.close()
+            self.active = False
+            self.start()
+            return
+
+        self.feed(data)
+
+    def feed(self, data):
+        """Apply raw netlink messages. Returns True at the end of a dump."""
+        done = False
+        for msg_type, payload in parse_messages(data):
+            if msg_type in (NLMSG_DONE, NLMSG_ERROR):
+                done = True
+            elif msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                self._handle_link(msg_type, payload)
+            elif msg_type in (RTM_NEWADDR, RTM_DELADDR):
+                self._handle_address(msg_type, payload)
+
+        return done
+
+    def _handle_link(self, msg_type, payload):
+        _, _, index, flags, _ = IFINFOMSG.unpack_from(payload)
+        attributes = parse_attributes(payload[IFINFOMSG.size:])
+        name = attributes.get(IFLA_IFNAME, b'').rstrip(b'\0').decode()
+        if not name:
+            name = self.names.get(index)
+        if name is None:
+            return
+
+        self.names[index] = name
+
+        if msg_type == RTM_DELLINK:
+            carrier = False
+            self.addresses.pop(name, None)
+        else:
+            carrier = bool(flags & IFF_UP) and bool(flags & IFF_LOWER_UP)
+
+        if self.carrier.get(name) != carrier:
+            self.carrier[name] = carrier
+            if not self._syncing:
+                self._notify(name, 'link-up' if carrier else 'link-down')
+
+    def _handle_address(self, msg_type, payload):
+        family, _, _, _, index = IFADDRMSG.unpack_from(payload)
+        if family != socket.AF_INET:
+            return
+
+        attributes = parse_attributes(payload[IFADDRMSG.size:])
+        raw = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+        if raw is None:
+            return
+
+        name = self.names.get(index)
+        if name is None:
+            try:
+                name = socket.if_indextoname(index)
+            except OSError:
+                return
+            self.names[index] = name
+
+        address = socket.inet_ntoa(raw)
+        addresses = self.addresses.setdefault(name, [])
+
+        if msg_type == RTM_NEWADDR:
+            if address not in addresses:
+                addresses.append(address)
+                if not self._syncing:
+                    self._notify(name, 'address-added')
+
+            # An address being handed out again is still a new lease
+            if not self._syncing:
+                self._resolve_waiters(name, address)
+        elif msg_type == RTM_DELADDR and address in addresses:
+            addresses.remove(address)
+            if not self._syncing:
+                self._notify(name, 'address-removed')
+
+    def _resolve_waiters(self, interface, address):
+        for future in self._waiters.pop(interface, []):
+            if not future.done():
+                future.set_result(address)
+
+    def add_listener(self, callback):
+        """Call callback(interface, event) on every link or address change."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    def _notify(self, interface, event):
+        _LOGGER.debug("%s: %s", interface, event)
+        for callback in list(self._listeners):
+            try:
+                callback(interface, event)
+            except Exception:
+                _LOGGER.exception("Link state listener failed")
+
+    def address(self, interface):
+        self.start()
+        if not self.active:
+            return read_address(interface)
+
+        addresses = self.addresses.get(interface)
+        return addresses[0] if addresses else None
+
+    def has_carrier(self, interface):
+        self.start()
+        if not self.active:
+            return read_carrier(interface)
+
+        return self.carrier.get(interface, False)
+
+    def next_address(self, interface):
+        """Start waiting for the next address given to interface, even if
+        it already has one. Pass the result to wait_for_address()."""
+        self.start()
+        future = asyncio.get_event_loop().create_future()
+        if self.active:
+            self._waiters.setdefault(interface, []).append(future)
+        else:
+            asyncio.ensure_future(self._poll_changed(interface, future))
+        return future
+
+    async def wait_for_address(self, interface, timeout=None, lease=None):
+        """Return the address of interface as soon as it has one.
+
+        With lease from next_address(), addresses the interface had before
+        that was called are ignored. Returns None if no address appears
+        within timeout seconds.
+        """
+        if lease is None:
+            address = self.address(interface)
+            if address is not None:
+                return address
+
+            if not self.active:
+                return await self._poll_address(interface, timeout)
+
+            lease = asyncio.get_event_loop().create_future()
+            self._waiters.setdefault(interface, []).append(lease)
+
+        try:
+            return await asyncio.wait_for(lease, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(interface, [])
+            if lease in waiters:
+                waiters.remove(lease)
+
+    async def _poll_address(self, interface, timeout):
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        while deadline is None or loop.time() < deadline:
+            await asyncio.sleep(POLL_TIME)
+            address = read_address(interface)
+            if address is not None:
+                return address
+
+        return None
+
+    async def _poll_changed(self, interface, future):
+        # Without netlink, an address is only seen as new if it differs
+        # from the last one read or the interface had none in between
+        previous = read_address(interface)
+        while not future.done():
+            await asyncio.sleep(POLL_TIME)
+            address = read_address(interface)
+            if address is not None and address != previous:
+                if not future.done():
+                    future.set_result(address)
+                return
+            previous = address
+
+
+monitor = LinkMonitor()
@@ -0,0 +1,136 @@
+"""Logging that does not write to disk from the event loop.
+
+Records are put on a queue and written by a background thread. Long
+messages, such as command output, are truncated and messages repeated in
+quick succession are dropped before they are queued.
+"""
+import atexit
+from collections import OrderedDict
+import logging
+from logging import handlers
+import queue
+import time
+
+MAX_MESSAGE_LENGTH = 1024
+RATE_LIMIT_TIME = 60
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_KEYS = 256
+FORMAT = '%(asctime)s:%(threadName)s:%(levelname)s:%(name)s:%(message)s'
+
+_listener = None
+
+
+class TruncateFilter(logging.Filter):
+    def __init__(self, max_length=MAX_MESSAGE_LENGTH):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_length:
+            record.msg = '{}... ({} characters dropped)'.format(
+                message[:self.max_length], len(message) - self.max_length)
+            record.args = None
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Let each message through at most burst times every interval seconds.
+
+    Messages are told apart by logger, level and format string, so the
+    same message with different arguments counts as a repeat. Warnings
+    and errors are never dropped. The number of dropped repeats is added
+    to the next one let through.
+    """
+
+    def __init__(self, interval=RATE_LIMIT_TIME, burst=RATE_LIMIT_BURST,
+                 max_keys=RATE_LIMIT_KEYS):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_keys = max_keys
+        self._seen = OrderedDict()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        started, count, dropped = self._seen.get(key, (now, 0, 0))
+
+        if now - started >= self.interval:
+            started, count = now, 0
+        elif count >= self.burst:
+            self._seen[key] = (started, count, dropped + 1)
+            return False
+
+        self._seen[key] = (started, count + 1, 0)
+        self._seen.move_to_end(key)
+        if len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+
+        if dropped:
+            record.msg = '{} ({} similar messages dropped)'.format(
+                record.getMessage(), dropped)
+            record.args = None
+        return True
+
+
+def setup(filename, level=logging.DEBUG):
+    """Send records from every logger through a queue to filename and
+    stderr."""
+    global _listener
+
+    formatter = logging.Formatter(FORMAT)
+    outputs = [handlers.TimedRotatingFileHandler(filename, when='midnight',
+                                                 backupCount=7, delay=True),
+               logging.StreamHandler()]
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    records = queue.Queue()
+    queue_handler = handlers.QueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(TruncateFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    _listener = handlers.QueueListener(records, *outputs,
+                                       respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def set_levels(levels):
+    """Set the level of each logger named in levels, e.g. {'runner':
+    'INFO'}."""
+    for name, level in levels.items():
+        logger = logging.getLogger(None if name == 'root' else name)
+        logger.setLevel(level.upper())
+
+
+def levels():
+    """Levels of every logger that has one set."""
+    loggers = logging.Logger.manager.loggerDict
+    result = {'root': logging.getLevelName(logging.getLogger().level)}
+    for name in sorted(loggers):
+        logger = loggers[name]
+        if isinstance(logger, logging.Logger) and logger.level:
+            result[name] = logging.getLevelName(logger.level)
+    return result
+
+
+async def handle_levels(request):
+    """Show logger levels, or change them with name=level form fields."""
+    # Imported here so the sensor's radio loop does not load aiohttp
+    from aiohttp import web
+
+    if request.method == 'POST':
+        try:
+            set_levels(dict(await request.post()))
+        except ValueError as e:
+            return web.Response(status=400, text=str(e), content_type='text')
+    return web.json_response(levels())
@@ -0,0 +1,204 @@
+"""Counters, gauges and histograms in the Prometheus text format.
+
+Metrics are plain in-memory numbers updated where things happen, so they
+cost nothing while nothing is going on and are only formatted when
+/metrics is requested.
+"""
+import bisect
+from collections import OrderedDict
+import re
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+BUCKETS = (.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+sample_re = re.compile(r'^(?P<name>[a-zA-Z_:][\w:]*)'
+                       r'(?:\{(?P<labels>.*)\})? (?P<value>\S+)$')
+
+
+def _escape(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(n, _escape(v))
+                          for n, v in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric():
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = OrderedDict()
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        for key, value in self._values.items():
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return ['{}{} {}'.format(self.name,
+                                 _format_labels(self.labelnames, key),
+                                 _format_value(value))]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = [[0] * len(self.buckets), 0, 0]
+
+        counts = self._values[key]
+        counts[0][bisect.bisect_left(self.buckets, value)] += 1
+        counts[1] += 1
+        counts[2] += value
+
+    def time(self, **labels):
+        """Context manager observing how long its block took."""
+        return _Timer(self, labels)
+
+    def _samples(self, key, value):
+        counts, count, total = value
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append('{}_bucket{} {}'.format(
+                self.name,
+                _format_labels(self.labelnames, key,
+                               [('le', _format_value(bound))]),
+                cumulative))
+
+        labels = _format_labels(self.labelnames, key)
+        samples.append('{}_sum{} {}'.format(self.name, labels,
+                                            _format_value(total)))
+        samples.append('{}_count{} {}'.format(self.name, labels, count))
+        return samples
+
+
+class _Timer():
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+
+
+class Registry():
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def _get(self, cls, name, *args, **kwargs):
+        # Asking for a metric that exists returns it, so modules can each
+        # declare the metrics they use
+        if name not in self.metrics:
+            self.metrics[name] = cls(name, *args, **kwargs)
+        return self.metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def relabel(text, **labels):
+    """Add labels to every sample in text, dropping the comments.
+
+    Used to serve the metrics sensors push to the gateway with their ping.
+    """
+    extra = ','.join('{}="{}"'.format(n, _escape(v))
+                     for n, v in sorted(labels.items()))
+    samples = []
+    for line in text.splitlines():
+        match = sample_re.match(line.strip())
+        if match is None:
+            continue
+
+        existing = match.group('labels')
+        joined = ','.join(l for l in (existing, extra) if l)
+        samples.append('{}{{{}}} {}'.format(match.group('name'), joined,
+                                            match.group('value')))
+
+    return samples
+
+
+async def handle(request):
+    """Serve the registry at /metrics from either app."""
+    # Imported here so the sensor's radio loop does not load aiohttp
+    from aiohttp import web
+
+    return web.Response(body=registry.render().encode(),
+                        headers={'Content-Type': CONTENT_TYPE})
+
+
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
@@ -0,0 +1,101 @@
+import asyncio
+import functools
+import logging
+
+import metrics
+
+_LOGGER = logging.getLogger(__name__)
+PUBLISH_INTERVAL = .5
+
+messages_sent = metrics.counter('wifi_connect_socketio_messages_total',
+                                'Socket.io messages sent', ['event'])
+handler_time = metrics.histogram('wifi_connect_socketio_handler_seconds',
+                                 'Time taken to handle socket.io events',
+                                 ['event'])
+
+
+class Publisher():
+    """Send status updates through socket.io, merged per room and event.
+
+    Updates to the same room and event that arrive within interval seconds
+    go out as one message that only holds what changed. The latest state
+    is kept, so a client that joins a room can be sent a snapshot. Room
+    None means every connected client.
+    """
+
+    def __init__(self, sio, interval=PUBLISH_INTERVAL):
+        self.sio = sio
+        self.interval = interval
+        self.stats = {'updates': 0, 'messages': 0}
+        self._state = {}
+        self._pending = {}
+        self._task = None
+
+    async def send(self, event, data, room=None):
+        """Send a message right away, without keeping it."""
+        self.stats['messages'] += 1
+        messages_sent.inc(event=event)
+        await self.sio.emit(event, data, room=room)
+
+    def on(self, event):
+        """Register a socket.io handler for event, timing each call."""
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def timed(*args, **kwargs):
+                with handler_time.time(event=event):
+                    return await handler(*args, **kwargs)
+
+            self.sio.on(event, timed)
+            return handler
+        return decorator
+
+    def update(self, room, event, **fields):
+        """Set fields of the state, sending the ones that changed."""
+        state = self._state.setdefault((room, event), {})
+        changed = {k: v for k, v in fields.items() if state.get(k) != v}
+        if not changed:
+            return
+
+        self.stats['updates'] += 1
+        state.update(changed)
+        self._pending.setdefault((room, event), {}).update(changed)
+        self._schedule()
+
+    def add(self, room, event, key, items):
+        """Add items to the list under key, sending only the new ones."""
+        state = self._state.setdefault((room, event), {})
+        known = state.setdefault(key, [])
+        new = [item for item in items if item not in known]
+        if not new:
+            return
+
+        self.stats['updates'] += 1
+        known.extend(new)
+        pending = self._pending.setdefault((room, event), {})
+        pending.setdefault(key, []).extend(new)
+        self._schedule()
+
+    def _schedule(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for (room, event), data in pending.items():
+            await self.send(event, data, room=room)
+
+    async def snapshot(self, sid, room=None):
+        """Send sid the full state of every event in room."""
+        for (state_room, event), state in list(self._state.items()):
+            if state_room == room:
+                data = dict(state, snapshot=True)
+                await self.send(event, data, room=sid)
+
+    def forget(self, room):
+        for key in [k for k in self._state if k[0] == room]:
+            del self._state[key]
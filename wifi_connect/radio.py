@@ -0,0 +1,133 @@
+"""Switch wireless mode and channel.
+
+The wireless extensions ioctls are issued over one long-lived socket, the
+same calls iwconfig makes, without forking a process for every hop.
+When the driver does not support them, iwconfig is used instead.
+"""
+import errno
+import fcntl
+import logging
+import socket
+import struct
+import time
+
+import metrics
+import runner
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+IWCONFIG_TIMEOUT = settings.get('IWCONFIG_TIMEOUT', 10)
+IWCONFIG = settings.get('IWCONFIG', 'iwconfig')
+
+SIOCSIWFREQ = 0x8B04
+SIOCSIWMODE = 0x8B06
+SIOCGIWMODE = 0x8B07
+IW_FREQ_FIXED = 0x01
+IWREQ_SIZE = 32
+
+MODES = {'managed': 2, 'monitor': 6}
+IWCONFIG_MODES = {'managed': 'Managed', 'monitor': 'monitor'}
+UNSUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY)
+
+
+def _iwreq(interface, data):
+    request = interface.encode()[:15].ljust(16, b'\0') + data
+    return request.ljust(IWREQ_SIZE, b'\0')
+
+
+class IoctlRadio():
+    name = 'ioctl'
+
+    def __init__(self):
+        self._sock = None
+
+    def _ioctl(self, interface, request, data=b''):
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        return fcntl.ioctl(self._sock.fileno(), request,
+                           _iwreq(interface, data))
+
+    def available(self, interface):
+        try:
+            self._ioctl(interface, SIOCGIWMODE)
+            return True
+        except OSError:
+            return False
+
+    async def set_mode(self, interface, mode):
+        self._ioctl(interface, SIOCSIWMODE, struct.pack('I', MODES[mode]))
+
+    async def set_channel(self, interface, channel):
+        self._ioctl(interface, SIOCSIWFREQ,
+                    struct.pack('ihBB', channel, 0, 0, IW_FREQ_FIXED))
+
+
+class IwconfigRadio():
+    name = 'iwconfig'
+
+    def available(self, interface):
+        return True
+
+    async def _iwconfig(self, interface, *args):
+        return await runner.run(IWCONFIG, interface, *args,
+                                timeout=IWCONFIG_TIMEOUT,
+                                interface=interface)
+
+    async def set_mode(self, interface, mode):
+        await self._iwconfig(interface, 'mode', IWCONFIG_MODES[mode])
+
+    async def set_channel(self, interface, channel):
+        await self._iwconfig(interface, 'channel', str(channel))
+
+
+ioctl_radio = IoctlRadio()
+iwconfig_radio = IwconfigRadio()
+hop_latency = metrics.histogram('wifi_connect_channel_hop_seconds',
+                                'Time taken to change channel', ['radio'])
+_radios = {}
+
+
+def get_radio(interface):
+    if interface not in _radios:
+        if ioctl_radio.available(interface):
+            _radios[interface] = ioctl_radio
+        else:
+            _radios[interface] = iwconfig_radio
+        _LOGGER.debug("Using %s to control %s", _radios[interface].name,
+                      interface)
+
+    return _radios[interface]
+
+
+async def _call(interface, method, *args):
+    radio = get_radio(interface)
+
+    if radio is iwconfig_radio:
+        await getattr(radio, method)(interface, *args)
+        return radio
+
+    async with runner.executor.lock(interface):
+        try:
+            await getattr(radio, method)(interface, *args)
+            return radio
+        except OSError as e:
+            if e.errno not in UNSUPPORTED:
+                _LOGGER.warning("%s %s on %s failed: %s", method, args,
+                                interface, e)
+                return radio
+
+    _LOGGER.debug("%s not supported by ioctl, using iwconfig", method)
+    _radios[interface] = iwconfig_radio
+    await getattr(iwconfig_radio, method)(interface, *args)
+    return iwconfig_radio
+
+
+async def set_mode(interface, mode):
+    await _call(interface, 'set_mode', mode)
+
+
+async def set_channel(interface, channel):
+    start = time.monotonic()
+    radio = await _call(interface, 'set_channel', channel)
+
+    hop_latency.observe(time.monotonic() - start, radio=radio.name)
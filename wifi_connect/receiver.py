@@ -0,0 +1,138 @@
+import asyncio
+from collections import namedtuple
+import json
+import logging
+import time
+
+import metrics
+import runner
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+RECEIVE_SCRIPT = settings.get('RECEIVE_SCRIPT',
+                              '/root/unassociated_transfer/receive_wifi.py')
+RECEIVE_PYTHON = settings.get('RECEIVE_PYTHON', '/usr/bin/python')
+RESTART_WAIT_TIME = 1
+
+time_to_credentials = metrics.histogram(
+    'wifi_connect_time_to_credentials_seconds',
+    'Time from starting to listen until credentials were received')
+
+Credentials = namedtuple('Credentials', ['ssid', 'password'])
+
+
+def parse_credentials(line):
+    """Parse one line of receiver output into Credentials.
+
+    Lines are either a JSON object with ssid and password, or
+    "ssid:password". Only the first colon separates the two, so passwords
+    may contain colons.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+            return Credentials(data['ssid'], data['password'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    ssid, sep, password = line.partition(':')
+    if not sep or not ssid:
+        return None
+
+    return Credentials(ssid, password)
+
+
+class Receiver():
+    """Keep receive_wifi.py listening on an interface across channel hops.
+
+    The process is started once and left running while the channel is
+    changed underneath it, so whatever it has decoded so far is kept
+    between hops and between the gateway's rounds. Credentials are handed
+    out through get() or by iterating with async for.
+    """
+
+    def __init__(self, interface, script=RECEIVE_SCRIPT,
+                 python=RECEIVE_PYTHON):
+        self.interface = interface
+        self.script = script
+        self.python = python
+        self.received = asyncio.Queue()
+        self._task = None
+        self._started = None
+
+    async def start(self):
+        if self._task is None:
+            self._started = time.monotonic()
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+    async def _run(self):
+        while True:
+            async with runner.spawn(self.python, self.script, self.interface,
+                                    name='receive_wifi') as proc:
+                # stderr is read while the process runs, or a full pipe
+                # would block it for the rest of the sweep
+                stderr = asyncio.ensure_future(self._log_stderr(proc))
+                try:
+                    await self._read_stdout(proc)
+                    await proc.wait()
+                finally:
+                    stderr.cancel()
+                    await asyncio.wait([stderr])
+
+                _LOGGER.debug("Receiver exited (%s)", proc.returncode)
+
+            await asyncio.sleep(RESTART_WAIT_TIME)
+
+    async def _read_stdout(self, proc):
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+
+            _LOGGER.debug("Receiver: %s", line)
+            credentials = parse_credentials(line.decode(errors='replace'))
+            if credentials is not None:
+                time_to_credentials.observe(time.monotonic() - self._started)
+                self.received.put_nowait(credentials)
+
+    async def _log_stderr(self, proc):
+        while True:
+            try:
+                line = await proc.stderr.readline()
+            except ValueError:
+                # A line longer than the stream limit, it has been skipped
+                continue
+            if not line:
+                break
+            _LOGGER.debug("receive_wifi: %s",
+                          line.decode(errors='replace').rstrip())
+
+    async def get(self, timeout=None):
+        """Return the next credentials, or None after timeout seconds."""
+        try:
+            return await asyncio.wait_for(self.received.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.received.get()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,62 @@
+"""Apply a new network configuration without restarting the service.
+
+Anything that keeps state tied to the network it is on subscribes with
+add_listener() and refreshes that state when network_changed() is
+called. With the RESTART_ON_NETWORK_CHANGE setting the whole service is
+restarted instead, as it used to be.
+"""
+import asyncio
+import logging
+import time
+
+import metrics
+import settings
+import utils
+
+_LOGGER = logging.getLogger(__name__)
+RESTART_ON_NETWORK_CHANGE = settings.get('RESTART_ON_NETWORK_CHANGE', False)
+
+_listeners = []
+reconfigure_time = metrics.histogram(
+    'wifi_connect_reconfigure_seconds',
+    'Time from saving new credentials until the sensor is operational on '
+    'the new network')
+
+
+def add_listener(callback):
+    """Call callback(interface, ssid) after the network changed.
+
+    Coroutine functions are awaited, one listener after the other.
+    """
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    _listeners.remove(callback)
+
+
+async def network_changed(interface, ssid, saved_at=None):
+    """Tell listeners interface is now on ssid. Returns False if any of
+    them failed.
+
+    saved_at is the time.monotonic() at which the credentials for ssid
+    were saved, if they are new.
+    """
+    if RESTART_ON_NETWORK_CHANGE:
+        _LOGGER.debug("Restarting service")
+        return await utils.restart_sensor_service()
+
+    _LOGGER.debug("Network of %s changed to %s", interface, ssid)
+    ok = True
+    for callback in list(_listeners):
+        try:
+            result = callback(interface, ssid)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            _LOGGER.exception("Network change listener failed")
+            ok = False
+
+    if saved_at is not None:
+        reconfigure_time.observe(time.monotonic() - saved_at)
+    return ok
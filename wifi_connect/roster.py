@@ -0,0 +1,255 @@
+"""Sensors the gateway knows about and the history of provisioning them.
+
+Everything is kept in SQLite. The database is only touched from one
+worker thread, so the event loop never waits on the SD card. Pings are
+written in batches. The hostnames of expected and provisioned sensors
+are also kept in memory, so /ping never has to query the database.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import logging
+import os
+import sqlite3
+import time
+
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+ROSTER_FILE = settings.get('ROSTER_FILE', '/var/lib/wifi_connect/roster.db')
+FLUSH_TIME = 1
+FLUSH_SIZE = 500
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sensors (
+    hostname TEXT PRIMARY KEY,
+    mac TEXT,
+    site TEXT,
+    expected INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS sensors_site ON sensors (site, hostname);
+CREATE INDEX IF NOT EXISTS sensors_mac ON sensors (mac);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    ssid TEXT NOT NULL,
+    expected_sensors INTEGER,
+    started REAL NOT NULL,
+    finished REAL,
+    rounds INTEGER,
+    airtime REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+
+CREATE TABLE IF NOT EXISTS provisioning (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    received REAL NOT NULL,
+    since_start REAL,
+    time_to_connect REAL,
+    signal INTEGER,
+    channel INTEGER,
+    expected INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS provisioning_hostname
+    ON provisioning (hostname, id);
+CREATE INDEX IF NOT EXISTS provisioning_session
+    ON provisioning (session_id, id);
+'''
+
+SENSOR_COLUMNS = ('hostname', 'mac', 'site', 'expected', 'first_seen',
+                  'last_seen')
+PROVISIONING_COLUMNS = ('id', 'session_id', 'hostname', 'received',
+                        'since_start', 'time_to_connect', 'signal', 'channel',
+                        'expected')
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def page_size(value):
+    size = _number(value, int) or PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+class Roster():
+    def __init__(self, filename=ROSTER_FILE):
+        self.filename = filename
+        self.expected = set()
+        self.provisioned = set()
+        self._db = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+        self._flush_task = None
+
+    async def _call(self, function, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _connect(self):
+        if self._db is None:
+            folder = os.path.dirname(self.filename)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            db = sqlite3.connect(self.filename, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    async def open(self):
+        """Create the database if needed and load who is expected."""
+        def load(db):
+            expected = db.execute(
+                'SELECT hostname FROM sensors WHERE expected').fetchall()
+            provisioned = db.execute(
+                'SELECT hostname FROM sensors WHERE first_seen IS NOT NULL'
+            ).fetchall()
+            return ({h for h, in expected}, {h for h, in provisioned})
+
+        self.expected, self.provisioned = await self._call(
+            lambda: load(self._connect()))
+
+    def pending(self):
+        """Expected sensors that have never been provisioned."""
+        return self.expected - self.provisioned
+
+    async def import_csv(self, text):
+        """Add expected sensors from CSV with hostname, mac and site
+        columns. Returns how many rows were imported."""
+        rows = []
+        for row in csv.DictReader(io.StringIO(text)):
+            hostname = (row.get('hostname') or '').strip()
+            if hostname:
+                rows.append((hostname, row.get('mac') or None,
+                             row.get('site') or None))
+
+        def insert():
+            db = self._connect()
+            # Upserts are done in two steps, ON CONFLICT needs a newer
+            # SQLite than Raspbian ships
+            with db:
+                db.executemany(
+                    'INSERT OR IGNORE INTO sensors (hostname) VALUES (?)',
+                    [row[:1] for row in rows])
+                db.executemany(
+                    'UPDATE sensors SET mac = ?, site = ?, expected = 1 '
+                    'WHERE hostname = ?',
+                    [row[1:] + row[:1] for row in rows])
+
+        await self._call(insert)
+        self.expected.update(row[0] for row in rows)
+        return len(rows)
+
+    async def record_session(self, session):
+        started = time.time() - (time.monotonic() - session.started)
+        finished = (started + session.finished - session.started
+                    if session.finished else None)
+        row = (session.id, session.ssid, session.expected_sensors, started,
+               finished, session.rounds, session.airtime)
+
+        def upsert():
+            db = self._connect()
+            with db:
+                db.execute('INSERT OR REPLACE INTO sessions VALUES '
+                           '(?, ?, ?, ?, ?, ?, ?)', row)
+
+        await self._call(upsert)
+
+    def record_provisioning(self, session, hostname, time_to_connect=None,
+                            signal=None, channel=None):
+        """Queue a ping to be written with the next batch."""
+        now = time.time()
+        self._pending.append((session.id, hostname, now,
+                              time.monotonic() - session.started,
+                              _number(time_to_connect), _number(signal, int),
+                              _number(channel, int),
+                              hostname in self.expected))
+        self.provisioned.add(hostname)
+
+        if len(self._pending) >= FLUSH_SIZE:
+            asyncio.ensure_future(self.flush())
+        elif self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_TIME)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+
+        def insert():
+            db = self._connect()
+            with db:
+                db.executemany(
+                    'INSERT INTO provisioning (session_id, hostname, '
+                    'received, since_start, time_to_connect, signal, '
+                    'channel, expected) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows)
+                db.executemany(
+                    'INSERT OR IGNORE INTO sensors (hostname) VALUES (?)',
+                    [row[1:2] for row in rows])
+                db.executemany(
+                    'UPDATE sensors SET first_seen = '
+                    'coalesce(first_seen, ?), last_seen = ? '
+                    'WHERE hostname = ?',
+                    [(row[2], row[2], row[1]) for row in rows])
+
+        try:
+            await self._call(insert)
+        except sqlite3.Error:
+            _LOGGER.exception("Unable to save %s provisioning records",
+                              len(rows))
+
+    async def sensors(self, site=None, after=None, limit=PAGE_SIZE):
+        """One page of sensors ordered by hostname, starting after the
+        hostname given."""
+        query = 'SELECT {} FROM sensors WHERE hostname > ?'.format(
+            ', '.join(SENSOR_COLUMNS))
+        args = [after or '']
+        if site is not None:
+            query += ' AND site = ?'
+            args.append(site)
+        query += ' ORDER BY hostname LIMIT ?'
+        args.append(limit)
+
+        rows = await self._call(
+            lambda: self._connect().execute(query, args).fetchall())
+        return [dict(zip(SENSOR_COLUMNS, row)) for row in rows]
+
+    async def history(self, hostname=None, session_id=None, before=None,
+                      limit=PAGE_SIZE):
+        """One page of provisioning records, newest first, starting
+        before the id given."""
+        query = 'SELECT {} FROM provisioning WHERE id < ?'.format(
+            ', '.join(PROVISIONING_COLUMNS))
+        args = [before if before is not None else 2 ** 63 - 1]
+        if hostname is not None:
+            query += ' AND hostname = ?'
+            args.append(hostname)
+        if session_id is not None:
+            query += ' AND session_id = ?'
+            args.append(session_id)
+        query += ' ORDER BY id DESC LIMIT ?'
+        args.append(limit)
+
+        rows = await self._call(
+            lambda: self._connect().execute(query, args).fetchall())
+        return [dict(zip(PROVISIONING_COLUMNS, row)) for row in rows]
+
+
+store = Roster()
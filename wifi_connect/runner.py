@@ -0,0 +1,270 @@
+"""Run external commands with timeouts, concurrency limits and timing.
+
+Commands that touch a radio pass interface=..., which makes them wait for
+each other so two of them never run on the same interface at once.
+"""
+import asyncio
+from collections import namedtuple
+import logging
+import os
+import time
+
+import metrics
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+DEFAULT_TIMEOUT = 60
+MAX_OUTPUT = 64 * 1024
+LOG_OUTPUT = 512
+MAX_PROCESSES = settings.get('MAX_PROCESSES', 8)
+
+timeouts = metrics.counter('wifi_connect_command_timeouts_total',
+                           'External commands killed after timing out',
+                           ['command'])
+
+Result = namedtuple('Result', ['returncode', 'stdout', 'stderr', 'timed_out',
+                               'duration'])
+
+
+def command_name(args):
+    return os.path.basename(args[0])
+
+
+async def _read_capped(stream, limit):
+    """Read stream to the end, keeping at most limit bytes."""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        if size < limit:
+            chunks.append(chunk[:limit - size])
+        size += len(chunk)
+
+    if size > limit:
+        chunks.append('... ({} bytes dropped)'.format(size - limit).encode())
+    return b''.join(chunks)
+
+
+class Executor():
+    def __init__(self, max_processes=MAX_PROCESSES):
+        self.latency = metrics.histogram(
+            'wifi_connect_command_seconds',
+            'Time taken by external commands and steps', ['command'])
+        self.running = metrics.gauge('wifi_connect_commands_running',
+                                     'External commands running now')
+        self._semaphore = asyncio.Semaphore(max_processes)
+        self._locks = {}
+
+    def lock(self, interface):
+        if interface not in self._locks:
+            self._locks[interface] = asyncio.Lock()
+        return self._locks[interface]
+
+    def record(self, name, duration):
+        self.latency.observe(duration, command=name)
+
+    async def _create(self, name, args, stdin):
+        return await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if stdin else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+
+    async def run(self, *args, name=None, timeout=DEFAULT_TIMEOUT,
+                  interface=None, max_output=MAX_OUTPUT):
+        """Run a command to completion and return a Result.
+
+        The command is killed when it runs longer than timeout seconds or
+        the caller is cancelled.
+        """
+        async with Spawned(self, args, name, timeout, interface) as proc:
+            stdout_data, stderr_data = await asyncio.gather(
+                _read_capped(proc.stdout, max_output),
+                _read_capped(proc.stderr, max_output))
+            await proc.wait()
+
+        spawned = proc.spawned
+        _LOGGER.debug("%s: returncode %s in %.3fs", spawned.name,
+                      proc.returncode, spawned.duration)
+        # Only the start of the output is logged, scans run to kilobytes
+        _LOGGER.debug("stdout: %s", stdout_data[:LOG_OUTPUT])
+        _LOGGER.debug("stderr: %s", stderr_data[:LOG_OUTPUT])
+        return Result(proc.returncode, stdout_data, stderr_data,
+                      spawned.timed_out, spawned.duration)
+
+    def spawn(self, *args, name=None, timeout=None, interface=None,
+              stdin=False):
+        """Start a command whose output is read while it runs.
+
+        Use as an async context manager, or call start() and close().
+        """
+        return Spawned(self, args, name, timeout, interface, stdin)
+
+
+class Spawned():
+    def __init__(self, executor, args, name=None, timeout=None,
+                 interface=None, stdin=False):
+        self.executor = executor
+        self.args = args
+        self.name = name or command_name(args)
+        self.timeout = timeout
+        self.interface = interface
+        self.stdin = stdin
+        self.proc = None
+        self.timed_out = False
+        self.duration = None
+        self._lock = None
+        self._timer = None
+        self._started = None
+
+    async def start(self):
+        if self.interface is not None:
+            self._lock = self.executor.lock(self.interface)
+            await self._lock.acquire()
+
+        try:
+            await self.executor._semaphore.acquire()
+        except BaseException:
+            self._release_lock()
+            raise
+
+        self._started = time.monotonic()
+        # Shielded so that a process which comes up just as the caller is
+        # cancelled is still found, killed and its slot given back
+        create = asyncio.ensure_future(
+            self.executor._create(self.name, self.args, self.stdin))
+        try:
+            self.proc = await asyncio.shield(create)
+        except BaseException:
+            if create.done():
+                self._abandon(create)
+            else:
+                create.add_done_callback(self._abandon)
+            raise
+
+        self.proc.spawned = self
+        self.executor.running.inc()
+        if self.timeout is not None:
+            self._timer = asyncio.get_event_loop().call_later(
+                self.timeout, self._expire)
+
+        return self.proc
+
+    def _abandon(self, create):
+        """Clean up after a start that failed or was cancelled."""
+        if create.cancelled() or create.exception() is not None:
+            self._release()
+            return
+
+        asyncio.ensure_future(self._reap(create.result()))
+
+    async def _reap(self, proc):
+        try:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+        except ProcessLookupError:
+            pass
+        finally:
+            self._release()
+
+    def _expire(self):
+        if self.proc.returncode is None:
+            _LOGGER.warning("%s timed out after %ss, killing it", self.name,
+                            self.timeout)
+            self.timed_out = True
+            timeouts.inc(command=self.name)
+            self.proc.kill()
+
+    def _release_lock(self):
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+
+    def _release(self):
+        self.executor._semaphore.release()
+        self._release_lock()
+
+    async def close(self):
+        if self.proc is None:
+            return
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+        try:
+            if self.proc.returncode is None:
+                self.proc.kill()
+            await self.proc.wait()
+        except ProcessLookupError:
+            pass
+        finally:
+            self.duration = time.monotonic() - self._started
+            self.executor.record(self.name, self.duration)
+            self.executor.running.dec()
+            self._release()
+            self.proc = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class FakeProcess():
+    """Stand-in for asyncio.subprocess.Process that replays a Result."""
+
+    def __init__(self, result):
+        self.pid = 0
+        self.returncode = None
+        self.stdin = None
+        self.stdout = asyncio.StreamReader()
+        self.stderr = asyncio.StreamReader()
+        self._result = result
+        self.stdout.feed_data(result.stdout)
+        self.stdout.feed_eof()
+        self.stderr.feed_data(result.stderr)
+        self.stderr.feed_eof()
+
+    def kill(self):
+        if self.returncode is None:
+            self.returncode = -9
+
+    async def wait(self):
+        if self.returncode is None:
+            self.returncode = self._result.returncode
+        return self.returncode
+
+
+class FakeExecutor(Executor):
+    """Executor that records commands instead of running them.
+
+    responses maps a command name to a Result, or to a callable that takes
+    the argument tuple and returns one.
+    """
+
+    def __init__(self, responses=None, max_processes=MAX_PROCESSES):
+        super().__init__(max_processes)
+        self.responses = responses or {}
+        self.calls = []
+
+    async def _create(self, name, args, stdin):
+        self.calls.append(args)
+        response = self.responses.get(name, Result(0, b'', b'', False, 0))
+        if callable(response):
+            response = response(args)
+        return FakeProcess(response)
+
+
+executor = Executor()
+
+
+async def run(*args, **kwargs):
+    return await executor.run(*args, **kwargs)
+
+
+def spawn(*args, **kwargs):
+    return executor.spawn(*args, **kwargs)
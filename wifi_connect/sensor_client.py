@@ -1,66 +1,175 @@
 import asyncio
-from collections import namedtuple
-from contextlib import contextmanager
+from collections import defaultdict
 import logging
+import random
 import socket
-
-import requests
-
+import time
+
+import channels
+import credentials
+import interfaces
+import linkstate
+import metrics
+import radio
+import receiver
+import reconfigure
+import settings
 import wifi
 
-logging.basicConfig(level=logging.DEBUG)
-
 _LOGGER = logging.getLogger(__name__)
-CHANNELS = range(1, 12)
-CONNECTED_WAIT_TIME = 5 * 60
-RECEIVE_WAIT_TIME = 15
-TRY_WAIT_TIME = 1 * 60
+CONNECTED_WAIT_TIME = settings.get('CONNECTED_WAIT_TIME', 5 * 60)
+RECEIVE_WAIT_TIME = settings.get('RECEIVE_WAIT_TIME', 15)
+TRY_WAIT_TIME = settings.get('TRY_WAIT_TIME', 1 * 60)
+BACKOFF_TIME = settings.get('BACKOFF_TIME', 5)
+PUSH_METRICS = settings.get('PUSH_METRICS', False)
 RUNNING = True
-Network = namedtuple('Network', ['ssid', 'encryption'])
 
-_LOGGER.info("Getting host name")
-hostname = socket.gethostname()
-_LOGGER.info("Hostname: %s", hostname)
+CONNECTED = 'connected'
+LOST = 'lost'
+SCANNING = 'scanning'
+CREDENTIALS_RECEIVED = 'credentials-received'
+CONNECTING = 'connecting'
+
+hostname = None
+
+state_time = metrics.counter('wifi_connect_state_seconds_total',
+                             'Time spent in each connection state',
+                             ['state'])
+sweeps = metrics.counter('wifi_connect_sweeps_total',
+                         'Channel sweeps by whether credentials were heard',
+                         ['result'])
+
+scheduler = channels.ChannelScheduler(max_dwell=RECEIVE_WAIT_TIME)
+connection = None
+
+
+class Connection():
+    """Connection state of the sensor, with time spent in each state."""
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.state = None
+        self.entered = None
+        self.failures = 0
+        self.time_in_state = defaultdict(float)
+        self.lost_at = None
+        self.recover_times = []
+        self._changed = asyncio.Event()
+
+    def set_state(self, state):
+        now = time.monotonic()
+        if self.state is not None:
+            self.time_in_state[self.state] += now - self.entered
+            state_time.inc(now - self.entered, state=self.state)
+
+        if state != CONNECTED and self.lost_at is None:
+            self.lost_at = now
+        elif state == CONNECTED and self.lost_at is not None:
+            self.recover_times.append(now - self.lost_at)
+            _LOGGER.info("Recovered in %.1f seconds", self.recover_times[-1])
+            self.lost_at = None
+
+        if state != self.state:
+            _LOGGER.debug("State: %s -> %s", self.state, state)
+
+        self.state = state
+        self.entered = now
+
+    @property
+    def mean_time_to_recover(self):
+        if not self.recover_times:
+            return None
+
+        return sum(self.recover_times) / len(self.recover_times)
+
+    def backoff(self):
+        """Exponential backoff with full jitter."""
+        delay = min(TRY_WAIT_TIME, BACKOFF_TIME * 2 ** self.failures)
+        return random.uniform(0, delay)
+
+    def on_link_event(self, interface, event):
+        if interface == self.interface:
+            self._changed.set()
 
+    async def wait_for_change(self, timeout):
+        """Sleep until the link changes or timeout seconds pass."""
+        # Changes from before the caller last checked the link (such as the
+        # sweep switching the radio to monitor mode) are already handled
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def start(interface, monitor_interfaces=()):
+    global connection
 
-async def start(interface):
     _LOGGER.debug("Starting...")
+    connection = Connection(interface)
+    linkstate.monitor.add_listener(connection.on_link_event)
+    # A network set up through the web UI should be picked up right away
+    reconfigure.add_listener(connection.on_link_event)
+
     while RUNNING:
         if await connected(interface):
-            _LOGGER.debug("Already connected. Waiting %s seconds before checking again.",
-                          CONNECTED_WAIT_TIME)
-            await asyncio.sleep(CONNECTED_WAIT_TIME)
+            connection.set_state(CONNECTED)
+            connection.failures = 0
+            _LOGGER.debug("Connected. Waiting up to %s seconds for the link "
+                          "to change.", CONNECTED_WAIT_TIME)
+            await connection.wait_for_change(CONNECTED_WAIT_TIME)
             continue
 
-        _LOGGER.debug("Not connected. Looking for new WiFi credentials...")
-        async with MonitorMode(interface) as monitor:
-            for channel in CHANNELS:
-                _LOGGER.debug("Setting channel to %s", channel)
-                await monitor.set_channel(channel)
-
-                wifi_info = await receive_wifi_info(interface)
-                _LOGGER.debug("Received wifi info: %s", wifi_info)
-                if wifi_info is not None:
-                    ssid, password = wifi_info
-                    _LOGGER.debug("Saving WiFi credentials")
-                    await save_wifi_credentials(interface, ssid, password)
-                    break
-
-        if await has_wifi_credentials(interface):
+        connection.set_state(LOST)
+
+        _LOGGER.debug("Not connected. Trying known networks...")
+        connection.set_state(CONNECTING)
+        result = await roam(interface)
+        if result is not None:
+            _LOGGER.debug("Connected to a known network (%s)!", result)
+            connection.set_state(CONNECTED)
+            continue
+
+        _LOGGER.debug("Looking for new WiFi credentials...")
+        connection.set_state(SCANNING)
+        await rank_channels(interface)
+        wifi_info = await sweep([interface] + list(monitor_interfaces))
+        _LOGGER.debug("Received wifi info: %s", wifi_info)
+        saved_at = None
+        if wifi_info is not None:
+            connection.set_state(CREDENTIALS_RECEIVED)
+            ssid, password = wifi_info
+            _LOGGER.debug("Saving WiFi credentials")
+            await save_wifi_credentials(interface, ssid, password)
+            saved_at = time.monotonic()
+
+        # Known networks were already tried by roam(), only connect with
+        # new credentials or a configuration from before the store existed
+        ssid = await wifi.get_ssid(interface)
+        untried = wifi_info is not None or credentials.store.get(ssid) is None
+
+        if untried and await has_wifi_credentials(interface):
             _LOGGER.debug("We have WiFi credentials, so we are trying to connect")
+            connection.set_state(CONNECTING)
             result = await connect(interface)
+            await credentials.store.record_result(ssid, result is not None)
             if result is not None:
                 _LOGGER.debug("Connected (%s)!", result)
-                _LOGGER.debug("Pinging gateway")
-                requests.post("http://gateway.local:3210/ping",
-                              data={'sensor': hostname})
-                _LOGGER.debug("Restarting service")
-                await restart_sensor_service()
+                connection.set_state(CONNECTED)
+                # With RESTART_ON_NETWORK_CHANGE the process is restarted
+                # by network_changed(), so the gateway is told first
+                await ping_gateway(interface, ssid)
+                await reconfigure.network_changed(interface, ssid,
+                                                  saved_at=saved_at)
+                continue
             else:
                 _LOGGER.debug("Not connected!")
 
-        _LOGGER.debug("Waiting %s seconds before trying again", TRY_WAIT_TIME)
-        await asyncio.sleep(TRY_WAIT_TIME)
+        connection.set_state(LOST)
+        delay = connection.backoff()
+        connection.failures += 1
+        _LOGGER.debug("Waiting up to %.1f seconds before trying again", delay)
+        await connection.wait_for_change(delay)
 
 
 def stop():
@@ -69,7 +178,71 @@ def stop():
 
 
 async def connect(interface):
-    return await wifi.connect(interface)
+    try:
+        return await wifi.connect(interface)
+    except Exception:
+        _LOGGER.exception("Unable to connect")
+        return None
+
+
+def get_hostname():
+    global hostname
+
+    if hostname is None:
+        hostname = socket.gethostname()
+        _LOGGER.info("Hostname: %s", hostname)
+
+    return hostname
+
+
+async def ping_gateway(interface, ssid):
+    # Imported here so aiohttp is not loaded before the radio loop starts
+    import gateway_client
+
+    _LOGGER.debug("Pinging gateway")
+    health = {}
+    network = wifi.last_seen(interface, ssid)
+    if network is not None:
+        health['signal'] = network.signal
+        health['channel'] = network.channel
+    if connection.recover_times:
+        health['time_to_connect'] = round(connection.recover_times[-1], 1)
+    if PUSH_METRICS:
+        health['metrics'] = metrics.registry.render()
+
+    await gateway_client.client.ping(get_hostname(), ssid, **health)
+
+
+async def roam(interface):
+    """Connect to the best known network that is in range."""
+    try:
+        scanned = await wifi.scan(interface)
+    except Exception:
+        _LOGGER.exception("Unable to scan for known networks")
+        return None
+
+    # Each candidate rewrites the configuration, which is put back if none
+    # of them works, so ifup on boot and the UI see the network from before
+    previous = await interfaces.store.read_config(interface)
+    tried = False
+
+    for entry in credentials.store.candidates(scanned):
+        _LOGGER.debug("Trying known network %s", entry['ssid'])
+        tried = True
+        network = wifi.Network(entry['ssid'], entry['encryption'])
+        await wifi.replace(interface, network, entry['key'])
+
+        result = await connect(interface)
+        await credentials.store.record_result(entry['ssid'],
+                                              result is not None)
+        if result is not None:
+            return result
+
+    if tried:
+        _LOGGER.debug("No known network worked, restoring configuration")
+        await interfaces.store.restore_config(interface, previous)
+
+    return None
 
 
 async def connected(interface):
@@ -86,36 +259,60 @@ async def has_wifi_credentials(interface):
 
 
 async def save_wifi_credentials(interface, ssid, password):
-    network = Network(ssid, 'wpa')
+    network = wifi.Network(ssid, 'wpa')
     await wifi.replace(interface, network, password)
 
 
-async def receive_wifi_info(interface):
-    _LOGGER.debug("Receiving WiFi Info")
-    cmd = asyncio.create_subprocess_exec(
-        '/usr/bin/python',
-        '/root/unassociated_transfer/receive_wifi.py',
-        interface,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE)
-    proc = await cmd
-
+async def rank_channels(interface):
     try:
-        stdout_data, stderr_data = await asyncio.wait_for(proc.communicate(),
-                                                          RECEIVE_WAIT_TIME)
-        _LOGGER.debug("stdout: %s", stdout_data)
-        _LOGGER.debug("stderr: %s", stderr_data)
+        scheduler.record_access_points(await wifi.scan(interface))
+    except Exception:
+        _LOGGER.exception("Unable to scan for access points")
 
-        data = stdout_data.decode()
-        if data == '':
-            return None
 
-        ssid, password = data.strip().split(':')
+async def sweep(interfaces, receiver_factory=None):
+    """Listen for the gateway on all channels, split between interfaces.
 
-        return ssid, password
-    except asyncio.TimeoutError:
-        _LOGGER.debug("Timing out receiving WiFi info")
-        return None
+    Returns the first credentials received on any interface.
+    """
+    receiver_factory = receiver_factory or receiver.Receiver
+    plans = scheduler.split(len(interfaces))
+    tasks = [asyncio.ensure_future(sweep_channels(i, plan, receiver_factory))
+             for i, plan in zip(interfaces, plans)]
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            wifi_info = await task
+            if wifi_info is not None:
+                sweeps.inc(result='received')
+                return wifi_info
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    sweeps.inc(result='nothing')
+    scheduler.record_failed_sweep()
+    return None
+
+
+async def sweep_channels(interface, channel_list, receiver_factory):
+    # One receiver listens for the whole sweep, so frames picked up on
+    # earlier channels still count towards the credentials
+    async with MonitorMode(interface) as monitor, \
+            receiver_factory(interface) as listener:
+        for channel in channel_list:
+            _LOGGER.debug("Setting channel of %s to %s", interface, channel)
+            await monitor.set_channel(channel)
+
+            wifi_info = await listener.get(scheduler.dwell(channel))
+            if wifi_info is not None:
+                scheduler.record_traffic(channel)
+                return wifi_info
+
+    return None
 
 
 class MonitorMode():
@@ -123,38 +320,13 @@ class MonitorMode():
         self.interface = interface
 
     async def set_channel(self, channel):
-        cmd = asyncio.create_subprocess_exec(
-            'iwconfig', self.interface, 'channel', str(channel),
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE)
-        proc = await cmd
-        stdout_data, stderr_data = await proc.communicate()
-
-        _LOGGER.debug("stdout: %s", stdout_data)
-        _LOGGER.debug("stderr: %s", stderr_data)
+        await radio.set_channel(self.interface, channel)
 
     async def __aenter__(self):
         _LOGGER.debug("Entering monitor mode")
-        cmd = asyncio.create_subprocess_exec(
-            'iwconfig', self.interface, 'mode', 'monitor',
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE)
-        proc = await cmd
-        stdout_data, stderr_data = await proc.communicate()
-
-        _LOGGER.debug("stdout: %s", stdout_data)
-        _LOGGER.debug("stderr: %s", stderr_data)
-
+        await radio.set_mode(self.interface, 'monitor')
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
         _LOGGER.debug("Exiting monitor mode")
-        cmd = asyncio.create_subprocess_exec(
-            'iwconfig', self.interface, 'mode', 'Managed',
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE)
-        proc = await cmd
-        stdout_data, stderr_data = await proc.communicate()
-
-        _LOGGER.debug("stdout: %s", stdout_data)
-        _LOGGER.debug("stderr: %s", stderr_data)
+        await radio.set_mode(self.interface, 'managed')
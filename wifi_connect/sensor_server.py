@@ -1,10 +1,15 @@
 import asyncio
 import logging
+import time
 
 from aiohttp import web
 import socketio
 
-import utils
+import assets
+import logs
+import metrics
+import publisher
+import reconfigure
 import wifi
 
 
@@ -13,77 +18,93 @@ _LOGGER = logging.getLogger(__name__)
 sio = socketio.AsyncServer()
 app = web.Application()
 sio.attach(app)
+updates = publisher.Publisher(sio)
 
 
 async def index(request):
     """Serve the client-side application."""
-    with open('static/sensor-index.html') as f:
-        return web.Response(text=f.read(), content_type='text/html')
+    return await assets.store.respond(request, 'sensor-index.html')
 
 
-@sio.on('wifi-status')
+def publish_update(message):
+    """Show progress of a network change on every open page."""
+    updates.update(None, 'wifi-update', message=message)
+
+
+@updates.on('wifi-status')
 async def handle_wifi_status(sid):
     try:
         message = await wifi.is_connected(app.interface)
-        await sio.emit('wifi-status', {'message': message})
+        updates.update(None, 'wifi-status', message=message)
+        if sid is not None:
+            await updates.snapshot(sid)
     except Exception:
         _LOGGER.exception("Exception occurred while getting WiFi status")
-        await sio.emit('wifi-get', {'message': 'Error occurred'})
+        await updates.send('wifi-get', {'message': 'Error occurred'},
+                           room=sid)
 
 
-@sio.on('wifi-get')
+@updates.on('wifi-get')
 async def handle_wifi_get(sid):
     try:
         ssid = await wifi.get_ssid(app.interface)
 
         if ssid is None:
-            await sio.emit('wifi-get', {'ssid': ''})
+            await updates.send('wifi-get', {'ssid': ''}, room=sid)
         else:
-            await sio.emit('wifi-get', {'ssid': ssid})
+            await updates.send('wifi-get', {'ssid': ssid}, room=sid)
     except Exception:
         _LOGGER.exception("Exception occurred while getting SSID")
-        await sio.emit('wifi-get', {'ssid': ''})
+        await updates.send('wifi-get', {'ssid': ''}, room=sid)
 
 
-@sio.on('wifi-scan')
-async def handle_wifi_scan(sid):
+@updates.on('wifi-scan')
+async def handle_wifi_scan(sid, data=None):
+    force = bool(data and data.get('force'))
+
     try:
-        networks = await wifi.scan(app.interface)
-        networks = ((n.ssid, n.encryption) for n in networks)
-        networks = sorted(networks, key=lambda x: x[0].lower())
-        await sio.emit('wifi-scan', networks)
+        networks = []
+        async for network in wifi.iter_scan(app.interface, force):
+            networks.append((network.ssid, network.encryption))
+        networks.sort(key=lambda x: x[0].lower())
+        await updates.send('wifi-scan', networks, room=sid)
     except Exception:
         _LOGGER.exception("Exception occurred while scanning")
-        await sio.emit('wifi-scan', [('Error occurred while scanning.', '')])
+        await updates.send('wifi-scan',
+                           [('Error occurred while scanning.', '')],
+                           room=sid)
 
 
-@sio.on('wifi-update')
+@updates.on('wifi-update')
 async def handle_wifi_update(sid, data):
     if 'ssid' not in data or len(data['ssid']) == 0:
-        await sio.emit('wifi-update',
-                       {'message': 'Network name must be provided'})
+        await updates.send('wifi-update',
+                           {'message': 'Network name must be provided'},
+                           room=sid)
         return
 
     if 'password' not in data or len(data['password']) == 0:
-        await sio.emit('wifi-update', {'message': 'Password must be provided'})
+        await updates.send('wifi-update',
+                           {'message': 'Password must be provided'},
+                           room=sid)
         return
 
     ssid = data['ssid']
     password = data['password']
 
     try:
-        await sio.emit('wifi-update', {'message': 'Looking for network...'})
-        networks = await wifi.scan(app.interface)
-        networks = [n for n in networks if n.ssid == ssid]
+        publish_update('Looking for network...')
+        networks = []
+        async for network in wifi.iter_scan(app.interface):
+            if network.ssid == ssid:
+                networks.append(network)
         await asyncio.sleep(.5)
         if len(networks) == 0:
-            await sio.emit('wifi-update',
-                           {'message': 'No network named {}'.format(ssid)})
+            publish_update('No network named {}'.format(ssid))
             return
     except Exception:
         _LOGGER.exception("Exception occurred while scanning")
-        await sio.emit('wifi-update',
-                       {'message': 'Error occurred while scanning.'})
+        publish_update('Error occurred while scanning.')
         return
 
     # Filter out networks that have incompatible security
@@ -91,58 +112,67 @@ async def handle_wifi_update(sid, data):
                 if n.encryption and n.encryption.startswith('wpa')]
     if len(networks) == 0:
         _LOGGER.warning("No networks that have correct encryption")
-        await sio.emit('wifi-update',
-                       {'message': 'Select network with WPA or WPA2'
-                                   'security'})
+        publish_update('Select network with WPA or WPA2 security')
         return
 
     try:
-        await sio.emit('wifi-update',
-                       {'message': 'Saving network name and password...'})
+        publish_update('Saving network name and password...')
         await wifi.replace(app.interface, networks[0], password)
+        saved_at = time.monotonic()
         await asyncio.sleep(.5)
     except NotImplementedError:
         _LOGGER.exception("Unknown security protocol was used")
-        await sio.emit('wifi-update',
-                       {'message': 'Only select WPA or WPA2 security'})
+        publish_update('Only select WPA or WPA2 security')
         return
     except Exception:
         _LOGGER.exception(
             "Exception occurred while setting new ssid and password")
-        await sio.emit('wifi-update',
-                       {'message': 'Error occurred while setting new SSID and'
-                                   ' password.'})
+        publish_update('Error occurred while setting new SSID and '
+                       'password.')
         return
 
-    await sio.emit('wifi-status', {'message': 'Not Connected'})
-    await sio.emit('wifi-update', {'message': 'Connecting...'})
+    updates.update(None, 'wifi-status', message='Not Connected')
+    publish_update('Connecting...')
     await asyncio.sleep(.5)
 
     try:
         ip_address = await wifi.connect(app.interface)
 
         if not ip_address:
-            await sio.emit('wifi-update',
-                           {'message': 'Not connected! Make sure to check the'
-                                       ' password.'})
+            publish_update('Not connected! Make sure to check the '
+                           'password.')
         else:
-            await sio.emit('wifi-update', {'message': 'Connected!'})
+            publish_update('Connected!')
     except Exception:
         _LOGGER.exception("Exception occurred while connecting")
-        await sio.emit('wifi-update',
-                       {'message': 'Error occurred while connecting.'})
+        publish_update('Error occurred while connecting.')
         await handle_wifi_status(None)
         return
 
     await handle_wifi_status(None)
 
-    result = await utils.restart_sensor_service()
+    # Pending updates would be lost if the service is restarted
+    await updates.flush()
+    # A failed connect is not timed as a change to the new network
+    result = await reconfigure.network_changed(
+        app.interface, ssid, saved_at=saved_at if ip_address else None)
     if not result:
-        await sio.emit('wifi-update',
-                       {'message': 'Connected! An error occurred while '
-                                   'restarting sensor service. Please restart'
-                                   ' device.'})
+        publish_update('Connected! An error occurred while applying the '
+                       'new network. Please restart device.')
+
+
+async def network_changed(interface, ssid):
+    if interface == app.interface:
+        message = await wifi.is_connected(interface)
+        updates.update(None, 'wifi-status', message=message)
+        updates.update(None, 'wifi-get', ssid=ssid)
+
+
+reconfigure.add_listener(network_changed)
 
 
-app.router.add_static('/static', 'static')
+app.router.add_get('/static/{name}', assets.store.handle)
 app.router.add_get('/', index)
+app.router.add_get('/metrics', metrics.handle)
+app.router.add_get('/log-levels', logs.handle_levels)
+app.router.add_post('/log-levels', logs.handle_levels)
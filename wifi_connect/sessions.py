@@ -0,0 +1,197 @@
+import asyncio
+from collections import OrderedDict
+import logging
+import time
+import uuid
+
+import fec
+import settings
+
+_LOGGER = logging.getLogger(__name__)
+BROADCAST_WAIT_TIME = settings.get('BROADCAST_WAIT_TIME', 2)
+
+
+class BroadcastSession():
+    """One set of credentials being broadcast to a group of sensors.
+
+    With hostnames, only those sensors count towards expected_sensors,
+    which defaults to all of them.
+    """
+
+    def __init__(self, ssid, password, expected_sensors=None, owner=None,
+                 loss=None, hostnames=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.ssid = ssid
+        self.password = password
+        self.hostnames = None if hostnames is None else frozenset(hostnames)
+        if expected_sensors is None:
+            expected_sensors = len(self.hostnames)
+        self.expected_sensors = expected_sensors
+        self.owner = owner
+        self.room = 'session-{}'.format(self.id)
+        self.found_sensors = set()
+        self.send_flag = 0
+        self.loss = loss or fec.AdaptiveLoss()
+        self.running = True
+        self.rounds = 0
+        self.airtime = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def expects(self, sensor):
+        return self.hostnames is None or sensor in self.hostnames
+
+    def add_sensor(self, sensor):
+        if sensor in self.found_sensors or not self.expects(sensor):
+            return False
+
+        self.found_sensors.add(sensor)
+
+        if len(self.found_sensors) >= self.expected_sensors:
+            _LOGGER.debug("Session %s discovered all sensors", self.id)
+            self.stop()
+
+        return True
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.finished = time.monotonic()
+
+    def stats(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {'id': self.id,
+                'ssid': self.ssid,
+                'running': self.running,
+                'expected_sensors': self.expected_sensors,
+                'found_sensors': len(self.found_sensors),
+                'rounds': self.rounds,
+                'possible_loss': self.loss.possible_loss,
+                'airtime': self.airtime,
+                'elapsed': elapsed,
+                'sensors_per_minute':
+                    60 * len(self.found_sensors) / elapsed if elapsed else 0}
+
+
+class SessionScheduler():
+    """Share the radio between sessions, one round per session in turn."""
+
+    def __init__(self, sink, on_finished=None, wait_time=BROADCAST_WAIT_TIME):
+        self.sink = sink
+        self.on_finished = on_finished
+        self.wait_time = wait_time
+        self.sessions = OrderedDict()
+        self.busy_time = 0
+        self.started = None
+        self._task = None
+        self._current = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def active(self):
+        return any(s.running for s in self.sessions.values())
+
+    def add(self, session):
+        self.sessions[session.id] = session
+        self._wakeup.set()
+
+        if self._task is None or self._task.done():
+            self.started = time.monotonic()
+            self.busy_time = 0
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self, session):
+        session.stop()
+        self._wakeup.set()
+
+        if self._current is not None and self._current[0] is session:
+            self._current[1].cancel()
+
+    def add_sensor(self, session, sensor):
+        added = session.add_sensor(sensor)
+        if not session.running:
+            self.stop(session)
+
+        return added
+
+    def route(self, ssid=None, session_id=None):
+        """Find the running session a sensor ping belongs to."""
+        running = [s for s in self.sessions.values() if s.running]
+
+        if session_id is not None:
+            running = [s for s in running if s.id == session_id]
+        elif ssid is not None:
+            running = [s for s in running if s.ssid == ssid]
+
+        return running[0] if len(running) == 1 else None
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {'radio_utilization':
+                    self.busy_time / elapsed if elapsed else 0,
+                'sessions': [s.stats() for s in self.sessions.values()]}
+
+    async def _run(self):
+        # add() does not start a task for sessions added while the sink is
+        # closing, so look for them again once it is closed
+        while self.sessions:
+            await self._run_sessions()
+            await self.sink.close()
+
+    async def _run_sessions(self):
+        while self.sessions:
+            self._wakeup.clear()
+            for session in list(self.sessions.values()):
+                if session.running:
+                    await self._send_round(session)
+
+                if not session.running:
+                    del self.sessions[session.id]
+                    await self._finished(session)
+
+            if self.sessions:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.wait_time)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _send_round(self, session):
+        start = time.monotonic()
+        task = asyncio.ensure_future(
+            self.sink.send(session.ssid, session.password, session.send_flag,
+                           session.loss.possible_loss))
+        self._current = (session, task)
+        await asyncio.wait([task])
+        self._current = None
+
+        duration = time.monotonic() - start
+        self.busy_time += duration
+        session.airtime += duration
+
+        if task.cancelled():
+            _LOGGER.debug("Session %s stopped in the middle of a round",
+                          session.id)
+            return
+
+        if task.exception() is not None:
+            _LOGGER.warning("Round for session %s failed: %s", session.id,
+                            task.exception())
+            return
+
+        session.rounds += 1
+        # Switch between 0 and 1
+        session.send_flag = 1 - session.send_flag
+
+        # Both halves (send flags) go out at the same level
+        if session.send_flag == 0:
+            session.loss.round_finished(len(session.found_sensors),
+                                        session.expected_sensors)
+
+    async def _finished(self, session):
+        if self.on_finished is None:
+            return
+
+        try:
+            await self.on_finished(session)
+        except Exception:
+            _LOGGER.exception("Error finishing session %s", session.id)
@@ -0,0 +1,36 @@
+"""Timing constants and tool paths that can be changed without editing code.
+
+Modules read their settings with get() when they are imported, so the
+file has to be loaded before that. __main__ loads the file given with
+--settings, otherwise the one named by $WIFI_CONNECT_SETTINGS is used.
+The file is a JSON object keyed by constant name, for example:
+
+    {"RECEIVE_WAIT_TIME": 2, "IWLIST": "/opt/fake-radio/iwlist"}
+"""
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+SETTINGS_ENV = 'WIFI_CONNECT_SETTINGS'
+
+_settings = None
+
+
+def load(filename=None):
+    global _settings
+
+    filename = filename or os.environ.get(SETTINGS_ENV)
+    _settings = {}
+    if filename:
+        with open(filename) as f:
+            _settings = json.load(f)
+        _LOGGER.info("Loaded settings from %s: %s", filename,
+                     sorted(_settings))
+
+
+def get(name, default):
+    if _settings is None:
+        load()
+
+    return _settings.get(name, default)
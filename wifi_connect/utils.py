@@ -1,20 +1,17 @@
-import asyncio
 import logging
 
+import runner
+import settings
+
 _LOGGER = logging.getLogger(__name__)
+RESTART_TIMEOUT = settings.get('RESTART_TIMEOUT', 60)
+SYSTEMCTL = settings.get('SYSTEMCTL', 'systemctl')
 
 
 async def restart_sensor_service():
     try:
-        cmd = asyncio.create_subprocess_exec('systemctl',
-                                             'restart',
-                                             'sensor.service',
-                                             stdout=asyncio.subprocess.PIPE,
-                                             stderr=asyncio.subprocess.PIPE)
-        proc = await cmd
-        stdout_data, stderr_data = await proc.communicate()
-        _LOGGER.debug("stdout: %s", stdout_data)
-        _LOGGER.debug("stderr: %s", stderr_data)
+        await runner.run(SYSTEMCTL, 'restart', 'sensor.service',
+                         timeout=RESTART_TIMEOUT)
         return True
     except Exception as e:
         _LOGGER.exception("Failed to restart service: %s", e)
@@ -1,42 +1,73 @@
 import asyncio
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import hashlib
 import logging
 import os
 import re
+import time
 
-import aiofiles
-from pbkdf2 import PBKDF2
+import backends
+import credentials
+import interfaces
+import linkstate
+import metrics
+import runner
+import settings
+
+try:
+    from pbkdf2 import PBKDF2
+except ImportError:
+    PBKDF2 = None
 
 
 _LOGGER = logging.getLogger(__name__)
-Network = namedtuple('Network', ['ssid', 'encryption'])
+Network = namedtuple('Network', ['ssid', 'encryption', 'bssid', 'channel',
+                                 'frequency', 'signal', 'ies', 'group_cipher',
+                                 'pairwise_ciphers', 'authentication_suites'])
+Network.__new__.__defaults__ = (None,) * 6 + ((), ())
+
+scan_line_re = re.compile(
+    r'^\s*(?:'
+    r'Cell \d+ - Address: (?P<bssid>\S+)'
+    r'|Channel:(?P<channel>\d+)'
+    r'|Frequency:(?P<frequency>[\d.]+) GHz'
+    r'(?: \(Channel (?P<freq_channel>\d+)\))?'
+    r'|Quality.*Signal level[=:](?P<signal>-?\d+)'
+    r'|Encryption key:(?P<key>on|off)'
+    r'|ESSID:"(?P<ssid>.*)"\s*$'
+    r'|IE: (?P<ie>.*?)\s*$'
+    r'|Group Cipher : (?P<group_cipher>.*?)\s*$'
+    r'|Pairwise Ciphers \(\d+\) : (?P<pairwise_ciphers>.*?)\s*$'
+    r'|Authentication Suites \(\d+\) : (?P<authentication_suites>.*?)\s*$'
+    r')')
+
+ADDRESS_WAIT_TIME = settings.get('ADDRESS_WAIT_TIME', 10)
+backend_name = None
+
+SCAN_CACHE_TIME = settings.get('SCAN_CACHE_TIME', 10)
+SCAN_TIMEOUT = settings.get('SCAN_TIMEOUT', 30)
+IWLIST = settings.get('IWLIST', 'iwlist')
+scan_requests = metrics.counter('wifi_connect_scan_requests_total',
+                                'Scan requests by how they were served',
+                                ['result'])
+_scans = {}
+
+connect_time = metrics.histogram('wifi_connect_connect_seconds',
+                                 'Time taken to connect to a network',
+                                 ['backend', 'result'])
+
+PSK_CACHE_SIZE = 16
+_psk_cache = OrderedDict()
 
-networks_re = re.compile(r'Cell \d+ - ')
-ssid_scan_re = re.compile("ESSID:\"(.*?)\"", re.M)
-ssid_interface_re = re.compile("\\s+wpa-ssid\\s+\"(.*?)\"", re.M)
-bound_ip_re = re.compile(r'^bound to (?P<ip_address>\S+)', flags=re.MULTILINE)
 
-interface_file = '/etc/network/interfaces'
+async def get_ip_address(interface):
+    ip_address = linkstate.monitor.address(interface)
+    _LOGGER.debug("IP address of %s: %s", interface, ip_address)
+    return ip_address
 
 
-async def get_ip_address(interface):
-    _LOGGER.debug("Getting IP address")
-    cmd = asyncio.create_subprocess_exec('ip', 'addr', 'show', interface,
-                                         stdout=asyncio.subprocess.PIPE,
-                                         stderr=asyncio.subprocess.PIPE)
-    proc = await cmd
-    stdout_data, stderr_data = await proc.communicate()
-    _LOGGER.debug("stdout: %s", stdout_data)
-    _LOGGER.debug("stderr: %s", stderr_data)
-    stdout_data = stdout_data.decode()
-
-    if 'inet ' not in stdout_data:
-        _LOGGER.debug("No IP address")
-        return None
-    else:
-        ip_address = stdout_data.split('inet ')[1].split("/")[0]
-        _LOGGER.debug("Found IP address: %s", ip_address)
-        return ip_address
+async def wait_for_ip_address(interface, timeout=ADDRESS_WAIT_TIME):
+    return await linkstate.monitor.wait_for_address(interface, timeout)
 
 
 async def is_connected(interface):
@@ -52,43 +83,71 @@ async def is_connected(interface):
 
 
 async def get_ssid(interface):
-    _LOGGER.debug("Getting SSID")
-    filename = '{}.d/{}.cfg'.format(interface_file, interface)
+    ssid = interfaces.store.ssid(interface)
+    _LOGGER.debug("SSID for %s: %s", interface, ssid)
+    return ssid
 
-    if not os.path.isfile(filename):
-        _LOGGER.debug("Interface file for %s does not exist", interface)
-        return None
 
-    async with aiofiles.open(filename) as f:
-        text = await f.read()
-        match = ssid_interface_re.search(text)
+class ScanParser():
+    """Incremental parser for `iwlist <interface> scan` output.
 
-        if match:
-            _LOGGER.debug("Found SSID for interface: %s", match.group(1))
-            return match.group(1)
-        else:
-            _LOGGER.debug("Could not find SSD for interface")
+    Lines are fed one at a time and a Network is returned as soon as the
+    cell it belongs to is complete.
+    """
+
+    def __init__(self):
+        self._cell = None
+
+    def feed(self, line):
+        match = scan_line_re.match(line)
+        if match is None:
+            return None
+
+        group = match.lastgroup
+        value = match.group(group)
+
+        if group == 'bssid':
+            network = self.close()
+            self._cell = {'bssid': value, 'ies': [], 'pairwise_ciphers': [],
+                          'authentication_suites': []}
+            return network
+
+        cell = self._cell
+        if cell is None:
             return None
 
+        if group == 'channel':
+            cell['channel'] = int(value)
+        elif group in ('frequency', 'freq_channel'):
+            cell['frequency'] = float(match.group('frequency'))
+            if match.group('freq_channel') is not None:
+                cell.setdefault('channel', int(match.group('freq_channel')))
+        elif group == 'signal':
+            cell['signal'] = int(value)
+        elif group == 'key':
+            cell['key'] = value == 'on'
+        elif group == 'ssid':
+            cell['ssid'] = value
+        elif group == 'ie':
+            cell['ies'].append(value)
+        elif group == 'group_cipher':
+            cell.setdefault('group_cipher', value)
+        else:
+            for item in value.split():
+                if item not in cell[group]:
+                    cell[group].append(item)
 
-async def scan(interface):
-    _LOGGER.debug("Scanning for wireless networks")
-    cmd = asyncio.create_subprocess_exec('iwlist', interface, 'scan',
-                                         stdout=asyncio.subprocess.PIPE,
-                                         stderr=asyncio.subprocess.PIPE)
-    proc = await cmd
-    stdout_data, stderr_data = await proc.communicate()
-    _LOGGER.debug("stdout: %s", stdout_data)
-    _LOGGER.debug("stderr: %s", stderr_data)
-    networks = stdout_data.decode()
+        return None
 
-    def create_network(network):
-        ssid = ssid_scan_re.search(network).group(1)
+    def close(self):
+        cell, self._cell = self._cell, None
+        if cell is None or 'ssid' not in cell:
+            return None
 
-        if 'Encryption key:on' in network:
-            if 'WPA2' in network:
+        if cell.get('key'):
+            if any('WPA2' in ie for ie in cell['ies']):
                 encryption = 'wpa2'
-            elif 'WPA' in network:
+            elif any('WPA' in ie for ie in cell['ies']):
                 encryption = 'wpa'
             else:
                 # Encryption is on but not specified
@@ -96,9 +155,201 @@ async def scan(interface):
         else:
             encryption = None
 
-        return Network(ssid, encryption)
+        return Network(cell['ssid'], encryption,
+                       bssid=cell['bssid'],
+                       channel=cell.get('channel'),
+                       frequency=cell.get('frequency'),
+                       signal=cell.get('signal'),
+                       ies=tuple(cell['ies']),
+                       group_cipher=cell.get('group_cipher'),
+                       pairwise_ciphers=tuple(cell['pairwise_ciphers']),
+                       authentication_suites=tuple(
+                           cell['authentication_suites']))
+
+
+class ScanIterator():
+    """Scan for wireless networks, yielding each one as iwlist reports it."""
+
+    def __init__(self, interface):
+        self.interface = interface
+        self._scan = None
+        self._proc = None
+        self._parser = ScanParser()
+        self.returncode = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._scan is None:
+            _LOGGER.debug("Scanning for wireless networks")
+            self._scan = runner.spawn(IWLIST, self.interface, 'scan',
+                                      timeout=SCAN_TIMEOUT,
+                                      interface=self.interface)
+            self._proc = await self._scan.start()
+
+        if self._proc is not None:
+            while True:
+                line = await self._proc.stdout.readline()
+                if not line:
+                    break
+
+                network = self._parser.feed(line.decode(errors='replace'))
+                if network is not None:
+                    return network
+
+            stderr_data = await self._proc.stderr.read()
+            _LOGGER.debug("stderr: %s", stderr_data)
+            await self._proc.wait()
+            self.returncode = self._proc.returncode
+            if self._scan.timed_out:
+                self.returncode = None
+            self._proc = None
+            await self._scan.close()
+
+        network = self._parser.close()
+        if network is not None:
+            return network
+
+        raise StopAsyncIteration
+
+    async def close(self):
+        if self._scan is not None:
+            self._proc = None
+            await self._scan.close()
+
+
+class ScanJob():
+    """One scan shared by every caller that asks while it is running."""
+
+    def __init__(self, interface):
+        self.networks = []
+        self.done = False
+        self.ok = False
+        self.error = None
+        self.finished = None
+        self._updated = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run(interface))
+
+    async def _run(self, interface):
+        scanner = ScanIterator(interface)
+        try:
+            async for network in scanner:
+                self.networks.append(network)
+                self._notify()
+            self.ok = scanner.returncode == 0
+        except Exception as e:
+            _LOGGER.exception("Scan failed")
+            self.error = e
+        finally:
+            await scanner.close()
+            self.done = True
+            self.finished = time.monotonic()
+            self._notify()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def fresh(self):
+        return (self.done and self.ok and
+                time.monotonic() - self.finished < SCAN_CACHE_TIME)
+
+    async def wait(self, count):
+        """Wait until more than count networks are in or the scan is done."""
+        while len(self.networks) <= count and not self.done:
+            await self._updated.wait()
+
+
+class ScanReader():
+    def __init__(self, job):
+        self._job = job
+        self._index = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self._job.wait(self._index)
+
+        if self._index < len(self._job.networks):
+            self._index += 1
+            return self._job.networks[self._index - 1]
+
+        if self._job.error is not None:
+            raise self._job.error
+
+        raise StopAsyncIteration
+
+
+def iter_scan(interface, force=False):
+    """Yield networks seen by interface.
+
+    A scan that is already running is shared, and a recent successful scan
+    is served from the cache unless force is set.
+    """
+    job = _scans.get(interface)
+
+    if job is not None and not job.done:
+        _LOGGER.debug("Joining scan in progress")
+        scan_requests.inc(result='coalesced')
+    elif job is not None and not force and job.fresh():
+        _LOGGER.debug("Using cached scan")
+        scan_requests.inc(result='cached')
+    else:
+        scan_requests.inc(result='scanned')
+        job = ScanJob(interface)
+        _scans[interface] = job
+
+    return ScanReader(job)
+
+
+def last_seen(interface, ssid):
+    """Strongest network called ssid in the last scan, however old."""
+    job = _scans.get(interface)
+    if job is None:
+        return None
+
+    matches = [n for n in job.networks if n.ssid == ssid]
+    return max(matches, key=lambda n: n.signal or -100, default=None)
+
+
+async def scan(interface, force=False):
+    networks = []
+    async for network in iter_scan(interface, force):
+        networks.append(network)
+
+    return networks
+
+
+def _derive_psk(ssid, passphrase):
+    if hasattr(hashlib, 'pbkdf2_hmac'):
+        return hashlib.pbkdf2_hmac('sha1', passphrase.encode(),
+                                   ssid.encode(), 4096, 32).hex()
+
+    return PBKDF2(passphrase, ssid, 4096).hexread(32)
+
+
+async def derive_psk(ssid, passphrase):
+    """Derive the WPA PSK without blocking the event loop.
 
-    return (create_network(n) for n in networks_re.split(networks)[1:])
+    Recent results are cached, keyed by a hash of the SSID and passphrase
+    so the passphrase itself is not kept around as a key.
+    """
+    key = hashlib.sha256('{}\0{}'.format(ssid, passphrase).encode()).digest()
+
+    if key in _psk_cache:
+        _psk_cache.move_to_end(key)
+        return _psk_cache[key]
+
+    loop = asyncio.get_event_loop()
+    psk = await loop.run_in_executor(None, _derive_psk, ssid, passphrase)
+
+    _psk_cache[key] = psk
+    if len(_psk_cache) > PSK_CACHE_SIZE:
+        _psk_cache.popitem(last=False)
+
+    return psk
 
 
 async def replace(interface, network, passkey):
@@ -108,7 +359,7 @@ async def replace(interface, network, passkey):
 
     if network.encryption.startswith('wpa'):
         if len(passkey) != 64:
-            passkey = PBKDF2(passkey, network.ssid, 4096).hexread(32)
+            passkey = await derive_psk(network.ssid, passkey)
 
         lines.append('    wpa-ssid "{}"'.format(network.ssid))
         lines.append('    wpa-psk  "{}"'.format(passkey))
@@ -123,76 +374,44 @@ async def replace(interface, network, passkey):
     else:
         raise NotImplementedError
 
-    filename = '{}.d/{}.cfg'.format(interface_file, interface)
-    async with aiofiles.open(filename, 'w') as f:
-        await f.write('\n'.join(lines))
+    await interfaces.store.write(interface, lines)
+    await credentials.store.add(network.ssid, network.encryption, passkey)
 
 
 async def connect(interface):
-    _LOGGER.debug("Connecting")
-
-    _LOGGER.debug("Calling ifdown")
-    cmd = asyncio.create_subprocess_exec('ifdown', interface,
-                                         stdout=asyncio.subprocess.PIPE,
-                                         stderr=asyncio.subprocess.PIPE)
-    proc = await cmd
-    stdout_data, stderr_data = await proc.communicate()
-    _LOGGER.debug("stdout: %s", stdout_data)
-    _LOGGER.debug("stderr: %s", stderr_data)
-
-    _LOGGER.debug("Calling ifup")
-    cmd = asyncio.create_subprocess_exec('ifup', interface,
-                                         stdout=asyncio.subprocess.PIPE,
-                                         stderr=asyncio.subprocess.PIPE)
-    proc = await cmd
-    stdout_data, stderr_data = await proc.communicate()
-    _LOGGER.debug("stdout: %s", stdout_data)
-    _LOGGER.debug("stderr: %s", stderr_data)
-    output = stderr_data.decode()
-    matches = bound_ip_re.search(output)
-    if matches:
-        _LOGGER.debug("Connected: %s", matches.group('ip_address'))
-        return matches.group('ip_address')
+    backend = backends.get_backend(interface, backend_name)
+    _LOGGER.debug("Connecting with %s", backend.name)
+
+    start = time.monotonic()
+    ip_address = await backend.connect(interface)
+    if ip_address is not None:
+        _LOGGER.debug("Connected: %s", ip_address)
     else:
         _LOGGER.debug("Not connected")
-        return None
 
+    connect_time.observe(time.monotonic() - start, backend=backend.name,
+                         result='connected' if ip_address else 'failed')
 
-async def interface_configured(interface):
-    folder = '{}.d'.format(interface_file)
-    file = os.path.join(folder, '{}.cfg'.format(interface))
-    if not os.path.exists(file):
-        return False
+    return ip_address
 
-    async with aiofiles.open(file) as f:
-        text = await f.read()
-        if 'ssid' in text and 'psk' in text:
-            return True
 
-    return False
+async def interface_configured(interface):
+    return interfaces.store.configured(interface)
 
 
 async def update_interfaces():
+    store = interfaces.store
+
     # Create the folder if necessary
-    folder = '{}.d'.format(interface_file)
-    if not os.path.exists(folder):
-        _LOGGER.debug("%s does not exist. Creating it...")
-        os.makedirs(folder)
+    if not os.path.exists(store.folder):
+        _LOGGER.debug("%s does not exist. Creating it...", store.folder)
+        os.makedirs(store.folder)
 
     # Make sure the folder is included in the configuration
-    config_line = 'source {}.d/*.cfg'.format(interface_file)
-
-    if os.path.exists(interface_file):
-        async with aiofiles.open(interface_file, 'r') as f:
-            lines = await f.readlines()
-            for line in lines:
-                if line.strip().startswith('#'):
-                    continue
-
-                if config_line in line:
-                    _LOGGER.debug("Found line in interface file")
-                    return
-
-    async with aiofiles.open(interface_file, 'a+') as f:
-        await f.write('\n{}\n'.format(config_line))
-        _LOGGER.debug("Adding line to interface file")
+    pattern = '{}/*.cfg'.format(store.folder)
+    if store.has_source(pattern):
+        _LOGGER.debug("Found line in interface file")
+        return
+
+    await store.add_source(pattern)
+    _LOGGER.debug("Adding line to interface file")